@@ -661,6 +661,127 @@ class ComposableField(Field):
         return None if val is None else val.dump()
 
 
+def _resolve(cls, name):
+    # the object found for name on the first class in the mro that defines it
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+    return None
+
+
+def _trusted_init(self, kwargs):
+    # used by Entity subclasses that have not opted in to a compiled __init__
+    overrides = getattr(self, KEY_OVERRIDES_MAP)
+    for key, field in iteritems(self.__fields__):
+        try:
+            val = kwargs[key]
+        except KeyError:
+            if key in overrides:
+                setattr(self, key, overrides[key])
+            continue
+        if val is not None:
+            self.__dict__[key] = field.box(self, val)
+        elif field.nullable:
+            self.__dict__[key] = None
+
+
+def _compile_init(cls):
+    """Generate the body of Entity.__init__ unrolled over the fields of cls.
+
+    The generated function has the same semantics as the generic loop in Entity.__init__,
+    but looks up fields, overrides and required-ness once at class creation time, writes
+    straight into the instance __dict__ where no __set__ or __setattr__ hook would observe
+    the difference, and inlines Field.validate where a field doesn't override it.  A second
+    branch handles trusted=True, which boxes values but skips all validation.
+    """
+    overrides = getattr(cls, KEY_OVERRIDES_MAP)
+    direct_set = _resolve(cls, '__setattr__') in (object.__dict__['__setattr__'],
+                                                 ImmutableEntity.__dict__['__setattr__'])
+    namespace = {
+        'ValidationError': ValidationError,
+        'overrides': overrides,
+    }
+    checked, trusted = [], []
+    for i, (key, field) in enumerate(iteritems(cls.__fields__)):
+        f, box, validate = 'f%d' % i, 'f%d_box' % i, 'f%d_validate' % i
+        namespace[f] = field
+        namespace[box] = field.box
+        namespace[validate] = field.validate
+        field_type = type(field)
+        is_direct = (direct_set and _resolve(cls, key) is field
+                     and field_type.__set__ is Field.__set__)
+        boxed = "raw" if field_type.box is Field.box else "%s(self, raw)" % box
+
+        if not is_direct:
+            assign = ["setattr(self, %r, raw)" % key]
+        elif field_type.validate is Field.validate and hasattr(field, '_type'):
+            namespace[f + '_type'] = field._type
+            test = "isinstance(val, %s_type)" % f
+            if field._validation is not None:
+                namespace[f + '_validation'] = field._validation
+                test += " and %s_validation(val)" % f
+            assign = ["val = %s" % boxed,
+                      "if %s:" % test,
+                      "    d[%r] = val" % key]
+            if field.nullable:
+                assign += ["elif val is None:",
+                           "    d[%r] = None" % key]
+            assign += ["else:",
+                       "    raise ValidationError(%r, val)" % key]
+        else:
+            assign = ["d[%r] = %s(self, %s)" % (key, validate, boxed)]
+
+        checked += ["if %r in kwargs:" % key,
+                    "    raw = kwargs[%r]" % key]
+        if field.required:
+            checked += ["    " + line for line in assign]
+        else:
+            # a None value for an optional field is dropped if it doesn't validate
+            checked += ["    if raw is None:",
+                        "        try:",
+                        "            " + (assign[0] if not is_direct else
+                                          "d[%r] = %s(self, %s)" % (key, validate, boxed)),
+                        "        except ValidationError:",
+                        "            pass",
+                        "    else:"]
+            checked += ["        " + line for line in assign]
+        trusted += ["if %r in kwargs:" % key,
+                    "    raw = kwargs[%r]" % key]
+        if is_direct:
+            trusted += ["    if raw is not None:",
+                        "        d[%r] = %s" % (key, boxed)]
+            if field.nullable:
+                trusted += ["    else:",
+                            "        d[%r] = None" % key]
+        else:
+            trusted += ["    setattr(self, %r, raw)" % key]
+
+        missing = []
+        if key in overrides:
+            missing = ["setattr(self, %r, overrides[%r])" % (key, key)]
+            trusted += ["else:", "    " + missing[0]]
+        elif field.required and field.default is None:
+            missing = ["raise ValidationError(%r, msg=\"{0} requires a %s field. \""
+                       "\"Instantiated with {1}\".format(self.__class__.__name__, kwargs))"
+                       % (key, key)]
+        if missing:
+            checked += ["else:"] + ["    " + line for line in missing]
+
+    if _resolve(cls, 'validate') is not Entity.__dict__['validate']:
+        checked.append("self.validate()")
+
+    indent = "\n        "
+    source = ("def __compiled_init__(self, kwargs, trusted):\n"
+              "    d = self.__dict__\n"
+              "    if trusted:\n"
+              "        %s\n"
+              "    else:\n"
+              "        %s\n"
+              % (indent.join(trusted or ["pass"]), indent.join(checked or ["pass"])))
+    exec(compile(source, "<%s.__init__>" % cls.__name__, "exec"), namespace)
+    return namespace['__compiled_init__']
+
+
 class EntityType(type):
 
     @staticmethod
@@ -695,12 +816,15 @@ class EntityType(type):
                                       if isinstance(field, Field)),
                                      key=lambda item: item[1]._order_helper))
         cls.__fields__ = frozendict(fields)
+        fast_init = getattr(cls, '__fast_init__', False)
+        cls.__compiled_init__ = _compile_init(cls) if fast_init else None
+        cls.__initd_key__ = '_{0}__initd'.format(name)
         if hasattr(cls, '__register__'):
             cls.__register__()
 
     def __call__(cls, *args, **kwargs):
         instance = super(EntityType, cls).__call__(*args, **kwargs)
-        setattr(instance, '_{0}__initd'.format(cls.__name__), True)
+        setattr(instance, cls.__initd_key__, True)
         return instance
 
     @property
@@ -712,7 +836,25 @@ class EntityType(type):
 class Entity(object):
     __fields__ = odict()
 
-    def __init__(self, **kwargs):
+    # Set to True on a subclass to have a specialized __init__ generated for it (and its own
+    #   subclasses) at class creation time.
+    __fast_init__ = False
+
+    def __init__(self, trusted=False, **kwargs):
+        """
+        Arguments:
+            trusted (bool, optional): the values in kwargs come from a source that has already
+                been validated, e.g. data conda itself wrote to disk.  Values are still boxed,
+                but type checks, validation callables and required-field checks are skipped.
+            **kwargs: field values.
+        """
+        compiled_init = self.__class__.__compiled_init__
+        if compiled_init is not None:
+            compiled_init(self, kwargs, trusted)
+            return
+        if trusted:
+            _trusted_init(self, kwargs)
+            return
         for key, field in iteritems(self.__fields__):
             try:
                 setattr(self, key, kwargs[key])
@@ -817,7 +959,7 @@ class Entity(object):
 
     @property
     def _initd(self):
-        return getattr(self, '_{0}__initd'.format(self.__class__.__name__), None)
+        return getattr(self, self.__initd_key__, None)
 
 
 class ImmutableEntity(Entity):
@@ -14,7 +14,8 @@ from .constants import (APP_NAME, DEFAULT_CHANNELS, DEFAULT_CHANNEL_ALIAS, ROOT_
 from .._vendor.auxlib.decorators import memoizedproperty
 from .._vendor.auxlib.ish import dals
 from .._vendor.auxlib.path import expand
-from ..common.compat import NoneType, iteritems, itervalues, odict, string_types
+from ..common.compat import (NoneType, integer_types, iteritems, itervalues, odict,
+                             string_types)
 from ..common.configuration import (Configuration, LoadError, MapParameter, PrimitiveParameter,
                                     SequenceParameter, ValidationError)
 from ..common.disk import conda_bld_ensure_dir
@@ -69,12 +70,16 @@ class Context(Configuration):
     use_pip = PrimitiveParameter(True)
     concurrent = PrimitiveParameter(False)
     rollback_enabled = PrimitiveParameter(True)
+    link_threads = PrimitiveParameter(1)
+    persist_link_type = PrimitiveParameter(False)
     repodata_timeout_secs = PrimitiveParameter(300)
 
     _root_dir = PrimitiveParameter("", aliases=('root_dir',))
     _envs_dirs = SequenceParameter(string_types, aliases=('envs_dirs', 'envs_path'),
                                    string_delimiter=os.pathsep)
     _pkgs_dirs = SequenceParameter(string_types, aliases=('pkgs_dirs',))
+    pkgs_store_dir = PrimitiveParameter('')
+    pkgs_max_size = PrimitiveParameter('')
 
     # remote connection details
     ssl_verify = PrimitiveParameter(True, parameter_type=string_types + (bool,))
@@ -84,6 +89,12 @@ class Context(Configuration):
     remote_connect_timeout_secs = PrimitiveParameter(9.15)
     remote_read_timeout_secs = PrimitiveParameter(60.)
     remote_max_retries = PrimitiveParameter(3)
+    fetch_threads = PrimitiveParameter(5)
+    fetch_threads_per_host = PrimitiveParameter(0)
+    fetch_host_threads = MapParameter(integer_types)
+    fetch_host_bandwidth = MapParameter(string_types + integer_types)
+    stream_extract = PrimitiveParameter(False)
+    extract_processes = PrimitiveParameter(1)  # 0 for one per cpu
 
     add_anaconda_token = PrimitiveParameter(True, aliases=('add_binstar_token',))
     _channel_alias = PrimitiveParameter(DEFAULT_CHANNEL_ALIAS,
@@ -28,8 +28,9 @@ from ..exceptions import (CondaCorruptEnvironmentError, CondaEnvironmentNotFound
                           PackageNotFoundError, TooManyArgumentsError, UnsatisfiableError)
 from ..misc import append_env, clone_env, explicit, touch_nonadmin
 from ..models.channel import prioritize_channels
-from ..plan import (display_actions, execute_actions, get_pinned_specs,
-                    is_root_prefix, nothing_to_do, revert_actions, install_actions_list)
+from ..plan import (display_actions, display_estimate, estimate_actions, execute_actions,
+                    get_pinned_specs, is_root_prefix, nothing_to_do, revert_actions,
+                    install_actions_list)
 from ..resolve import Resolve
 
 log = logging.getLogger(__name__)
@@ -362,10 +363,14 @@ def install(args, parser, command='install'):
             print("Package plan for installation in environment %s:" % actions["PREFIX"])
             display_actions(actions, index, show_channel_urls=context.show_channel_urls)
             # TODO: this is where the transactions should be instantiated
+            if args.dry_run:
+                display_estimate(estimate_actions(actions, index))
         common.confirm_yn(args)
 
     elif args.dry_run:
-        common.stdout_json_success(actions=action_set, dry_run=True)
+        common.stdout_json_success(actions=action_set, dry_run=True,
+                                   estimates=[estimate_actions(actions, index)
+                                              for actions in action_set])
         raise DryRunExit()
 
     for actions in action_set:
@@ -384,9 +389,10 @@ def install(args, parser, command='install'):
         #     common.stdout_json_success(actions=actions, dry_run=True)
         #     raise DryRunExit()
 
+        performance = None
         with common.json_progress_bars(json=context.json and not context.quiet):
             try:
-                execute_actions(actions, index, verbose=not context.quiet)
+                performance = execute_actions(actions, index, verbose=not context.quiet)
                 if not (command == 'update' and args.all):
                     try:
                         with open(join(prefix, 'conda-meta', 'history'), 'a') as f:
@@ -412,4 +418,7 @@ def install(args, parser, command='install'):
                 print(print_activate(args.name if args.name else prefix))
 
         if context.json:
-            common.stdout_json_success(actions=actions)
+            if performance:
+                common.stdout_json_success(actions=actions, performance=performance)
+            else:
+                common.stdout_json_success(actions=actions)
@@ -13,9 +13,11 @@ from os.path import getsize, isdir, join
 
 from .common import add_parser_json, add_parser_yes, confirm_yn, stdout_json
 from ..base.context import context
+from ..core.package_cache import PackageCache
+from ..core.package_store import PackageStore
 from ..exceptions import ArgumentError
 from ..gateways.disk.delete import rm_rf
-from ..utils import human_bytes
+from ..utils import human_bytes, parse_human_bytes
 from ..common.compat import CrossPlatformStLink
 
 descr = """
@@ -69,6 +71,18 @@ def configure_parser(sub_parsers):
         action='store_true',
         help="""Remove files from the source cache of conda build.""",
     )
+    p.add_argument(
+        '--max-size',
+        metavar='SIZE',
+        help="""Remove least-recently-used tarballs and unused packages until each
+    writable package cache takes up at most SIZE (e.g. 10G).""",
+    )
+    p.add_argument(
+        '--store',
+        action='store_true',
+        help="""Add all cached packages to the package store (pkgs_store_dir), replacing
+    duplicate copies with hardlinks, and report the space saved.""",
+    )
     p.set_defaults(func=execute)
 
 
@@ -137,6 +151,8 @@ def find_pkgs():
     # themselves, like bin/python3.3 and bin/python3.3m in the Python package
     warnings = []
 
+    # links shared with the package store and other package caches don't mean it's installed
+    store = PackageStore.get()
     cross_platform_st_nlink = CrossPlatformStLink()
     pkgs_dirs = defaultdict(list)
     for pkgs_dir in context.pkgs_dirs:
@@ -157,7 +173,8 @@ def find_pkgs():
                     except OSError as e:
                         warnings.append((fn, e))
                         continue
-                    if st_nlink > 1:
+                    if st_nlink > 1 and (store is None or st_nlink > store.count_links(
+                            context.pkgs_dirs, pkgs_dir, join(root, fn))):
                         # print('%s is installed: %s' % (pkg, join(root, fn)))
                         breakit = True
                         break
@@ -318,10 +335,91 @@ def execute(args, parser):
         json_result['source_cache'] = find_source_cache()
         rm_source_cache(args, **json_result['source_cache'])
 
+    if args.max_size:
+        json_result['max_size'] = evict_lru(args, verbose=not context.json)
+
+    if args.store:
+        json_result['store'] = scan_store(args, verbose=not context.json)
+
     if not any((args.lock, args.tarballs, args.index_cache, args.packages,
-                args.source_cache, args.all)):
+                args.source_cache, args.max_size, args.store, args.all)):
         raise ArgumentError("One of {--lock, --tarballs, --index-cache, --packages, "
-                            "--source-cache, --all} required")
+                            "--source-cache, --max-size, --store, --all} required")
 
     if context.json:
         stdout_json(json_result)
+
+
+def evict_lru(args, verbose=True):
+    try:
+        max_size = parse_human_bytes(args.max_size)
+    except ValueError:
+        raise ArgumentError("Invalid --max-size: %s" % args.max_size)
+
+    pkgs_dirs = PackageCache.evict_all_writable(max_size, dry_run=True)
+    totalsize = sum(size for evicted in pkgs_dirs.values() for _, size in evicted)
+    result = {
+        'max_size': max_size,
+        'pkgs_dirs': dict((pkgs_dir, [path for path, _ in evicted])
+                          for pkgs_dir, evicted in pkgs_dirs.items()),
+        'total_size': totalsize,
+    }
+
+    if not any(pkgs_dirs.values()):
+        if verbose:
+            print("All package caches are within %s" % human_bytes(max_size))
+        return result
+
+    if verbose:
+        print("Will remove the following least-recently-used tarballs and packages:")
+        print()
+        fmt = "%-40s %10s"
+        for pkgs_dir in sorted(pkgs_dirs):
+            print(pkgs_dir)
+            print('-' * len(pkgs_dir))
+            for path, size in pkgs_dirs[pkgs_dir]:
+                print(fmt % (os.path.basename(path), human_bytes(size)))
+            print()
+        print('-' * 51)  # 40 + 1 + 10 in fmt
+        print(fmt % ('Total:', human_bytes(totalsize)))
+        print()
+
+    if not context.json:
+        confirm_yn(args)
+    if context.json and args.dry_run:
+        return result
+
+    for pkgs_dir, evicted in PackageCache.evict_all_writable(max_size).items():
+        if verbose:
+            for path, _ in evicted:
+                print("removing %s" % path)
+    return result
+
+
+def scan_store(args, verbose=True):
+    store = PackageStore.get()
+    if store is None:
+        raise ArgumentError("--store requires pkgs_store_dir to be configured")
+
+    if verbose:
+        print('Package store: %s' % store.store_dir)
+        print("Will add the packages in the following caches, replacing duplicates with "
+              "hardlinks:")
+        for pkgs_dir in context.pkgs_dirs:
+            print('    %s' % pkgs_dir)
+        print()
+
+    if not context.json:
+        confirm_yn(args)
+    if context.json and args.dry_run:
+        return dict(store.stats(), store_dir=store.store_dir, scanned_deduplicated_bytes=0)
+
+    scanned = store.scan()
+    stats = store.stats()
+    if verbose:
+        fmt = "%-40s %10s"
+        print(fmt % ('Packages in store:', stats['packages']))
+        print(fmt % ('Stored:', human_bytes(stats['stored_bytes'])))
+        print(fmt % ('Deduplicated by this scan:', human_bytes(scanned)))
+        print(fmt % ('Deduplicated in total:', human_bytes(stats['deduplicated_bytes'])))
+    return dict(stats, store_dir=store.store_dir, scanned_deduplicated_bytes=scanned)
@@ -17,9 +17,8 @@ import shutil
 import tarfile
 import tempfile
 from conda._vendor.auxlib.entity import EntityEncoder
-from conda.core.linked_data import is_linked, linked_data
-from conda.core.linked_data import linked
-from os.path import basename, dirname, isfile, islink, join, abspath, isdir
+from conda.core.linked_data import linked_data, path_owners
+from os.path import basename, dirname, isfile, islink, join, abspath, isdir, relpath
 
 from ..base.context import context, get_prefix
 
@@ -262,10 +261,9 @@ def which_package(path):
     prefix = which_prefix(path)
     if prefix is None:
         raise RuntimeError("could not determine conda prefix from: %s" % path)
-    for dist in linked(prefix):
-        meta = is_linked(prefix, dist)
-        if any(abspath(join(prefix, f)) == path for f in meta['files']):
-            yield dist
+    short_path = relpath(path, prefix).replace(os.sep, '/')
+    for dist in path_owners(prefix).get(short_path, ()):
+        yield dist
 
 
 def which_prefix(path):
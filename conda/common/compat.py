@@ -133,8 +133,11 @@ def with_metaclass(Type, skip_attrs=set(('__dict__', '__weakref__'))):
     """
 
     def _clone_with_metaclass(Class):
+        # slot descriptors are recreated from __slots__ by the new class
+        slots = vars(Class).get('__slots__', ())
+        slots = (slots,) if isinstance(slots, string_types) else slots
         attrs = dict((key, value) for key, value in iteritems(vars(Class))
-                     if key not in skip_attrs)
+                     if key not in skip_attrs and key not in slots)
         return Type(Class.__name__, Class.__bases__, attrs)
 
     return _clone_with_metaclass
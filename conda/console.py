@@ -30,6 +30,10 @@ class FetchProgressHandler(logging.Handler):
             n = record.msg
             fetch_progress.update(n)
 
+        elif record.name == 'fetch.status':
+            label, status = record.msg
+            fetch_progress.widgets[0] = label
+
         elif record.name == 'fetch.stop':
             fetch_progress.finish()
 
@@ -71,18 +75,24 @@ class JsonFetchProgressHandler(logging.Handler):
             sys.stdout.flush()
             self.filename = filename
             self.maxval = maxval
+            self.status = {}
 
         elif record.name == 'fetch.update':
             n = record.msg
-            print(json.dumps({
+            progress = {
                 'fetch': self.filename,
                 'maxval': self.maxval,
                 'progress': n,
                 'finished': False
-            }))
+            }
+            progress.update(self.status)
+            print(json.dumps(progress))
             print('\0', end='')
             sys.stdout.flush()
 
+        elif record.name == 'fetch.status':
+            label, self.status = record.msg
+
         elif record.name == 'fetch.stop':
             print(json.dumps({
                 'fetch': self.filename,
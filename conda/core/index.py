@@ -31,7 +31,7 @@ from ..exceptions import CondaHTTPError, CondaRuntimeError
 from ..gateways.disk.update import touch
 from ..models.channel import Channel, prioritize_channels
 from ..models.dist import Dist
-from ..models.index_record import EMPTY_LINK, IndexRecord
+from ..models.index_record import EMPTY_LINK, IndexRecord, SharedFields
 
 try:
     from cytoolz.itertoolz import take
@@ -363,17 +363,17 @@ def fetch_index(channel_urls, use_cache=False, unknown=False, index=None):
                 continue
             canonical_name, priority = channel_urls[channel_url]
             channel = Channel(channel_url)
+            # fields common to every package in the channel are stored once
+            shared = SharedFields(schannel=canonical_name,
+                                  channel=channel_url,
+                                  priority=priority,
+                                  auth=channel.auth,
+                                  )
             for fn, info in iteritems(repodata['packages']):
-                full_url = join_url(channel_url, fn)
-                info.update(dict(fn=fn,
-                                 schannel=canonical_name,
-                                 channel=channel_url,
-                                 priority=priority,
-                                 url=full_url,
-                                 auth=channel.auth,
-                                 ))
+                info['fn'] = fn
+                info['url'] = join_url(channel_url, fn)
                 key = Dist(canonical_name + '::' + fn if canonical_name != 'defaults' else fn)
-                result[key] = IndexRecord(**info)
+                result[key] = IndexRecord.from_shared(shared, info)
         return result
 
     index = make_index(repodatas)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+from logging import getLogger
+import os
+from os.path import join, lexists
+import socket
+from time import time
+
+from ..common.compat import on_win
+from ..gateways.disk.create import mkdir_p
+from ..gateways.disk.delete import rm_rf, try_rmdir_all_empty
+from ..gateways.disk.update import backoff_rename
+
+log = getLogger(__name__)
+
+JOURNAL_SHORT_PATH = 'conda-meta/transaction.journal'
+_JOURNAL_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+
+
+class TransactionJournal(object):
+    """An append-only log of a transaction in a prefix, so it can be finished or undone by a
+    later conda process if this one dies in the middle of it.
+
+    The journal is a file of json records, one per line.  The first, written by begin(),
+    plans the transaction: for each package, how to undo or finish each of its path actions,
+    as given by the entries described in recover_transaction().  Then come 'done' records as
+    packages are finished, and a 'commit' record once every action has been executed.  The
+    journal is removed when the transaction is over, whether it succeeded or was rolled back.
+
+    The plan and the commit are synced to disk as they're written.  'done' records only make
+    recovery cheaper, so they're buffered, and synced sync_count records or sync_interval
+    seconds at a time.  The journal is locked for as long as its transaction is running.
+    """
+
+    sync_count = 64
+    sync_interval = 1.0
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.path = join(prefix, JOURNAL_SHORT_PATH)
+        self._fh = None
+        self._pending = []
+        self._last_sync = 0
+
+    @classmethod
+    def begin(cls, prefix, packages):
+        # packages is a list of {'dist': text, 'entries': [entry, ...]}, in execution order
+        journal = cls(prefix)
+        mkdir_p(join(prefix, 'conda-meta'))
+        # not truncated until it's locked, as it may be the journal of a running transaction
+        journal._fh = os.fdopen(os.open(journal.path, _JOURNAL_OPEN_FLAGS, 0o666), 'wb')
+        if not _try_lock(journal._fh):
+            journal._fh.close()
+            raise IOError("transaction journal %s is locked" % journal.path)
+        journal._fh.truncate(0)
+        journal._append({
+            'op': 'begin',
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'time': time(),
+            'packages': packages,
+        })
+        journal.sync()
+        return journal
+
+    def packages_done(self, pkg_idxs):
+        self._append({'op': 'done', 'packages': list(pkg_idxs)})
+        if (len(self._pending) >= self.sync_count
+                or time() - self._last_sync >= self.sync_interval):
+            self.sync()
+
+    def commit(self):
+        self._append({'op': 'commit'})
+        self.sync()
+
+    def sync(self):
+        if self._pending:
+            self._fh.write(b''.join(self._pending))
+            del self._pending[:]
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._last_sync = time()
+
+    def close(self):
+        # the transaction is over, one way or another
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        rm_rf(self.path)
+
+    def _append(self, record):
+        self._pending.append(json.dumps(record, sort_keys=True).encode('utf-8') + b'\n')
+
+
+def recover_transaction(prefix):
+    """
+    Finish or undo the transaction in prefix that a conda process died in the middle of, if
+    there is one.  Returns 'forward' or 'back' for what was done, or None.
+
+    Each action in the journal's plan is one of these entries, with paths relative to prefix:
+
+        ['link', path]              a path created in the prefix
+        ['mkdir', path]             a directory created in the prefix
+        ['unlink', path, hold]      a path renamed to hold, to be deleted once committed
+        ['rmdir', path]             a directory to be removed once committed, if it's empty
+
+    A committed transaction, or one with every package done, is rolled forward by deleting
+    what it unlinked.  Otherwise every action planned is undone, last first.  Actions that
+    weren't executed are harmless to undo, except that a path being both unlinked and linked
+    is only removed if it was unlinked first.
+    """
+    journal_path = join(prefix, JOURNAL_SHORT_PATH)
+    if not lexists(journal_path):
+        return None
+
+    try:
+        with open(journal_path, 'rb') as fh:
+            if not _try_lock(fh):
+                log.debug("transaction journal %s is in use", journal_path)
+                return None
+            result = _recover(prefix, journal_path, _read_records(fh))
+        rm_rf(journal_path)
+        return result
+    except (IOError, OSError, ValueError, KeyError, IndexError) as e:
+        log.warn("cannot recover the interrupted transaction in %s\n  %r", prefix, e)
+        return None
+
+
+def _recover(prefix, journal_path, records):
+    begin = records[0] if records else {}
+    if begin.get('op') != 'begin':
+        log.debug("ignoring incomplete transaction journal %s", journal_path)
+        return None
+
+    packages = begin['packages']
+    done = set()
+    committed = False
+    for record in records[1:]:
+        if record.get('op') == 'done':
+            done.update(record['packages'])
+        elif record.get('op') == 'commit':
+            committed = True
+
+    if committed or len(done) >= len(packages):
+        log.warn("finishing the interrupted transaction in %s", prefix)
+        for package in packages:
+            for entry in package['entries']:
+                _roll_forward(prefix, entry)
+        result = 'forward'
+    else:
+        log.warn("rolling back the interrupted transaction in %s", prefix)
+        holds = dict((entry[1], entry[2]) for package in packages
+                     for entry in package['entries'] if entry[0] == 'unlink')
+        for package in reversed(packages):
+            for entry in reversed(package['entries']):
+                _roll_back(prefix, entry, holds)
+        result = 'back'
+    return result
+
+
+def _read_records(fh):
+    records = []
+    for line in fh:
+        if not line.endswith(b'\n'):
+            # a record that was being written when the process died
+            break
+        records.append(json.loads(line.decode('utf-8')))
+    return records
+
+
+def _try_lock(fh):
+    # An exclusive lock on the journal, without waiting for it.  The lock goes away with the
+    #   process holding it, so a journal that can be locked has no transaction running.
+    try:
+        if on_win:
+            import msvcrt
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _roll_forward(prefix, entry):
+    kind = entry[0]
+    if kind == 'unlink':
+        rm_rf(join(prefix, entry[2]))
+    elif kind == 'rmdir':
+        try_rmdir_all_empty(join(prefix, entry[1]))
+
+
+def _roll_back(prefix, entry, holds):
+    kind, path = entry[0], join(prefix, entry[1])
+    if kind == 'link':
+        hold = holds.get(entry[1])
+        if hold is None or lexists(join(prefix, hold)):
+            rm_rf(path)
+    elif kind == 'mkdir':
+        try_rmdir_all_empty(path)
+    elif kind == 'unlink':
+        hold = join(prefix, entry[2])
+        if lexists(hold):
+            if lexists(path):
+                rm_rf(path)
+            backoff_rename(hold, path)
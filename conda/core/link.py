@@ -2,36 +2,42 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from collections import defaultdict
+from errno import EEXIST
+import json
 from logging import getLogger
 import os
-from os.path import join
+from os.path import dirname, getsize, isdir, join, relpath
 from subprocess import CalledProcessError, check_call
 import sys
+from threading import Lock
+from time import time
 from traceback import format_exc
 import warnings
 
+from .journal import TransactionJournal
 from .linked_data import (get_python_version_for_prefix, linked_data as get_linked_data,
-                          load_meta)
+                          load_meta, path_owners)
 from .package_cache import PackageCache
-from .path_actions import (CompilePycAction, CreateApplicationEntryPointAction,
+from .path_actions import (CompileMultiPycAction, CreateApplicationEntryPointAction,
                            CreateLinkedPackageRecordAction, CreatePrivateEnvMetaAction,
                            CreatePythonEntryPointAction, LinkPathAction, MakeMenuAction,
-                           RemoveLinkedPackageRecordAction, RemoveMenuAction,
-                           RemovePrivateEnvMetaAction, UnlinkPathAction)
+                           PrefixReplaceLinkAction, RemoveLinkedPackageRecordAction,
+                           RemoveMenuAction, RemovePrivateEnvMetaAction, UnlinkPathAction)
 from .. import CondaMultiError
-from .._vendor.auxlib.collection import first
 from .._vendor.auxlib.ish import dals
 from ..base.context import context
-from ..common.compat import iteritems, itervalues, on_win, text_type
+from ..common.compat import iteritems, on_win, text_type
 from ..common.path import (explode_directories, get_all_directories, get_bin_directory_short_path,
                            get_major_minor_version,
-                           get_python_site_packages_short_path)
+                           get_python_site_packages_short_path, win_path_ok)
 from ..exceptions import CondaVerificationError
 from ..gateways.disk.delete import rm_rf
 from ..gateways.disk.read import isfile, lexists, read_package_info
 from ..gateways.disk.test import hardlink_supported, softlink_supported
+from ..gateways.disk.update import backoff_rename
 from ..models.dist import Dist
 from ..models.enums import LinkType
+from ..utils import parse_human_bytes
 
 try:
     from cytoolz.itertoolz import concat, concatv, groupby
@@ -40,6 +46,13 @@ except ImportError:
 
 log = getLogger(__name__)
 
+LINK_SUPPORT_SHORT_PATH = 'conda-meta/link_support.json'
+
+# Whether hard and soft links work from a package cache into a prefix, by (source device,
+#   target device, target prefix).  Finding out means creating and deleting a test link in the
+#   prefix, so it's done once per process rather than once per package.
+_link_support = {}
+
 
 def determine_link_type(extracted_package_dir, target_prefix):
     source_test_file = join(extracted_package_dir, 'info', 'index.json')
@@ -47,13 +60,68 @@ def determine_link_type(extracted_package_dir, target_prefix):
         return LinkType.copy
     if context.always_softlink:
         return LinkType.softlink
-    if hardlink_supported(source_test_file, target_prefix):
+    test_dir = target_prefix
+    while not isdir(test_dir) and dirname(test_dir) != test_dir:
+        # e.g. estimating a transaction for an environment that doesn't exist yet; it'll be
+        #   created in the nearest directory that does
+        test_dir = dirname(test_dir)
+    if _link_supported(LinkType.hardlink, source_test_file, test_dir, target_prefix):
         return LinkType.hardlink
-    if context.allow_softlinks and softlink_supported(source_test_file, target_prefix):
+    if (context.allow_softlinks
+            and _link_supported(LinkType.softlink, source_test_file, test_dir, target_prefix)):
         return LinkType.softlink
     return LinkType.copy
 
 
+def _link_supported(link_type, source_test_file, test_dir, target_prefix):
+    devices = (os.stat(source_test_file).st_dev, os.stat(test_dir).st_dev)
+    key = devices + (target_prefix,)
+    support = _link_support.get(key)
+    if support is None:
+        support = _link_support[key] = _read_link_support(target_prefix, devices)
+    link_type = text_type(link_type)
+    if link_type not in support:
+        probe = hardlink_supported if link_type == 'hardlink' else softlink_supported
+        support[link_type] = probe(source_test_file, test_dir)
+        if context.persist_link_type:
+            _write_link_support(target_prefix, devices, support)
+    return support[link_type]
+
+
+def _read_link_support(target_prefix, devices=None):
+    # what's recorded in the prefix's conda-meta/link_support.json, for devices if given
+    if not context.persist_link_type:
+        return {}
+    try:
+        with open(join(target_prefix, LINK_SUPPORT_SHORT_PATH)) as fh:
+            link_support = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return {}
+    if link_support.get('link_support_version') != 1:
+        return {}
+    recorded = link_support.get('devices') or {}
+    if devices is None:
+        return recorded
+    return dict(recorded.get('%d:%d' % devices) or {})
+
+
+def _write_link_support(target_prefix, devices, support):
+    link_support_path = join(target_prefix, LINK_SUPPORT_SHORT_PATH)
+    if not isdir(dirname(link_support_path)):
+        # the prefix is yet to be created; it'll be recorded next time
+        return
+    recorded = _read_link_support(target_prefix)
+    recorded['%d:%d' % devices] = support
+    temp_path = link_support_path + '.tmp'
+    try:
+        with open(temp_path, 'w') as fh:
+            json.dump({'link_support_version': 1, 'devices': recorded}, fh)
+        rm_rf(link_support_path)
+        backoff_rename(temp_path, link_support_path)
+    except (IOError, OSError) as e:
+        log.debug("cannot record link support in %s\n  %r", link_support_path, e)
+
+
 def make_unlink_actions(transaction_context, target_prefix, linked_package_data):
     # no side effects in this function!
     unlink_path_actions = tuple(UnlinkPathAction(transaction_context, linked_package_data,
@@ -132,6 +200,8 @@ class UnlinkLinkTransaction(object):
 
         self._prepared = False
         self._verified = False
+        self.estimate = None
+        self.measured = None
 
     def prepare(self):
         if self._prepared:
@@ -166,8 +236,10 @@ class UnlinkLinkTransaction(object):
         self.all_actions = tuple(per_pkg_actions for per_pkg_actions in
                                  concatv(unlink_actions, link_actions))
         # type: Tuple[pkg_data, Tuple[PathAction]]
+        self.transaction_context = transaction_context
 
         self.num_unlink_pkgs = len(unlink_actions)
+        self.estimate = _estimate_costs(self.target_prefix, self.all_actions, self.num_unlink_pkgs)
 
         self._prepared = True
 
@@ -213,10 +285,9 @@ class UnlinkLinkTransaction(object):
                 link_paths_dict[path].append(axn)
                 if path not in unlink_paths and lexists(join(target_prefix, path)):
                     # we have a collision; at least try to figure out where it came from
-                    linked_data = get_linked_data(target_prefix)
-                    colliding_linked_package_record = first(
-                        (lpr for lpr in itervalues(linked_data)),
-                        key=lambda lpr: path in lpr.files
+                    colliding_dists = path_owners(target_prefix).get(path)
+                    colliding_linked_package_record = (
+                        colliding_dists and get_linked_data(target_prefix)[colliding_dists[0]]
                     )
                     if colliding_linked_package_record:
                         yield CondaVerificationError(dals("""
@@ -270,11 +341,41 @@ class UnlinkLinkTransaction(object):
         if not self._verified:
             self.verify()
 
+        start_time = time()
+        directories = _plan_directories(self.all_actions[self.num_unlink_pkgs:])
+        journal_packages = [
+            {'dist': text_type(Dist(pkg_data)),
+             'entries': _journal_entries(self.target_prefix, actions)}
+            for pkg_data, actions in self.all_actions
+        ]
+        if self.num_unlink_pkgs < len(journal_packages):
+            # the directories are all made ahead of the first package being linked
+            journal_packages[self.num_unlink_pkgs]['entries'][:0] = [
+                ['mkdir', short_path] for short_path in directories
+            ]
+        journal = TransactionJournal.begin(self.target_prefix, journal_packages)
+        executor = self._make_link_executor()
         pkg_idx = 0
+        created_directories = []
+        directories_made = False
         try:
-            for pkg_idx, (pkg_data, actions) in enumerate(self.all_actions):
-                self._execute_actions(self.target_prefix, self.num_unlink_pkgs, pkg_idx,
-                                      pkg_data, actions)
+            for pkg_idx, pkg_count in self._execution_groups(self.target_prefix,
+                                                             self.all_actions,
+                                                             self.num_unlink_pkgs,
+                                                             executor is not None):
+                if pkg_idx >= self.num_unlink_pkgs and not directories_made:
+                    # once everything's unlinked, in case a file is being replaced by a directory
+                    _make_directories(self.target_prefix, directories, created_directories)
+                    self.transaction_context['made_directories'] = frozenset(directories)
+                    directories_made = True
+                if pkg_count == 1:
+                    pkg_data, actions = self.all_actions[pkg_idx]
+                    self._execute_actions(self.target_prefix, self.num_unlink_pkgs, pkg_idx,
+                                          pkg_data, actions)
+                else:
+                    self._execute_group(self.target_prefix, pkg_idx,
+                                        self.all_actions[pkg_idx:pkg_idx + pkg_count], executor)
+                journal.packages_done(range(pkg_idx, pkg_idx + pkg_count))
         except Exception as execute_multi_exc:
             # reverse all executed packages except the one that failed
             rollback_excs = []
@@ -285,6 +386,8 @@ class UnlinkLinkTransaction(object):
                     excs = self._reverse_actions(self.target_prefix, self.num_unlink_pkgs,
                                                  pkg_idx, pkg_data, actions)
                     rollback_excs.extend(excs)
+                # and the directories made for packages that weren't reached
+                _remove_directories(self.target_prefix, created_directories)
 
             raise CondaMultiError(tuple(concatv(
                 (execute_multi_exc.errors
@@ -294,9 +397,67 @@ class UnlinkLinkTransaction(object):
             )))
 
         else:
+            journal.commit()
             for pkg_idx, (pkg_data, actions) in enumerate(self.all_actions):
                 for axn_idx, action in enumerate(actions):
                     action.cleanup()
+            self.measured = _measure_costs(self.all_actions, time() - start_time)
+
+            if context.pkgs_max_size:
+                self._evict_package_caches()
+
+        finally:
+            journal.close()
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    @staticmethod
+    def _make_link_executor():
+        if context.link_threads > 1:
+            try:
+                from concurrent.futures import ThreadPoolExecutor
+                return ThreadPoolExecutor(context.link_threads)
+            except (ImportError, RuntimeError) as e:
+                # concurrent.futures is only available in Python >= 3.2 or if futures is installed
+                # RuntimeError is thrown if number of threads are limited by OS
+                log.debug(repr(e))
+        return None
+
+    @staticmethod
+    def _execution_groups(target_prefix, all_actions, num_unlink_pkgs, parallel):
+        # Yields (pkg_idx, pkg_count) for runs of packages that are executed together.  Without
+        #   parallel, and for unlinked packages, that's one package at a time.  Otherwise
+        #   packages being linked are grouped, with a package that has a pre-link script
+        #   starting a new group, and one with a post-link script ending its group, so the
+        #   scripts see the same files in the prefix as they would linking package by package.
+        group_start = None
+        for pkg_idx, (pkg_data, actions) in enumerate(all_actions):
+            if not parallel or pkg_idx < num_unlink_pkgs:
+                yield pkg_idx, 1
+                continue
+            if group_start is not None and _has_link_script(target_prefix, pkg_data, 'pre-link'):
+                yield group_start, pkg_idx - group_start
+                group_start = None
+            if group_start is None:
+                group_start = pkg_idx
+            if _has_link_script(target_prefix, pkg_data, 'post-link'):
+                yield group_start, pkg_idx + 1 - group_start
+                group_start = None
+        if group_start is not None:
+            yield group_start, len(all_actions) - group_start
+
+    @staticmethod
+    def _evict_package_caches():
+        # Now that the new packages are linked in, and so protected from eviction, bring the
+        #   package caches back within pkgs_max_size.  This never fails the transaction.
+        try:
+            max_size = parse_human_bytes(context.pkgs_max_size)
+            for pkgs_dir, evicted in iteritems(PackageCache.evict_all_writable(max_size)):
+                if evicted:
+                    log.info("evicted %d least-recently-used items from %s",
+                             len(evicted), pkgs_dir)
+        except Exception as e:
+            log.warn("package cache eviction failed\n  %r", e)
 
     @staticmethod
     def _execute_actions(target_prefix, num_unlink_pkgs, pkg_idx, pkg_data, actions):
@@ -338,6 +499,63 @@ class UnlinkLinkTransaction(object):
                 reverse_excs,
             )))
 
+    @staticmethod
+    def _execute_group(target_prefix, first_pkg_idx, group, executor):
+        # Link a group of packages, running their file link actions on executor.  Each package's
+        #   conda-meta record, directories and pre-link script still come first, in order, and
+        #   everything after the file links (entry points, pyc compilation, menus, post-link
+        #   scripts) runs once all of the group's files are in place, package by package.
+        started = set()  # (group index, axn_idx) of every action that was started
+        errors = []
+        try:
+            file_actions = []
+            for group_idx, (pkg_data, actions) in enumerate(group):
+                log.info("===> LINKING PACKAGE: %s <===\n"
+                         "  prefix=%s\n"
+                         "  source=%s\n",
+                         Dist(pkg_data), target_prefix, pkg_data.extracted_package_dir)
+                run_script(target_prefix, Dist(pkg_data), 'pre-link')
+                files_start, files_end = _file_link_range(actions)
+                for axn_idx in range(files_start):
+                    started.add((group_idx, axn_idx))
+                    actions[axn_idx].execute()
+                file_actions.extend((group_idx, axn_idx, actions[axn_idx])
+                                    for axn_idx in range(files_start, files_end))
+
+            _execute_file_actions(file_actions, executor, started, errors)
+            if errors:
+                raise errors[0]
+
+            for group_idx, (pkg_data, actions) in enumerate(group):
+                for axn_idx in range(_file_link_range(actions)[1], len(actions)):
+                    started.add((group_idx, axn_idx))
+                    actions[axn_idx].execute()
+                run_script(target_prefix, Dist(pkg_data), 'post-link')
+        except Exception as e:
+            log.debug("Error linking packages #%d to #%d", first_pkg_idx,
+                      first_pkg_idx + len(group) - 1)
+            log.debug(format_exc())
+            if e not in errors:
+                errors.append(e)
+            reverse_excs = []
+            if context.rollback_enabled:
+                log.error("An error occurred while installing packages %s.\n"
+                          "%r\n"
+                          "Attempting to roll back.\n",
+                          ', '.join(text_type(Dist(pkg_data)) for pkg_data, _ in group),
+                          errors[0])
+                # reverse exactly the actions that were started, last package first
+                for group_idx, axn_idx in sorted(started, reverse=True):
+                    action = group[group_idx][1][axn_idx]
+                    try:
+                        action.reverse()
+                    except Exception as reverse_exc:
+                        log.debug("action.reverse() error in action #%d for pkg_idx #%d %r",
+                                  axn_idx, first_pkg_idx + group_idx, action)
+                        log.debug(format_exc())
+                        reverse_excs.append(reverse_exc)
+            raise CondaMultiError(tuple(concatv(errors, reverse_excs)))
+
     @staticmethod
     def _reverse_actions(target_prefix, num_unlink_pkgs, pkg_idx, pkg_data, actions,
                          reverse_from_idx=-1):
@@ -404,19 +622,20 @@ class UnlinkLinkTransaction(object):
         create_menu_actions = MakeMenuAction.create_actions(*required_quad)
 
         python_entry_point_actions = CreatePythonEntryPointAction.create_actions(*required_quad)
-        compile_pyc_actions = CompilePycAction.create_actions(*required_quad,
-                                                              file_link_actions=file_link_actions)
+        compile_pyc_actions = CompileMultiPycAction.create_actions(
+            *required_quad, file_link_actions=file_link_actions
+        )
 
         application_entry_point_actions = CreateApplicationEntryPointAction.create_actions(
             *required_quad
         )
         private_envs_meta_actions = CreatePrivateEnvMetaAction.create_actions(*required_quad)
 
-        all_target_short_paths = tuple(axn.target_short_path for axn in concatv(
-            file_link_actions,
-            python_entry_point_actions,
-            compile_pyc_actions,
-            application_entry_point_actions,
+        all_target_short_paths = tuple(concatv(
+            (axn.target_short_path for axn in concatv(file_link_actions,
+                                                      python_entry_point_actions)),
+            concat(axn.target_short_paths for axn in compile_pyc_actions),
+            (axn.target_short_path for axn in application_entry_point_actions),
         ))
         meta_create_actions = CreateLinkedPackageRecordAction.create_actions(
             *required_quad, all_target_short_paths=all_target_short_paths
@@ -434,15 +653,204 @@ class UnlinkLinkTransaction(object):
         ))
 
 
-def run_script(prefix, dist, action='post-link', env_prefix=None):
+def _plan_directories(link_actions):
+    # the short paths of every directory the packages being linked need, parents first
+    directories = set()
+    for pkg_data, actions in link_actions:
+        for axn in actions:
+            if isinstance(axn, LinkPathAction) and axn.link_type == LinkType.directory:
+                parts = axn.target_short_path.split('/')
+                directories.update('/'.join(parts[:q]) for q in range(1, len(parts) + 1))
+    return sorted(directories)
+
+
+def _make_directories(target_prefix, directories, created):
     """
-    call the post-link (or pre-unlink) script, and return True on success,
-    False on failure
+    Create the directories from _plan_directories() in one pass for the whole transaction,
+    instead of a makedirs() per leaf directory of each package.  The ones that were created,
+    rather than already there, are appended to created as they're made, so they're known
+    even if this fails partway.
     """
-    path = join(prefix, 'Scripts' if on_win else 'bin', '.%s-%s.%s' % (
+    for short_path in directories:
+        path = join(target_prefix, win_path_ok(short_path))
+        if created and short_path.startswith(created[-1] + '/'):
+            # the parent was just created, so there's nothing here yet
+            os.mkdir(path)
+        else:
+            try:
+                os.mkdir(path)
+            except OSError as e:
+                if e.errno != EEXIST or not isdir(path):
+                    raise
+                continue
+        created.append(short_path)
+    log.debug("made %d of %d directories in %s", len(created), len(directories), target_prefix)
+
+
+def _remove_directories(target_prefix, created):
+    # undo _make_directories(), for the directories that are still empty
+    for short_path in reversed(created):
+        try:
+            os.rmdir(join(target_prefix, win_path_ok(short_path)))
+        except (IOError, OSError):
+            pass
+
+
+def _estimate_costs(target_prefix, all_actions, num_unlink_pkgs):
+    # What executing all_actions is going to take, as counts of the work in each of its phases.
+    #   _measure_costs() gives the same for a transaction that's been executed.
+    link_files = dict((text_type(lt), 0) for lt in (LinkType.hardlink, LinkType.softlink,
+                                                    LinkType.copy))
+    estimate = {
+        'link_files': link_files,
+        'directories': 0,
+        'unlink_files': 0,
+        'prefix_replace_files': 0,
+        'prefix_replace_bytes': 0,
+        'pyc_files': 0,
+        'scripts': 0,
+    }
+    for pkg_idx, (pkg_data, actions) in enumerate(all_actions):
+        if pkg_idx < num_unlink_pkgs:
+            estimate['scripts'] += sum(1 for action in ('pre-unlink', 'post-unlink')
+                                       if isfile(_get_script_path(target_prefix,
+                                                                  Dist(pkg_data), action)))
+        else:
+            estimate['scripts'] += sum(1 for action in ('pre-link', 'post-link')
+                                       if _has_link_script(target_prefix, pkg_data, action))
+        for axn in actions:
+            if isinstance(axn, UnlinkPathAction):
+                if axn.link_type != LinkType.directory:
+                    estimate['unlink_files'] += 1
+            elif isinstance(axn, CompileMultiPycAction):
+                estimate['pyc_files'] += len(axn.target_short_paths)
+            elif isinstance(axn, LinkPathAction):
+                if axn.link_type == LinkType.directory:
+                    estimate['directories'] += 1
+                    continue
+                link_files[text_type(axn.link_type)] += 1
+                if isinstance(axn, PrefixReplaceLinkAction):
+                    estimate['prefix_replace_files'] += 1
+                    if isfile(axn.source_full_path):
+                        estimate['prefix_replace_bytes'] += getsize(axn.source_full_path)
+    return estimate
+
+
+def _measure_costs(all_actions, seconds):
+    # the work an executed transaction did, for comparison with its estimate
+    link_files = dict((text_type(lt), 0) for lt in (LinkType.hardlink, LinkType.softlink,
+                                                    LinkType.copy))
+    measured = {
+        'link_files': link_files,
+        'prefix_replace_bytes': 0,
+        'pyc_files': 0,
+        'link_seconds': seconds,
+    }
+    for pkg_data, actions in all_actions:
+        for axn in actions:
+            if isinstance(axn, CompileMultiPycAction):
+                measured['pyc_files'] += sum(1 for sub_axn in axn.compile_pyc_actions
+                                             if sub_axn._execute_successful)
+            elif (isinstance(axn, LinkPathAction) and axn.link_type != LinkType.directory
+                    and axn._execute_successful):
+                link_files[text_type(axn.link_type)] += 1
+                if isinstance(axn, PrefixReplaceLinkAction) and isfile(axn.target_full_path):
+                    measured['prefix_replace_bytes'] += getsize(axn.target_full_path)
+    return measured
+
+
+def _journal_entries(target_prefix, actions):
+    # How a later process can undo or finish each of a package's actions, as entries for
+    #   TransactionJournal.  Menus and private env records are left out; they're outside of
+    #   what can be recovered from the prefix's paths alone.
+    entries = []
+    for axn in actions:
+        if isinstance(axn, (MakeMenuAction, RemoveMenuAction, CreatePrivateEnvMetaAction,
+                            RemovePrivateEnvMetaAction)):
+            continue
+        elif isinstance(axn, UnlinkPathAction):
+            if axn.link_type == LinkType.directory:
+                entries.append(['rmdir', axn.target_short_path])
+            else:
+                entries.append(['unlink', axn.target_short_path, axn.holding_short_path])
+        elif isinstance(axn, CompileMultiPycAction):
+            entries.extend(['link', short_path] for short_path in axn.target_short_paths)
+        elif isinstance(axn, LinkPathAction) and axn.link_type == LinkType.directory:
+            entries.append(['mkdir', axn.target_short_path])
+        elif axn.target_prefix == target_prefix:
+            entries.append(['link', axn.target_short_path])
+    return entries
+
+
+def _file_link_range(actions):
+    # The (start, end) indices of a package's file link actions.  As laid out by
+    #   make_link_actions(), they follow the conda-meta record and the directories.
+    start = 0
+    while start < len(actions) and (not isinstance(actions[start], LinkPathAction)
+                                    or actions[start].link_type == LinkType.directory):
+        start += 1
+    end = start
+    while end < len(actions) and isinstance(actions[end], LinkPathAction):
+        end += 1
+    return start, end
+
+
+def _execute_file_actions(file_actions, executor, started, errors, chunk_size=64):
+    # Run (group index, axn_idx, action) file link actions on executor, in chunks.  Once one
+    #   fails, no more are started.  Actions on a path that an earlier action in file_actions
+    #   also targets are run afterwards, in order, so that with --force the same one wins.
+    lock = Lock()
+    seen_paths = set()
+    parallel, serial = [], []
+    for item in file_actions:
+        path = item[2].target_full_path
+        path = path.lower() if on_win else path
+        (serial if path in seen_paths else parallel).append(item)
+        seen_paths.add(path)
+
+    def execute_chunk(chunk):
+        for group_idx, axn_idx, action in chunk:
+            with lock:
+                if errors:
+                    return
+                started.add((group_idx, axn_idx))
+            try:
+                action.execute()
+            except Exception as e:
+                log.debug("Error in action #%d %r", axn_idx, action)
+                log.debug(format_exc())
+                with lock:
+                    errors.append(e)
+                return
+
+    futures = [executor.submit(execute_chunk, parallel[q:q + chunk_size])
+               for q in range(0, len(parallel), chunk_size)]
+    for future in futures:
+        future.result()
+    execute_chunk(serial)
+
+
+def _get_script_path(prefix, dist, action):
+    return join(prefix, 'Scripts' if on_win else 'bin', '.%s-%s.%s' % (
         dist.dist_name,
         action,
         'bat' if on_win else 'sh'))
+
+
+def _has_link_script(target_prefix, package_info, action):
+    # whether run_script() might find an action script, shipped with the package or not
+    path = _get_script_path(target_prefix, Dist(package_info), action)
+    short_path = relpath(path, target_prefix).replace(os.sep, '/')
+    return (isfile(path)
+            or any(spi.path == short_path for spi in package_info.paths_data.paths))
+
+
+def run_script(prefix, dist, action='post-link', env_prefix=None):
+    """
+    call the post-link (or pre-unlink) script, and return True on success,
+    False on failure
+    """
+    path = _get_script_path(prefix, dist, action)
     if not isfile(path):
         return True
     if on_win:
@@ -6,8 +6,9 @@ from logging import getLogger
 from os import listdir
 from os.path import isdir, isfile, join
 
+from .journal import recover_transaction
 from ..base.constants import UNKNOWN_CHANNEL
-from ..common.compat import itervalues, odict
+from ..common.compat import iteritems, itervalues, odict
 from ..gateways.disk.delete import rm_rf
 from ..models.channel import Channel
 from ..models.dist import Dist
@@ -25,6 +26,33 @@ log = getLogger(__name__)
 linked_data_ = {}
 # type: Dict[Dist, IndexRecord]
 
+# For each prefix, the paths installed in it, and the packages that installed them.  It's
+# built from linked_data_ the first time it's asked for, and kept in step with it after that.
+path_owners_ = {}
+# type: Dict[str, Tuple[Dict[Dist, IndexRecord], Dict[str, List[Dist]]]]
+
+
+def _cached_path_owners(prefix):
+    # the path owners for prefix, if they were built from the linked data there now
+    cached = path_owners_.get(prefix)
+    if cached is None or cached[0] is not linked_data_.get(prefix):
+        return None
+    return cached[1]
+
+
+def _add_path_owner(owners, dist, rec):
+    for path in rec.get('files') or ():
+        owners.setdefault(path, []).append(dist)
+
+
+def _remove_path_owner(owners, dist, rec):
+    for path in rec.get('files') or ():
+        dists = owners.get(path)
+        if dists and dist in dists:
+            dists.remove(dist)
+            if not dists:
+                del owners[path]
+
 
 def load_linked_data(prefix, dist_name, rec=None, ignore_channels=False):
     meta_file = join(prefix, 'conda-meta', dist_name + '.json')
@@ -63,7 +91,13 @@ def load_linked_data(prefix, dist_name, rec=None, ignore_channels=False):
         dist = Dist.from_string(dist_name)
     else:
         dist = Dist.from_string(dist_name, channel_override=schannel)
-    linked_data_[prefix][dist] = rec = IndexRecord(**rec)
+    recs = linked_data_[prefix]
+    owners = _cached_path_owners(prefix)
+    if owners is not None and dist in recs:
+        _remove_path_owner(owners, dist, recs[dist])
+    recs[dist] = rec = IndexRecord(**rec)
+    if owners is not None:
+        _add_path_owner(owners, dist, rec)
 
     return rec
 
@@ -71,6 +105,9 @@ def load_linked_data(prefix, dist_name, rec=None, ignore_channels=False):
 def delete_linked_data(prefix, dist, delete=True):
     recs = linked_data_.get(prefix)
     if recs and dist in recs:
+        owners = _cached_path_owners(prefix)
+        if owners is not None:
+            _remove_path_owner(owners, dist, recs[dist])
         del recs[dist]
     if delete:
         meta_path = join(prefix, 'conda-meta', dist.to_filename('.json'))
@@ -85,6 +122,7 @@ def delete_prefix_from_linked_data(path):
                             None)
     if linked_data_path:
         del linked_data_[linked_data_path]
+        path_owners_.pop(linked_data_path, None)
         return True
     return False
 
@@ -104,6 +142,8 @@ def linked_data(prefix, ignore_channels=False):
     # Manually memoized so it can be updated
     recs = linked_data_.get(prefix)
     if recs is None:
+        # a transaction interrupted in prefix is finished or undone before anything reads it
+        recover_transaction(prefix)
         recs = linked_data_[prefix] = odict()
         meta_dir = join(prefix, 'conda-meta')
         if isdir(meta_dir):
@@ -114,6 +154,21 @@ def linked_data(prefix, ignore_channels=False):
     return recs
 
 
+def path_owners(prefix):
+    """
+    Return a dictionary of the paths installed in prefix, relative to prefix, to the list of
+    linked packages that installed each one.  Usually that's only one package.
+    """
+    recs = linked_data(prefix)
+    owners = _cached_path_owners(prefix)
+    if owners is None:
+        owners = {}
+        for dist, rec in iteritems(recs):
+            _add_path_owner(owners, dist, rec)
+        path_owners_[prefix] = recs, owners
+    return owners
+
+
 def linked(prefix, ignore_channels=False):
     """
     Return the set of canonical names of linked packages in prefix.
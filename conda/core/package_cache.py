@@ -1,26 +1,35 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from functools import partial
+import json
 from logging import getLogger
-from os import listdir
-from os.path import basename, isdir, isfile, islink, join
+from os import listdir, lstat, stat, walk
+from os.path import basename, dirname, getsize, isdir, isfile, islink, join
+from multiprocessing import cpu_count
+from threading import Lock
+from time import time
 from traceback import format_exc
 
-from .path_actions import CacheUrlAction, ExtractPackageAction
+from .package_store import PackageStore
+from .path_actions import CacheUrlAction, CacheUrlAndExtractAction, ExtractPackageAction
 from .. import CondaError, CondaMultiError
 from .._vendor.auxlib.collection import first
 from .._vendor.auxlib.decorators import memoizemethod
 from .._vendor.auxlib.path import expand
 from ..base.constants import CONDA_TARBALL_EXTENSION, UNKNOWN_CHANNEL
 from ..base.context import context
-from ..common.compat import iteritems, iterkeys, itervalues, text_type, with_metaclass
+from ..common.compat import (CrossPlatformStLink, iteritems, iterkeys, itervalues, text_type,
+                             with_metaclass)
 from ..common.path import url_to_path
 from ..common.url import join_url, path_to_url
+from ..gateways.disk.delete import rm_rf
 from ..gateways.disk.read import compute_md5sum
 from ..gateways.disk.test import try_write
+from ..gateways.download import DownloadScheduler
 from ..models.channel import Channel
 from ..models.dist import Dist
-from ..utils import md5_file
+from ..utils import hashsum_file
 
 try:
     from cytoolz.itertoolz import concat, concatv, groupby, remove
@@ -28,9 +37,16 @@ except ImportError:
     from .._vendor.toolz.itertoolz import concat, concatv, groupby, remove  # NOQA
 
 
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
 log = getLogger(__name__)
 stderrlog = getLogger('stderrlog')
 
+PACKAGE_CACHE_INDEX_FILENAME = '.pkgs_index.json'
+
 
 class UrlsData(object):
     # this is a class to manage urls.txt
@@ -46,6 +62,7 @@ class UrlsData(object):
                 self._urls_data.reverse()
         else:
             self._urls_data = []
+        self._urls_by_basename = None
 
     def __contains__(self, url):
         return url in self._urls_data
@@ -57,6 +74,8 @@ class UrlsData(object):
         with open(self.urls_txt_path, 'a') as fh:
             fh.write(url + '\n')
         self._urls_data.insert(0, url)
+        if self._urls_by_basename is not None:
+            self._urls_by_basename[url.rsplit('/', 1)[-1]] = url
 
     def get_url(self, package_path):
         # package path can be a full path or just a basename
@@ -64,7 +83,131 @@ class UrlsData(object):
         package_path = basename(package_path)
         if not package_path.endswith(CONDA_TARBALL_EXTENSION):
             package_path += CONDA_TARBALL_EXTENSION
-        return first(self, lambda url: url.endswith(package_path))
+        if self._urls_by_basename is None:
+            # built in one pass; the most recently added url for a basename wins
+            self._urls_by_basename = dict((url.rsplit('/', 1)[-1], url)
+                                          for url in reversed(self._urls_data))
+        return self._urls_by_basename.get(package_path)
+
+
+class DigestsData(object):
+    # this is a class to manage digests.txt, a record of tarball digests already computed
+    # each line is "basename size mtime inode algorithm hexdigest"; like urls.txt it is only
+    #   ever appended to, and the last line recorded for a file wins
+    # a recorded digest is only used while the file's size, mtime and inode are unchanged
+
+    def __init__(self, pkgs_dir):
+        self.pkgs_dir = pkgs_dir
+        self.digests_txt_path = join(pkgs_dir, 'digests.txt')
+        self._digests_data = None
+
+    @staticmethod
+    def _file_key(path):
+        st = stat(path)
+        return basename(path), st.st_size, repr(st.st_mtime), st.st_ino
+
+    def _load(self):
+        digests_data = {}
+        if isfile(self.digests_txt_path):
+            with open(self.digests_txt_path, 'r') as fh:
+                for line in fh:
+                    fields = line.split()
+                    if len(fields) != 6:
+                        continue
+                    name, size, mtime, inode, algorithm, digest = fields
+                    try:
+                        key = name, int(size), mtime, int(inode), algorithm
+                    except ValueError:
+                        continue
+                    digests_data[key] = digest
+        self._digests_data = digests_data
+        return digests_data
+
+    def get_digest(self, path, algorithm='md5'):
+        digests_data = self._digests_data
+        if digests_data is None:
+            digests_data = self._load()
+        return digests_data.get(self._file_key(path) + (algorithm,))
+
+    def add_digest(self, path, digest, algorithm='md5'):
+        if not digest:
+            return
+        key = self._file_key(path) + (algorithm,)
+        if self._digests_data is None:
+            self._load()
+        if self._digests_data.get(key) == digest:
+            return
+        self._digests_data[key] = digest
+        try:
+            with open(self.digests_txt_path, 'a') as fh:
+                fh.write(' '.join(text_type(field) for field in key + (digest,)) + '\n')
+        except (IOError, OSError) as e:
+            log.debug("unable to record digest in %s\n%r", self.digests_txt_path, e)
+
+    def compute_digest(self, path, algorithm='md5'):
+        digest = self.get_digest(path, algorithm)
+        if digest is None:
+            digest = hashsum_file(path, algorithm)
+            self.add_digest(path, digest, algorithm)
+        return digest
+
+
+class LastUsedData(object):
+    # this is a class to manage last_used.txt, a record of when packages were last linked
+    # each line is "timestamp dist_name"; like urls.txt it is only ever appended to, and the
+    #   last line recorded for a package wins, until there are enough stale lines to compact it
+
+    # a package used again within this many seconds isn't recorded again
+    resolution = 60
+
+    def __init__(self, pkgs_dir):
+        self.pkgs_dir = pkgs_dir
+        self.last_used_txt_path = join(pkgs_dir, 'last_used.txt')
+        self._last_used_data = None
+        self._line_count = 0
+
+    def _load(self):
+        last_used_data = {}
+        line_count = 0
+        if isfile(self.last_used_txt_path):
+            with open(self.last_used_txt_path, 'r') as fh:
+                for line in fh:
+                    line_count += 1
+                    fields = line.split()
+                    if len(fields) != 2:
+                        continue
+                    try:
+                        last_used_data[fields[1]] = float(fields[0])
+                    except ValueError:
+                        continue
+        self._last_used_data = last_used_data
+        self._line_count = line_count
+        return last_used_data
+
+    def get_last_used(self, dist_name):
+        last_used_data = self._last_used_data
+        if last_used_data is None:
+            last_used_data = self._load()
+        return last_used_data.get(dist_name)
+
+    def mark_used(self, dist_name, now=None):
+        now = time() if now is None else now
+        last_used = self.get_last_used(dist_name)
+        if last_used is not None and now - last_used < self.resolution:
+            return
+        self._last_used_data[dist_name] = now
+        try:
+            if self._line_count > 2 * len(self._last_used_data) + 100:
+                with open(self.last_used_txt_path, 'w') as fh:
+                    for name, timestamp in sorted(iteritems(self._last_used_data)):
+                        fh.write('%r %s\n' % (timestamp, name))
+                self._line_count = len(self._last_used_data)
+            else:
+                with open(self.last_used_txt_path, 'a') as fh:
+                    fh.write('%r %s\n' % (now, dist_name))
+                self._line_count += 1
+        except (IOError, OSError) as e:
+            log.debug("unable to record last use in %s\n%r", self.last_used_txt_path, e)
 
 
 class PackageCacheEntry(object):
@@ -97,7 +240,7 @@ class PackageCacheEntry(object):
         return basename(self.package_tarball_full_path)
 
     def tarball_matches_md5(self, md5sum):
-        return self.md5sum == md5sum
+        return self.md5sum() == md5sum
 
     @property
     def package_cache_writable(self):
@@ -112,7 +255,8 @@ class PackageCacheEntry(object):
     @memoizemethod
     def _calculate_md5sum(self):
         assert self.is_fetched
-        return md5_file(self.package_tarball_full_path)
+        return PackageCache(self.pkgs_dir).digests_data.compute_digest(
+            self.package_tarball_full_path)
 
     def __repr__(self):
         args = ('%s=%r' % (key, getattr(self, key))
@@ -149,6 +293,8 @@ class PackageCache(object):
 
         self.pkgs_dir = pkgs_dir
         self.urls_data = UrlsData(pkgs_dir)
+        self.digests_data = DigestsData(pkgs_dir)
+        self.last_used_data = LastUsedData(pkgs_dir)
 
         # caching object for is_writable property
         self._is_writable = None
@@ -199,6 +345,14 @@ class PackageCache(object):
 
     @classmethod
     def get_entry_to_link(cls, dist):
+        pc_entry = cls._find_entry_to_link(dist)
+        package_cache = PackageCache(pc_entry.pkgs_dir)
+        if package_cache.is_writable:
+            package_cache.last_used_data.mark_used(pc_entry.dist.dist_name)
+        return pc_entry
+
+    @classmethod
+    def _find_entry_to_link(cls, dist):
         pc_entry = next((pc_entry
                          for pc_entry in cls.get_matching_entries(dist)
                          if pc_entry.is_extracted),
@@ -220,6 +374,53 @@ class PackageCache(object):
 
         raise CondaError("No package '%s' found in cache directories." % dist)
 
+    @classmethod
+    def evict_all_writable(cls, max_size, dry_run=False):
+        # returns {pkgs_dir: [(path, size)]} of everything evicted from each writable cache
+        return dict((package_cache.pkgs_dir, package_cache.evict_lru(max_size, dry_run))
+                    for package_cache in cls.all_writable())
+
+    def evict_lru(self, max_size, dry_run=False):
+        """Remove least-recently-used tarballs and extracted packages until the cache fits.
+
+        Packages are ordered by when get_entry_to_link last picked them, or else by the age of
+        their files, and a package's tarball goes before its extracted directory.  Extracted
+        packages with files hardlinked into environments are never removed.
+
+        Returns the (path, size) of everything removed, or with dry_run, of everything that
+        would be, until this cache takes up no more than max_size bytes.
+        """
+        store = PackageStore.get()
+        total_size = 0
+        candidates = []
+        for pc_entry in tuple(itervalues(self)):
+            last_used = self.last_used_data.get_last_used(pc_entry.dist.dist_name)
+            if pc_entry.is_fetched:
+                path = pc_entry.package_tarball_full_path
+                st = stat(path)
+                total_size += st.st_size
+                candidates.append((last_used or st.st_mtime, 0, path, st.st_size, pc_entry))
+            if pc_entry.is_extracted:
+                path = pc_entry.extracted_package_dir
+                size, in_use = _measure_extracted_package(self.pkgs_dir, path, store)
+                total_size += size
+                if not in_use:
+                    candidates.append((last_used or stat(path).st_mtime, 1, path, size,
+                                       pc_entry))
+
+        evicted = []
+        for _, _, path, size, pc_entry in sorted(candidates, key=lambda c: c[:3]):
+            if total_size <= max_size:
+                break
+            log.debug("evicting %s from package cache (%d bytes)", path, size)
+            evicted.append((path, size))
+            total_size -= size
+            if not dry_run:
+                rm_rf(path)
+                if not pc_entry.is_fetched and not pc_entry.is_extracted:
+                    del self[pc_entry.dist]
+        return evicted
+
     def scan_for_dist_no_channel(self, dist):
         # type: (Dist) -> PackageCacheEntry
         return next((pc_entry for this_dist, pc_entry in iteritems(self)
@@ -251,24 +452,83 @@ class PackageCache(object):
         pkgs_dir = self.pkgs_dir
         if not isdir(pkgs_dir):
             return
-        pkgs_dir_contents = listdir(pkgs_dir)
-        while pkgs_dir_contents:
-            base_name = pkgs_dir_contents.pop(0)
-            full_path = join(pkgs_dir, base_name)
-            if islink(full_path):
-                continue
-            elif isdir(full_path) and isfile(join(full_path, 'info', 'index.json')):
+        package_filenames = self._read_index()
+        if package_filenames is None:
+            dir_mtime = stat(pkgs_dir).st_mtime
+            package_filenames = self._scan_dir()
+            self._write_index(dir_mtime, package_filenames)
+        for package_filename in package_filenames:
+            self._add_entry(pkgs_dir, package_filename)
+
+    def _scan_dir(self):
+        # type: () -> List[str]
+        # a single pass over the directory; each package is listed once, by tarball filename,
+        #   whether it's present as a tarball, an extracted directory, or both
+        pkgs_dir = self.pkgs_dir
+        if scandir is not None:
+            dir_entries = ((entry.name, entry.is_dir(follow_symlinks=False),
+                            entry.is_file(follow_symlinks=False))
+                           for entry in scandir(pkgs_dir))
+        else:
+            dir_entries = ((base_name, not islink(full_path) and isdir(full_path),
+                            not islink(full_path) and isfile(full_path))
+                           for base_name, full_path in ((bn, join(pkgs_dir, bn))
+                                                        for bn in listdir(pkgs_dir)))
+        package_filenames = []
+        seen = set()
+        for base_name, is_dir, is_file in dir_entries:
+            if is_dir and isfile(join(pkgs_dir, base_name, 'info', 'index.json')):
                 package_filename = base_name + CONDA_TARBALL_EXTENSION
-                self._add_entry(pkgs_dir, package_filename)
-                self._remove_match(pkgs_dir_contents, base_name)
-            elif isfile(full_path) and full_path.endswith(CONDA_TARBALL_EXTENSION):
+            elif is_file and base_name.endswith(CONDA_TARBALL_EXTENSION):
                 package_filename = base_name
-                self._add_entry(pkgs_dir, package_filename)
-                self._remove_match(pkgs_dir_contents, base_name)
+            else:
+                continue
+            if package_filename not in seen:
+                seen.add(package_filename)
+                package_filenames.append(package_filename)
+        return package_filenames
+
+    @property
+    def _index_path(self):
+        return join(self.pkgs_dir, PACKAGE_CACHE_INDEX_FILENAME)
+
+    def _read_index(self):
+        # type: () -> Optional[List[str]]
+        # the result of the last _scan_dir, if the directory hasn't been modified since
+        try:
+            with open(self._index_path) as fh:
+                index = json.load(fh)
+            packages = index['packages']
+            if index['mtime'] == stat(self.pkgs_dir).st_mtime and isinstance(packages, list):
+                return packages
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _write_index(self, dir_mtime, package_filenames):
+        if time() - dir_mtime < 2:
+            # the directory could still change within the resolution of its mtime
+            return
+        index_path = self._index_path
+        if not isfile(index_path):
+            # The first write creates the file, which itself changes the directory's mtime.
+            #   Later writes rewrite it in place, which doesn't.
+            try:
+                open(index_path, 'a').close()
+            except (IOError, OSError):
+                pass
+            return
+        try:
+            with open(index_path, 'w') as fh:
+                json.dump({'mtime': dir_mtime, 'packages': package_filenames}, fh)
+        except (IOError, OSError) as e:
+            log.debug("unable to write package cache index %s\n%r", index_path, e)
 
     def _add_entry(self, pkgs_dir, package_filename):
-        dist = first(self.urls_data, lambda x: x.endswith(package_filename), apply=Dist)
-        if not dist:
+        url = self.urls_data.get_url(package_filename)
+        if url:
+            dist = Dist(url)
+        else:
             dist = Dist.from_string(package_filename, channel_override=UNKNOWN_CHANNEL)
         pc_entry = PackageCacheEntry.make_legacy(pkgs_dir, dist)
         self._packages_map[pc_entry.dist] = pc_entry
@@ -284,17 +544,6 @@ class PackageCache(object):
             self._is_writable = try_write(self.pkgs_dir)
         return self._is_writable
 
-    @staticmethod
-    def _remove_match(pkg_dir_contents, base_name):
-        # pop and return the matching tarball or directory to base_name
-        #   if not match, return None
-        try:
-            pkg_dir_contents.remove(base_name[:-len(CONDA_TARBALL_EXTENSION)]
-                                    if base_name.endswith(CONDA_TARBALL_EXTENSION)
-                                    else base_name + CONDA_TARBALL_EXTENSION)
-        except ValueError:
-            pass
-
     @staticmethod
     def _clean_tarball_path_and_get_md5sum(tarball_path, md5sum=None):
         if tarball_path.startswith('file:/'):
@@ -302,7 +551,7 @@ class PackageCache(object):
         tarball_full_path = expand(tarball_path)
 
         if isfile(tarball_full_path) and md5sum is None:
-            md5sum = compute_md5sum(tarball_full_path)
+            md5sum = cached_md5sum(tarball_full_path)
 
         return tarball_full_path, md5sum
 
@@ -344,6 +593,34 @@ class PackageCache(object):
         return "%s(%s)" % (self.__class__.__name__, ', '.join(args))
 
 
+def _measure_extracted_package(pkgs_dir, extracted_package_dir, store=None):
+    # returns the size of an extracted package, and whether any of its files are hardlinked
+    #   into an environment, i.e. have more links than the package caches and store account for
+    cross_platform_st_nlink = CrossPlatformStLink()
+    size, in_use = 0, False
+    for root, dirs, files in walk(extracted_package_dir):
+        for fn in files:
+            path = join(root, fn)
+            try:
+                size += lstat(path).st_size
+                if not in_use:
+                    st_nlink = cross_platform_st_nlink(path)
+                    in_use = st_nlink > 1 and (store is None or st_nlink > store.count_links(
+                        context.pkgs_dirs, pkgs_dir, path))
+            except (IOError, OSError) as e:
+                log.debug("%r", e)
+                in_use = True
+    return size, in_use
+
+
+def cached_md5sum(tarball_full_path):
+    # the digest recorded for a tarball that lives in a package cache directory
+    pkgs_dir = dirname(tarball_full_path)
+    if pkgs_dir in context.pkgs_dirs:
+        return PackageCache(pkgs_dir).digests_data.compute_digest(tarball_full_path)
+    return compute_md5sum(tarball_full_path)
+
+
 # ##############################
 # downloading
 # ##############################
@@ -433,6 +710,9 @@ class ProgressiveFetchExtract(object):
 
         self.cache_actions = ()
         self.extract_actions = ()
+        self.paired_actions = ()
+        self.estimate = None
+        self.measured = None
 
         self._prepared = False
 
@@ -446,8 +726,10 @@ class ProgressiveFetchExtract(object):
             cache_actions, extract_actions = zip(*paired_actions)
             self.cache_actions = tuple(ca for ca in cache_actions if ca)
             self.extract_actions = tuple(ea for ea in extract_actions if ea)
+            self.paired_actions = tuple(self._pipeline(ca, ea) for ca, ea in paired_actions
+                                        if ca or ea)
         else:
-            self.cache_actions = self.extract_actions = ()
+            self.cache_actions = self.extract_actions = self.paired_actions = ()
 
         log.debug("prepared package cache actions:\n"
                   "  cache_actions:\n"
@@ -457,25 +739,174 @@ class ProgressiveFetchExtract(object):
                   '\n    '.join(text_type(ca) for ca in self.cache_actions),
                   '\n    '.join(text_type(ea) for ea in self.extract_actions))
 
+        sizes = dict((dist.to_filename(), self.index[dist].get('size') or 0)
+                     for dist in self.link_dists)
+        downloads = tuple(ca for ca in self.cache_actions if not ca.url.startswith('file:/'))
+        self.estimate = {
+            'download_packages': len(downloads),
+            'download_bytes': sum(sizes.get(ca.target_package_basename, 0) for ca in downloads),
+            'extract_packages': len(self.extract_actions),
+            # tarballs that are already on disk are measured, rather than taken from the index
+            'extract_bytes': sum(getsize(ea.source_full_path) if isfile(ea.source_full_path)
+                                 else sizes.get(basename(ea.source_full_path), 0)
+                                 for ea in self.extract_actions),
+        }
+
         self._prepared = True
 
+    @staticmethod
+    def _pipeline(cache_action, extract_action):
+        # With context.stream_extract, a package that has to be downloaded is extracted straight
+        #   from the download stream, rather than read back from disk once it's been written.
+        if (context.stream_extract and cache_action and extract_action
+                and not cache_action.url.startswith('file:/')
+                and extract_action.source_full_path == cache_action.target_full_path):
+            return CacheUrlAndExtractAction(cache_action, extract_action), None
+        return cache_action, extract_action
+
     def execute(self):
         if not self._prepared:
             self.prepare()
 
-        for action in concatv(self.cache_actions, self.extract_actions):
-            self._execute_action(action)
+        start_time = time()
+        self._execute_paired_actions(self.paired_actions)
+        downloads = tuple(ca for ca in self.cache_actions if not ca.url.startswith('file:/'))
+        self.measured = {
+            'download_bytes': sum(getsize(ca.target_full_path) for ca in downloads
+                                  if isfile(ca.target_full_path)),
+            'extract_bytes': sum(getsize(ea.source_full_path) for ea in self.extract_actions
+                                 if isfile(ea.source_full_path)),
+            'fetch_extract_seconds': time() - start_time,
+        }
+
+    def _execute_paired_actions(self, paired_actions):
+        # Packages are fetched through a DownloadScheduler, on up to context.fetch_threads
+        #   connections queued per host, largest first.  Each one is extracted as soon as its
+        #   own download completes, overlapping with the downloads still running.
+        #   With context.extract_processes above 1, extraction is handed to a pool of that many
+        #   processes, since bz2 decompression in tarfile only ever gets one core; 0 means one per
+        #   cpu.  Every package is run to completion
+        #   before any errors are raised, in the order of paired_actions, regardless of the order
+        #   in which they finished.
+        extract_count = sum(1 for _, extract_action in paired_actions if extract_action)
+        extract_workers = min(context.extract_processes or cpu_count(), extract_count)
+        extract_executor = self._make_extract_executor(extract_workers)
+        workers = min(len(paired_actions),
+                      max(context.fetch_threads, extract_workers if extract_executor else 1))
+        scheduler = DownloadScheduler.from_context()
+        executor = None
+        if workers > 1:
+            try:
+                from concurrent.futures import ThreadPoolExecutor
+                executor = ThreadPoolExecutor(workers)
+            except (ImportError, RuntimeError) as e:
+                # concurrent.futures is only available in Python >= 3.2 or if futures is installed
+                # RuntimeError is thrown if number of threads are limited by OS
+                log.debug(repr(e))
+        if executor is None:
+            if extract_executor:
+                extract_executor.shutdown(wait=True)
+            try:
+                for cache_action, extract_action in paired_actions:
+                    self._execute_paired_action(cache_action, extract_action,
+                                                scheduler=scheduler)
+            finally:
+                scheduler.shutdown(wait=True)
+            return
+
+        fetching = tuple(ca for ca, _ in paired_actions if ca)
+        sizes = dict((dist.to_filename(), self.index[dist].get('size') or 0)
+                     for dist in self.link_dists)
+        total_bytes = sum(sizes.get(action.target_package_basename, 0) for action in fetching)
+        progress = FetchProgress(len(fetching), total_bytes, scheduler)
+        try:
+            futures = tuple(self._submit_paired_action(
+                executor, scheduler, cache_action, extract_action,
+                cache_action and sizes.get(cache_action.target_package_basename, 0),
+                progress.make_update_callback(), extract_executor)
+                for cache_action, extract_action in paired_actions)
+            exceptions = []
+            for future in futures:
+                try:
+                    future.result()
+                except CondaMultiError as e:
+                    exceptions.extend(e.errors)
+                except Exception as e:
+                    exceptions.append(e)
+        finally:
+            scheduler.shutdown(wait=True)
+            executor.shutdown(wait=True)
+            if extract_executor:
+                extract_executor.shutdown(wait=True)
+            progress.stop()
+        if exceptions:
+            raise CondaMultiError(exceptions)
 
     @staticmethod
-    def _execute_action(action):
+    def _make_extract_executor(workers):
+        if workers > 1:
+            try:
+                from concurrent.futures import ProcessPoolExecutor
+                try:
+                    # The pool's workers are started lazily, from the download threads.  Forking
+                    #   there could copy locks held by other threads into the children, so they're
+                    #   started by a server process instead, where that's available.
+                    from multiprocessing import get_context
+                    return ProcessPoolExecutor(workers, mp_context=get_context('forkserver'))
+                except (ImportError, TypeError, ValueError):
+                    # python < 3.7, or a platform without forkserver, e.g. windows, where
+                    #   processes are spawned anyway
+                    return ProcessPoolExecutor(workers)
+            except (ImportError, NotImplementedError, OSError) as e:
+                # NotImplementedError or OSError if the platform can't do multiprocessing,
+                #   e.g. there's no working sem_open
+                log.debug(repr(e))
+        return None
+
+    @classmethod
+    def _submit_paired_action(cls, executor, scheduler, cache_action, extract_action, size,
+                              progress_update_callback, extract_executor):
+        # a future for the whole pair; a package that failed to download isn't extracted
+        if not cache_action:
+            return executor.submit(cls._execute_paired_action, None, extract_action,
+                                   extract_executor=extract_executor)
+        fetch_future = scheduler.submit(cache_action.url, size,
+                                        partial(cls._execute_action, cache_action),
+                                        progress_update_callback)
+        if not extract_action:
+            return fetch_future
+        return _chain_future(fetch_future, executor, cls._execute_paired_action, None,
+                             extract_action, extract_executor=extract_executor)
+
+    @classmethod
+    def _execute_paired_action(cls, cache_action, extract_action, progress_update_callback=None,
+                               extract_executor=None, scheduler=None):
+        # a package that failed to download raises here, and isn't extracted
+        if cache_action and scheduler is not None:
+            # still subject to the scheduler's bandwidth caps, without its threads
+            scheduler.run(cache_action.url, partial(cls._execute_action, cache_action),
+                          progress_update_callback)
+        elif cache_action:
+            cls._execute_action(cache_action, progress_update_callback)
+        if extract_action:
+            if extract_executor is None:
+                cls._execute_action(extract_action)
+            else:
+                cls._execute_action(extract_action, executor=extract_executor)
+
+    @staticmethod
+    def _execute_action(action, progress_update_callback=None, **execute_kwargs):
         if not action.verified:
             action.verify()
 
+        if progress_update_callback is not None:
+            execute_kwargs['progress_update_callback'] = progress_update_callback
+
         max_tries = 3
         exceptions = []
         for q in range(max_tries):
             try:
-                action.execute()
+                action.execute(**execute_kwargs)
             except Exception as e:
                 log.debug("Error in action %s", action)
                 log.debug(format_exc())
@@ -495,6 +926,88 @@ class ProgressiveFetchExtract(object):
         return hash(self) == hash(other)
 
 
+def _chain_future(future, executor, fn, *args, **kwargs):
+    # A future for fn(*args, **kwargs), submitted to executor once future has succeeded.  If
+    #   future fails instead, so does the chained future, with the same exception.
+    from concurrent.futures import Future
+    chained = Future()
+
+    def copy_outcome(done):
+        exception = done.exception()
+        if exception is not None:
+            chained.set_exception(exception)
+        else:
+            chained.set_result(done.result())
+
+    def submit(done):
+        if done.exception() is not None:
+            copy_outcome(done)
+        else:
+            executor.submit(fn, *args, **kwargs).add_done_callback(copy_outcome)
+
+    future.add_done_callback(submit)
+    return chained
+
+
+class FetchProgress(object):
+    """Aggregate the progress of concurrent downloads into a single fetch.start/update/stop run.
+
+    Each download reports through its own callback from make_update_callback(), with the bytes
+    streamed so far for the current attempt, so a retried download rewinds its own share.
+
+    Given the DownloadScheduler running the downloads, the scheduler's queue depth and
+    throughput are also logged to fetch.status, at most every status_interval seconds, as a
+    label for the progress bar and a dict of queued, active and bytes_per_second.
+    """
+    status_interval = 0.5
+
+    def __init__(self, package_count, total_bytes, scheduler=None):
+        self.total_bytes = total_bytes
+        self.streamed_bytes = 0
+        self._lock = Lock()
+        self._started = False
+        self._label = "%d packages" % package_count
+        self._scheduler = scheduler
+        self._status_logged_at = None
+
+    def make_update_callback(self):
+        last_streamed = [0]
+
+        def progress_update_callback(streamed_bytes, content_length):
+            with self._lock:
+                self.streamed_bytes += streamed_bytes - last_streamed[0]
+                last_streamed[0] = streamed_bytes
+                if not self._started:
+                    self._started = True
+                    getLogger('fetch.start').info((self._label, self.total_bytes))
+                self._log_status()
+                if self.total_bytes:
+                    getLogger('fetch.update').info(max(0, min(self.streamed_bytes,
+                                                              self.total_bytes)))
+        return progress_update_callback
+
+    def _log_status(self):
+        now = time()
+        if self._scheduler is None or (self._status_logged_at is not None and
+                                       now - self._status_logged_at < self.status_interval):
+            return
+        self._status_logged_at = now
+        stats = self._scheduler.stats()
+        status = dict((key, stats[key]) for key in ('queued', 'active', 'bytes_per_second'))
+        if status['queued']:
+            label = "%s (%d queued, %d active)" % (self._label, status['queued'],
+                                                   status['active'])
+        else:
+            label = "%s (%d active)" % (self._label, status['active'])
+        getLogger('fetch.status').info((label, status))
+
+    def stop(self):
+        with self._lock:
+            if self._started:
+                getLogger('fetch.stop').info(None)
+                self._started = False
+
+
 # ##############################
 # backward compatibility
 # ##############################
@@ -511,4 +1024,4 @@ def rm_fetched(dist):
 
 def download(url, dst_path, session=None, md5=None, urlstxt=False, retries=3):
     from ..gateways.download import download as gateway_download
-    gateway_download(url, dst_path, md5)
+    return gateway_download(url, dst_path, md5)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from filecmp import cmp
+from logging import getLogger
+import os
+from os import listdir, lstat, walk
+from os.path import basename, dirname, isdir, isfile, islink, join, relpath
+
+from .portability import PREFIX_OFFSETS_FILENAME
+from .._vendor.auxlib.path import expand
+from ..base.constants import CONDA_TARBALL_EXTENSION
+from ..base.context import context
+from ..common.compat import on_win
+from ..gateways.disk.create import create_link, mkdir_p
+from ..gateways.disk.delete import rm_rf
+from ..gateways.disk.read import PACKAGE_MANIFEST_FILENAME
+from ..gateways.disk.update import backoff_rename
+from ..models.enums import LinkType
+
+log = getLogger(__name__)
+
+# files conda writes into its own copy of an extracted package, and may rewrite in place; they
+#   aren't the package's, so they're never shared through the store
+_CONDA_WRITTEN_PATHS = frozenset(join('info', fn) for fn in (PREFIX_OFFSETS_FILENAME,
+                                                             PACKAGE_MANIFEST_FILENAME))
+
+
+class PackageStore(object):
+    """A content-addressed store of package tarballs and extracted packages.
+
+    Packages are keyed by the md5 of their tarball, and kept as
+    <store_dir>/<dist_name>/<md5>.tar.bz2 and <store_dir>/<dist_name>/<md5>/.  Package caches
+    backed by the store expose them with hardlinks, so a package cached in several pkgs_dirs,
+    or from several channels, only takes up disk space once.
+
+    The store is best effort.  Anything that can't be hardlinked, e.g. because it's on another
+    filesystem, is just left as a separate copy.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+
+    @classmethod
+    def get(cls):
+        # the store configured by pkgs_store_dir, or None
+        if not context.pkgs_store_dir:
+            return None
+        return cls(expand(context.pkgs_store_dir))
+
+    def tarball_path(self, dist_name, md5sum):
+        return join(self.store_dir, dist_name, md5sum + CONDA_TARBALL_EXTENSION)
+
+    def extracted_path(self, dist_name, md5sum):
+        return join(self.store_dir, dist_name, md5sum)
+
+    def has_tarball(self, tarball_full_path, md5sum):
+        return isfile(self.tarball_path(_dist_name(tarball_full_path), md5sum))
+
+    def link_tarball(self, tarball_full_path, md5sum):
+        """Hardlink the stored tarball with md5sum to tarball_full_path.
+
+        Returns False if the store doesn't have it, or it can't be linked.
+        """
+        stored_path = self.tarball_path(_dist_name(tarball_full_path), md5sum)
+        if not isfile(stored_path):
+            return False
+        try:
+            create_link(stored_path, tarball_full_path, LinkType.hardlink)
+        except (IOError, OSError) as e:
+            log.debug("cannot link %s from package store\n  %r", tarball_full_path, e)
+            return False
+        log.debug("linked %s from package store", tarball_full_path)
+        return True
+
+    def add_tarball(self, tarball_full_path, md5sum, replace=True):
+        """Back a cached tarball with the store, and return the number of bytes deduplicated.
+
+        The first copy of a tarball is linked into the store.  Later copies are replaced by a
+        link to the stored one, unless replace is False.
+        """
+        stored_path = self.tarball_path(_dist_name(tarball_full_path), md5sum)
+        return _share_file(tarball_full_path, stored_path, replace)
+
+    def link_extracted(self, dist_name, md5sum, target_directory):
+        """Recreate the stored extracted package with md5sum at target_directory, by hardlinks.
+
+        Returns False if the store doesn't have it, or it can't be linked.
+        """
+        stored_path = self.extracted_path(dist_name, md5sum)
+        if not isdir(stored_path):
+            return False
+        try:
+            _link_tree(stored_path, target_directory)
+        except (IOError, OSError) as e:
+            log.debug("cannot link %s from package store\n  %r", target_directory, e)
+            rm_rf(target_directory)
+            return False
+        log.debug("linked %s from package store", target_directory)
+        return True
+
+    def add_extracted(self, extracted_directory, md5sum, replace=True):
+        """Back an extracted package with the store, and return the number of bytes deduplicated.
+
+        Like add_tarball(), but for every file in the extracted package.
+        """
+        stored_path = self.extracted_path(basename(extracted_directory), md5sum)
+        if not isdir(stored_path):
+            temp_path = stored_path + '.s~'
+            try:
+                rm_rf(temp_path)
+                _link_tree(extracted_directory, temp_path, skip=_CONDA_WRITTEN_PATHS)
+                backoff_rename(temp_path, stored_path)
+            except (IOError, OSError) as e:
+                log.debug("cannot add %s to package store\n  %r", extracted_directory, e)
+                rm_rf(temp_path)
+            return 0
+
+        deduplicated = 0
+        for path, relative_path in _iter_files(extracted_directory):
+            if relative_path not in _CONDA_WRITTEN_PATHS:
+                deduplicated += _share_file(path, join(stored_path, relative_path), replace)
+        return deduplicated
+
+    def scan(self, pkgs_dirs=None):
+        """Add every package in pkgs_dirs to the store, and return the bytes deduplicated.
+
+        Read-only package caches are added first, without modifying them, so that the copies
+        in writable caches can be replaced by links to theirs.
+        """
+        from .package_cache import PackageCache
+        if pkgs_dirs is None:
+            pkgs_dirs = context.pkgs_dirs
+        package_caches = [PackageCache(pkgs_dir) for pkgs_dir in pkgs_dirs if isdir(pkgs_dir)]
+        package_caches.sort(key=lambda package_cache: package_cache.is_writable)
+
+        deduplicated = 0
+        for package_cache in package_caches:
+            replace = package_cache.is_writable
+            for pc_entry in package_cache.values():
+                if not pc_entry.is_fetched:
+                    # without the tarball, there's no key to store the package under
+                    continue
+                md5sum = pc_entry.md5sum()
+                deduplicated += self.add_tarball(pc_entry.package_tarball_full_path, md5sum,
+                                                 replace)
+                if pc_entry.is_extracted:
+                    deduplicated += self.add_extracted(pc_entry.extracted_package_dir, md5sum,
+                                                       replace)
+        return deduplicated
+
+    def stats(self, pkgs_dirs=None):
+        """Count the packages in the store, and the bytes that pkgs_dirs share through it.
+
+        deduplicated_bytes is what the package caches would take up beyond stored_bytes, if
+        each had its own copy of the files they link from the store.
+        """
+        if pkgs_dirs is None:
+            pkgs_dirs = context.pkgs_dirs
+        keys = set()
+        stored_bytes = deduplicated_bytes = 0
+        for dist_name, entry, files in self._iter_stored():
+            keys.add((dist_name, entry.replace(CONDA_TARBALL_EXTENSION, '')))
+            for path, cache_relative_path in files:
+                st = lstat(path)
+                cache_links = _count_same_file(st, (join(pkgs_dir, cache_relative_path)
+                                                    for pkgs_dir in pkgs_dirs))
+                stored_bytes += st.st_size
+                deduplicated_bytes += st.st_size * max(cache_links - 1, 0)
+        return {
+            'packages': len(keys),
+            'stored_bytes': stored_bytes,
+            'deduplicated_bytes': deduplicated_bytes,
+        }
+
+    def count_links(self, pkgs_dirs, pkgs_dir, path):
+        """The number of hardlinks to path, a file in a cache, that are package cache links.
+
+        That's path itself, any other package caches sharing the file, and the store, so links
+        into environments are the ones beyond this count.
+        """
+        st = lstat(path)
+        cache_relative_path = relpath(path, pkgs_dir)
+        dist_name, package_relative_path = _split_first(cache_relative_path)
+        candidates = [join(pd, cache_relative_path) for pd in pkgs_dirs]
+        store_package_dir = join(self.store_dir, dist_name)
+        if isdir(store_package_dir):
+            for entry in listdir(store_package_dir):
+                if package_relative_path:
+                    candidates.append(join(store_package_dir, entry, package_relative_path))
+                elif entry.endswith(CONDA_TARBALL_EXTENSION):
+                    candidates.append(join(store_package_dir, entry))
+        return max(_count_same_file(st, candidates), 1)
+
+    def _iter_stored(self):
+        # yields (dist_name, entry, files), with files as (stored path, path relative to a cache)
+        if not isdir(self.store_dir):
+            return
+        for dist_name in listdir(self.store_dir):
+            package_dir = join(self.store_dir, dist_name)
+            if not isdir(package_dir):
+                continue
+            for entry in listdir(package_dir):
+                path = join(package_dir, entry)
+                if entry.endswith(CONDA_TARBALL_EXTENSION):
+                    yield dist_name, entry, ((path, dist_name + CONDA_TARBALL_EXTENSION),)
+                elif isdir(path) and not entry.endswith('.s~'):
+                    yield dist_name, entry, ((file_path, join(dist_name, relative_path))
+                                             for file_path, relative_path in _iter_files(path))
+
+
+def _dist_name(tarball_full_path):
+    return basename(tarball_full_path)[:-len(CONDA_TARBALL_EXTENSION)]
+
+
+def _split_first(relative_path):
+    parts = relative_path.split(os.sep, 1)
+    return parts[0], parts[1] if len(parts) > 1 else ''
+
+
+def _iter_files(directory):
+    # regular files only; symlinks are cheap to keep as copies
+    for root, dirs, files in walk(directory):
+        for fn in files:
+            path = join(root, fn)
+            if not islink(path):
+                yield path, relpath(path, directory)
+
+
+def _count_same_file(st, paths):
+    count = 0
+    for path in paths:
+        try:
+            other = lstat(path)
+        except (IOError, OSError):
+            continue
+        if (other.st_dev, other.st_ino) == (st.st_dev, st.st_ino):
+            count += 1
+    return count
+
+
+def _share_file(path, stored_path, replace):
+    # Link a first copy of a file into the store, or replace path with a link to the stored copy.
+    try:
+        st = lstat(path)
+        try:
+            stored_st = lstat(stored_path)
+        except (IOError, OSError):
+            mkdir_p(dirname(stored_path))
+            create_link(path, stored_path, LinkType.hardlink)
+            return 0
+        if (st.st_dev, st.st_ino) == (stored_st.st_dev, stored_st.st_ino):
+            return 0
+        if not replace or st.st_size != stored_st.st_size:
+            return 0
+        if not cmp(path, stored_path, shallow=False):
+            # either copy may have been changed in place; it mustn't spread to the other
+            log.debug("not sharing %s with package store; its content differs", path)
+            return 0
+        temp_path = path + '.s~'
+        rm_rf(temp_path)
+        create_link(stored_path, temp_path, LinkType.hardlink)
+        if on_win:
+            rm_rf(path)
+        backoff_rename(temp_path, path)
+        return st.st_size
+    except (IOError, OSError) as e:
+        log.debug("cannot share %s with package store\n  %r", path, e)
+        return 0
+
+
+def _link_tree(source_directory, target_directory, skip=()):
+    # skip is a set of paths relative to source_directory
+    for root, dirs, files in walk(source_directory):
+        target_root = join(target_directory, relpath(root, source_directory))
+        mkdir_p(target_root)
+        for name in files + [dn for dn in dirs if islink(join(root, dn))]:
+            source_path, target_path = join(root, name), join(target_root, name)
+            if relpath(source_path, source_directory) in skip:
+                continue
+            if islink(source_path):
+                os.symlink(os.readlink(source_path), target_path)
+            else:
+                create_link(source_path, target_path, LinkType.hardlink)
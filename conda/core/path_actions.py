@@ -4,12 +4,14 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 from abc import ABCMeta, abstractmethod, abstractproperty
 import json
 from logging import getLogger
-from os.path import dirname, join
+from os.path import basename, dirname, join
 import re
 
 from .linked_data import delete_linked_data, get_python_version_for_prefix, load_linked_data
-from .portability import _PaddingError, update_prefix
-from .. import CONDA_PACKAGE_ROOT
+from .package_store import PackageStore
+from .portability import (_PaddingError, read_prefix_offsets, recorded_prefix_offsets,
+                          try_write_prefix_offsets, update_prefix)
+from .. import CONDA_PACKAGE_ROOT, CondaError
 from .._vendor.auxlib.compat import with_metaclass
 from .._vendor.auxlib.ish import dals
 from ..base.context import context
@@ -20,16 +22,17 @@ from ..common.path import (get_bin_directory_short_path, get_leaf_directories,
                            win_path_ok)
 from ..common.url import path_to_url
 from ..exceptions import CondaUpgradeError, CondaVerificationError, PaddingError
-from ..gateways.disk.create import (compile_pyc, create_hard_link_or_copy, create_link,
+from ..gateways.disk.create import (compile_multiple_pyc, compile_pyc, create_hard_link_or_copy,
+                                    create_link,
                                     create_private_envs_meta, create_private_pkg_entry_point,
                                     create_unix_python_entry_point,
                                     create_windows_python_entry_point, extract_tarball,
                                     make_menu, remove_private_envs_meta,
-                                    write_linked_package_record)
+                                    try_write_package_manifest, write_linked_package_record)
 from ..gateways.disk.delete import rm_rf, try_rmdir_all_empty
-from ..gateways.disk.read import compute_md5sum, isfile, islink, lexists
+from ..gateways.disk.read import isfile, islink, lexists
 from ..gateways.disk.update import backoff_rename
-from ..gateways.download import download
+from ..gateways.download import download, download_and_extract
 from ..models.dist import Dist
 from ..models.enums import LinkType, PathType
 from ..models.index_record import IndexRecord, Link
@@ -46,6 +49,7 @@ REPR_IGNORE_KWARGS = (
     'transaction_context',
     'package_info',
     'hold_path',
+    'prefix_offsets',
 )
 
 @with_metaclass(ABCMeta)
@@ -135,6 +139,8 @@ class LinkPathAction(CreateInPrefixPathAction):
     @classmethod
     def create_file_link_actions(cls, transaction_context, package_info, target_prefix,
                                  requested_link_type):
+        prefix_offsets = read_prefix_offsets(package_info.extracted_package_dir)
+
         def make_file_link_action(source_path_info):
             # TODO: this inner function is still kind of a mess
             noarch = package_info.package_metadata and package_info.package_metadata.noarch
@@ -171,7 +177,8 @@ class LinkPathAction(CreateInPrefixPathAction):
                                                package_info.extracted_package_dir,
                                                source_path_info.path,
                                                target_prefix, target_short_path,
-                                               placeholder, fmode)
+                                               placeholder, fmode,
+                                               prefix_offsets.get(source_path_info.path))
             else:
                 return LinkPathAction(transaction_context, package_info,
                                       package_info.extracted_package_dir, source_path_info.path,
@@ -222,6 +229,11 @@ class LinkPathAction(CreateInPrefixPathAction):
         self._verified = True
 
     def execute(self):
+        if (self.link_type == LinkType.directory and self.target_short_path
+                in self.transaction_context.get('made_directories', ())):
+            # made already, along with the rest of the transaction's directories
+            self._execute_successful = True
+            return
         log.trace("linking %s => %s", self.source_full_path, self.target_full_path)
         create_link(self.source_full_path, self.target_full_path, self.link_type,
                     force=context.force)
@@ -240,13 +252,16 @@ class PrefixReplaceLinkAction(LinkPathAction):
 
     def __init__(self, transaction_context, package_info,
                  extracted_package_dir, source_short_path,
-                 target_prefix, target_short_path, prefix_placeholder, file_mode):
+                 target_prefix, target_short_path, prefix_placeholder, file_mode,
+                 prefix_offsets=None):
         super(PrefixReplaceLinkAction, self).__init__(transaction_context, package_info,
                                                       extracted_package_dir, source_short_path,
                                                       target_prefix, target_short_path,
                                                       LinkType.copy)
         self.prefix_placeholder = prefix_placeholder
         self.file_mode = file_mode
+        # this file's entry from the package's info/prefix_offsets.json, if it has one
+        self.prefix_offsets = prefix_offsets
 
     def verify(self):
         if not (self.prefix_placeholder or self.file_mode):
@@ -277,8 +292,10 @@ class PrefixReplaceLinkAction(LinkPathAction):
 
         try:
             log.trace("rewriting prefixes in %s", self.target_full_path)
+            offsets = recorded_prefix_offsets(self.prefix_offsets, self.source_full_path,
+                                              self.prefix_placeholder)
             update_prefix(self.target_full_path, self.target_prefix, self.prefix_placeholder,
-                          self.file_mode)
+                          self.file_mode, offsets)
         except _PaddingError:
             raise PaddingError(self.target_full_path, self.prefix_placeholder,
                                len(self.prefix_placeholder))
@@ -335,12 +352,15 @@ class CompilePycAction(CreateInPrefixPathAction):
                                                target_prefix, target_short_path)
         self._execute_successful = False
 
-    def execute(self):
-        log.trace("compiling %s", self.target_full_path)
+    @property
+    def python_full_path(self):
         target_python_version = self.transaction_context['target_python_version']
         python_short_path = get_python_short_path(target_python_version)
-        python_full_path = join(self.target_prefix, win_path_ok(python_short_path))
-        compile_pyc(python_full_path, self.source_full_path, self.target_full_path)
+        return join(self.target_prefix, win_path_ok(python_short_path))
+
+    def execute(self):
+        log.trace("compiling %s", self.target_full_path)
+        compile_pyc(self.python_full_path, self.source_full_path, self.target_full_path)
         self._execute_successful = True
 
     def reverse(self):
@@ -349,6 +369,60 @@ class CompilePycAction(CreateInPrefixPathAction):
             rm_rf(self.target_full_path)
 
 
+class CompileMultiPycAction(PathAction):
+    # Compiles all of a package's pyc files with compile_multiple_pyc(), instead of starting an
+    #   interpreter per file.  Each file keeps its CompilePycAction, which records whether that
+    #   one pyc file was written, so reverse() removes exactly the pyc files that were created.
+
+    @classmethod
+    def create_actions(cls, transaction_context, package_info, target_prefix, requested_link_type,
+                       file_link_actions):
+        compile_pyc_actions = CompilePycAction.create_actions(transaction_context, package_info,
+                                                              target_prefix, requested_link_type,
+                                                              file_link_actions)
+        return (cls(compile_pyc_actions),) if compile_pyc_actions else ()
+
+    def __init__(self, compile_pyc_actions):
+        self.compile_pyc_actions = compile_pyc_actions
+
+    def verify(self):
+        self._verified = True
+
+    def execute(self):
+        log.trace("compiling %d pyc files", len(self.compile_pyc_actions))
+        axns = self.compile_pyc_actions
+        failures = compile_multiple_pyc(axns[0].python_full_path,
+                                        tuple(axn.source_full_path for axn in axns),
+                                        tuple(axn.target_full_path for axn in axns))
+        for axn in axns:
+            axn._execute_successful = axn.target_full_path not in failures
+        if failures:
+            raise CondaError("%(count)d pyc files failed to compile\n%(failures)s",
+                             count=len(failures),
+                             failures='\n'.join("  %s\n    %s" % (path, message.strip())
+                                                for path, message in sorted(failures.items())))
+
+    def reverse(self):
+        for axn in reversed(self.compile_pyc_actions):
+            axn.reverse()
+        # py_compile creates __pycache__ directories itself, so nothing else will remove them
+        for pycache_dir in set(dirname(axn.target_full_path) for axn in self.compile_pyc_actions):
+            if basename(pycache_dir) == '__pycache__':
+                try_rmdir_all_empty(pycache_dir)
+
+    def cleanup(self):
+        pass
+
+    @property
+    def target_short_paths(self):
+        return tuple(axn.target_short_path for axn in self.compile_pyc_actions)
+
+    @property
+    def target_full_path(self):
+        # there's one for each pyc file
+        return None
+
+
 class CreatePythonEntryPointAction(CreateInPrefixPathAction):
 
     @classmethod
@@ -680,11 +754,12 @@ class CacheUrlAction(PathAction):
         assert '::' not in self.url
         self._verified = True
 
-    def execute(self):
+    def execute(self, progress_update_callback=None):
         # I hate inline imports, but I guess it's ok since we're importing from the conda.core
         # The alternative is passing the PackageCache class to CacheUrlAction __init__
-        from .package_cache import PackageCache
+        from .package_cache import PackageCache, cached_md5sum
         target_package_cache = PackageCache(self.target_pkgs_dir)
+        store = PackageStore.get()
 
         log.trace("caching url %s => %s", self.url, self.target_full_path)
 
@@ -704,6 +779,12 @@ class CacheUrlAction(PathAction):
                 # if url points to another package cache, link to the writable cache
                 create_hard_link_or_copy(source_path, self.target_full_path)
                 source_package_cache = PackageCache(dirname(source_path))
+                source_md5sum = source_package_cache.digests_data.get_digest(source_path)
+                if source_md5sum:
+                    target_package_cache.digests_data.add_digest(self.target_full_path,
+                                                                 source_md5sum)
+                    if store:
+                        store.add_tarball(self.target_full_path, source_md5sum)
 
                 # the package is already in a cache, so it came from a remote url somewhere;
                 #   make sure that remote url is the most recent url in the
@@ -718,13 +799,15 @@ class CacheUrlAction(PathAction):
                 #   record that url as the remote source url in urls.txt
                 # we do the search part of this operation before the create_link so that we
                 #   don't md5sum-match the file created by 'create_link'
-                source_md5sum = compute_md5sum(source_path)
+                source_md5sum = cached_md5sum(source_path)
                 pc_entry = PackageCache.tarball_file_in_cache(source_path, source_md5sum)
                 origin_url = pc_entry.get_urls_txt_value() if pc_entry else None
 
                 # copy the tarball to the writable cache
                 create_link(source_path, self.target_full_path, link_type=LinkType.copy,
                             force=context.force)
+                target_package_cache.digests_data.add_digest(self.target_full_path,
+                                                             source_md5sum)
 
                 if origin_url and Dist(origin_url).is_channel:
                     target_package_cache.urls_data.add_url(origin_url)
@@ -732,7 +815,15 @@ class CacheUrlAction(PathAction):
                     target_package_cache.urls_data.add_url(self.url)
 
         else:
-            download(self.url, self.target_full_path, self.md5sum)
+            if self.md5sum and store and store.link_tarball(self.target_full_path, self.md5sum):
+                # the same tarball was already cached, maybe from another channel
+                md5sum = self.md5sum
+            else:
+                md5sum = download(self.url, self.target_full_path, self.md5sum,
+                                  progress_update_callback)
+                if store:
+                    store.add_tarball(self.target_full_path, md5sum)
+            target_package_cache.digests_data.add_digest(self.target_full_path, md5sum)
             target_package_cache.urls_data.add_url(self.url)
 
     def reverse(self):
@@ -763,18 +854,49 @@ class ExtractPackageAction(PathAction):
     def verify(self):
         self._verified = True
 
-    def execute(self):
-        # I hate inline imports, but I guess it's ok since we're importing from the conda.core
-        # The alternative is passing the the classes to ExtractPackageAction __init__
-        from .package_cache import PackageCache, PackageCacheEntry
+    def execute(self, executor=None):
+        # The package is extracted next to target_full_path, and renamed into place once it's
+        #   complete.  An executor can be given to run the extraction somewhere else, e.g. in a
+        #   process pool; it's waited on before the rename.
         log.trace("extracting %s => %s", self.source_full_path, self.target_full_path)
 
         if lexists(self.hold_path):
             rm_rf(self.hold_path)
         if lexists(self.target_full_path):
             backoff_rename(self.target_full_path, self.hold_path)
-        extract_tarball(self.source_full_path, self.target_full_path)
 
+        store = PackageStore.get()
+        md5sum = store and self.source_md5sum()
+        extract_directory = self.target_full_path + '.x~'
+        rm_rf(extract_directory)
+        try:
+            if md5sum and store.link_extracted(self.target_extracted_dirname, md5sum,
+                                               extract_directory):
+                pass
+            else:
+                if executor is None:
+                    extract_tarball(self.source_full_path, extract_directory)
+                else:
+                    executor.submit(extract_tarball, self.source_full_path,
+                                    extract_directory).result()
+                try_write_prefix_offsets(extract_directory)
+                try_write_package_manifest(extract_directory)
+            backoff_rename(extract_directory, self.target_full_path)
+        finally:
+            rm_rf(extract_directory)
+        if md5sum:
+            store.add_extracted(self.target_full_path, md5sum)
+        self.add_package_cache_entry()
+
+    def source_md5sum(self):
+        # only what's already recorded; the tarball isn't hashed again just for this
+        from .package_cache import PackageCache
+        return PackageCache(self.target_pkgs_dir).digests_data.get_digest(self.source_full_path)
+
+    def add_package_cache_entry(self):
+        # I hate inline imports, but I guess it's ok since we're importing from the conda.core
+        # The alternative is passing the the classes to ExtractPackageAction __init__
+        from .package_cache import PackageCache, PackageCacheEntry
         target_package_cache = PackageCache(self.target_pkgs_dir)
 
         recorded_url = target_package_cache.urls_data.get_url(self.source_full_path)
@@ -798,3 +920,81 @@ class ExtractPackageAction(PathAction):
     def __str__(self):
         return ('ExtractPackageAction<source_full_path=%r, target_full_path=%r>'
                 % (self.source_full_path, self.target_full_path))
+
+
+class CacheUrlAndExtractAction(PathAction):
+    """Download a package and extract it from the download stream in one pass.
+
+    The tarball is still written to the package cache as it streams in, and the extracted
+    package is only moved into place once the whole tarball has been verified.
+    """
+
+    def __init__(self, cache_action, extract_action):
+        assert not cache_action.url.startswith('file:/'), cache_action.url
+        assert extract_action.source_full_path == cache_action.target_full_path
+        self.cache_action = cache_action
+        self.extract_action = extract_action
+
+    @property
+    def url(self):
+        return self.cache_action.url
+
+    @property
+    def target_package_basename(self):
+        return self.cache_action.target_package_basename
+
+    def verify(self):
+        self.cache_action.verify()
+        self.extract_action.verify()
+        self._verified = True
+
+    def execute(self, progress_update_callback=None):
+        from .package_cache import PackageCache
+        cache_action, extract_action = self.cache_action, self.extract_action
+        store = PackageStore.get()
+        if (store and cache_action.md5sum
+                and store.has_tarball(cache_action.target_full_path, cache_action.md5sum)):
+            # nothing to download; the package store has it already
+            cache_action.execute(progress_update_callback)
+            extract_action.execute()
+            return
+
+        log.trace("caching and extracting url %s => %s", cache_action.url,
+                  extract_action.target_full_path)
+
+        for action in (cache_action, extract_action):
+            if lexists(action.hold_path):
+                rm_rf(action.hold_path)
+            if lexists(action.target_full_path):
+                backoff_rename(action.target_full_path, action.hold_path)
+
+        md5sum = download_and_extract(cache_action.url, cache_action.target_full_path,
+                                      cache_action.md5sum, extract_action.target_full_path,
+                                      progress_update_callback)
+        try_write_prefix_offsets(extract_action.target_full_path)
+        try_write_package_manifest(extract_action.target_full_path)
+
+        target_package_cache = PackageCache(cache_action.target_pkgs_dir)
+        target_package_cache.digests_data.add_digest(cache_action.target_full_path, md5sum)
+        target_package_cache.urls_data.add_url(cache_action.url)
+        store = PackageStore.get()
+        if store:
+            store.add_tarball(cache_action.target_full_path, md5sum)
+            store.add_extracted(extract_action.target_full_path, md5sum)
+        extract_action.add_package_cache_entry()
+
+    def reverse(self):
+        self.extract_action.reverse()
+        self.cache_action.reverse()
+
+    def cleanup(self):
+        self.extract_action.cleanup()
+        self.cache_action.cleanup()
+
+    @property
+    def target_full_path(self):
+        return self.extract_action.target_full_path
+
+    def __str__(self):
+        return ('CacheUrlAndExtractAction<url=%r, target_full_path=%r>'
+                % (self.cache_action.url, self.target_full_path))
@@ -1,15 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import json
 from logging import getLogger
-from os.path import realpath
+import mmap
+import os
+from os.path import isfile, islink, join, realpath
 import re
 import struct
 
 from ..base.constants import PREFIX_PLACEHOLDER
 from ..common.compat import on_win
+from ..common.path import win_path_ok
 from ..exceptions import CondaRuntimeError
-from ..gateways.disk.update import CancelOperation, update_file_in_place_as_binary
+from ..gateways.disk.delete import rm_rf
+from ..gateways.disk.read import read_paths_json
+from ..gateways.disk.update import (CancelOperation, backoff_rename,
+                                    update_file_in_place_as_binary)
 from ..models.enums import FileMode
 
 log = getLogger(__name__)
@@ -23,11 +30,23 @@ SHEBANG_REGEX = (br'^(#!'  # pretty much the whole match string
                  br')$')  # end whole_shebang group
 
 
+# the sidecar in an extracted package's info directory recording where the binary prefix
+#   placeholders are in its files
+PREFIX_OFFSETS_FILENAME = 'prefix_offsets.json'
+
+
 class _PaddingError(Exception):
     pass
 
 
-def update_prefix(path, new_prefix, placeholder=PREFIX_PLACEHOLDER, mode=FileMode.text):
+def update_prefix(path, new_prefix, placeholder=PREFIX_PLACEHOLDER, mode=FileMode.text,
+                  offsets=None):
+    # offsets, for a binary file, are where find_binary_prefix_offsets() found the placeholder
+    #   in the file, if that's already known; they're checked before they're used
+    if mode == FileMode.binary and not on_win:
+        update_binary_prefix(realpath(path), new_prefix, placeholder, offsets)
+        return
+
     if on_win and mode == FileMode.text:
         # force all prefix replacements to forward slashes to simplify need to escape backslashes
         # replace with unix-style path separators
@@ -106,6 +125,148 @@ def binary_replace(data, a, b):
     return data
 
 
+def find_binary_prefix_offsets(data, placeholder):
+    """
+    Return the (start, end) offsets of each null-terminated string in `data` that
+    binary_replace() would rewrite, i.e. from an occurrence of the placeholder up to, but
+    not including, the next null byte.  `data` can be bytes or an mmap.
+    """
+    offsets = []
+    start = data.find(placeholder)
+    while start >= 0:
+        end = data.find(b'\0', start + len(placeholder))
+        if end < 0:
+            break
+        offsets.append((start, end))
+        start = data.find(placeholder, end + 1)
+    return offsets
+
+
+def _binary_replacements(data, a, b, offsets):
+    # (offset, new bytes) for each string at offsets, or None if offsets don't hold a
+    #   placeholder string anymore
+    replacements = []
+    for start, end in offsets:
+        string = data[start:end]
+        if not string.startswith(a) or b'\0' in string or data[end:end + 1] != b'\0':
+            return None
+        padding = (len(a) - len(b)) * string.count(a)
+        if padding < 0:
+            raise _PaddingError
+        replacements.append((start, string.replace(a, b) + b'\0' * padding))
+    return replacements
+
+
+def update_binary_prefix(path, new_prefix, placeholder, offsets=None):
+    """
+    Like binary_replace(), but for the file at `path`, which is memory-mapped and only
+    patched at the strings holding the placeholder.  Nothing is written unless every string
+    can be replaced.
+    """
+    a, b = placeholder.encode('utf-8'), new_prefix.encode('utf-8')
+    with open(path, 'r+b') as fh:
+        if not os.fstat(fh.fileno()).st_size:
+            return
+        data = mmap.mmap(fh.fileno(), 0)
+        try:
+            replacements = None
+            if offsets is not None:
+                replacements = _binary_replacements(data, a, b, offsets)
+                if replacements is None:
+                    log.debug("recorded prefix offsets are stale for %s", path)
+            if replacements is None:
+                replacements = _binary_replacements(data, a, b,
+                                                    find_binary_prefix_offsets(data, a))
+            for start, replacement in replacements:
+                data[start:start + len(replacement)] = replacement
+            if replacements:
+                data.flush()
+        finally:
+            data.close()
+
+
+def write_prefix_offsets(extracted_package_dir):
+    """
+    Record where the prefix placeholders are in an extracted package's binary has_prefix
+    files, as info/prefix_offsets.json, so installing the package doesn't have to search
+    the files for them every time.  Nothing is written if there are no such files.
+    """
+    if on_win:
+        # binary prefix replacement is only done for pyzzer entry points on windows
+        return
+    info_dir = join(extracted_package_dir, 'info')
+    if not any(isfile(join(info_dir, fn)) for fn in ('paths.json', 'has_prefix')):
+        return
+    files = {}
+    for path_info in read_paths_json(extracted_package_dir).paths:
+        if not path_info.prefix_placeholder or path_info.file_mode != FileMode.binary:
+            continue
+        full_path = join(extracted_package_dir, win_path_ok(path_info.path))
+        if islink(full_path) or not isfile(full_path):
+            continue
+        with open(full_path, 'rb') as fh:
+            st = os.fstat(fh.fileno())
+            if not st.st_size:
+                continue
+            data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offsets = find_binary_prefix_offsets(
+                    data, path_info.prefix_placeholder.encode('utf-8'))
+            finally:
+                data.close()
+        files[path_info.path] = {
+            'placeholder': path_info.prefix_placeholder,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'offsets': offsets,
+        }
+    if not files:
+        return
+    offsets_path = join(info_dir, PREFIX_OFFSETS_FILENAME)
+    temp_path = offsets_path + '.tmp'
+    with open(temp_path, 'w') as fh:
+        json.dump({'prefix_offsets_version': 1, 'files': files}, fh)
+    rm_rf(offsets_path)
+    backoff_rename(temp_path, offsets_path)
+
+
+def try_write_prefix_offsets(extracted_package_dir):
+    # the offsets are only an optimization; failing to record them fails nothing
+    try:
+        write_prefix_offsets(extracted_package_dir)
+    except Exception as e:
+        log.debug("cannot record prefix offsets for %s\n  %r", extracted_package_dir, e)
+
+
+def read_prefix_offsets(extracted_package_dir):
+    """
+    Return the entries of an extracted package's info/prefix_offsets.json, by path, or an
+    empty dict if there isn't one.  Pass an entry to recorded_prefix_offsets() to use it.
+    """
+    offsets_path = join(extracted_package_dir, 'info', PREFIX_OFFSETS_FILENAME)
+    try:
+        with open(offsets_path) as fh:
+            prefix_offsets = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return {}
+    if prefix_offsets.get('prefix_offsets_version') != 1:
+        return {}
+    return prefix_offsets.get('files') or {}
+
+
+def recorded_prefix_offsets(entry, source_full_path, placeholder):
+    # the offsets in a read_prefix_offsets() entry, if they're for this file as it is now
+    if not entry or entry.get('placeholder') != placeholder:
+        return None
+    try:
+        st = os.stat(source_full_path)
+    except (IOError, OSError):
+        return None
+    if st.st_size != entry.get('size') or st.st_mtime != entry.get('mtime'):
+        return None
+    return [tuple(offset) for offset in entry.get('offsets', ())]
+
+
 def has_pyzzer_entry_point(data):
     pos = data.rfind(b'PK\x05\x06')
     return pos >= 0
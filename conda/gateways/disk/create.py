@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import errno
 from errno import EEXIST
 from io import open
 import json
 from logging import getLogger
+from multiprocessing import cpu_count
 import os
 from os import makedirs
 from os.path import basename, isdir, isfile, islink, join, lexists
@@ -13,16 +15,20 @@ import shutil
 from subprocess import PIPE, Popen
 import sys
 import tarfile
+from tempfile import mkstemp
+from time import time
 import traceback
 
 from .delete import rm_rf
 from .permissions import make_executable
+from .read import (PACKAGE_MANIFEST_FILENAME, package_manifest_sources, read_package_metadata,
+                   read_paths_json)
 from ... import CondaError
 from ..._vendor.auxlib.entity import EntityEncoder
 from ..._vendor.auxlib.ish import dals
 from ...base.constants import PRIVATE_ENVS
 from ...base.context import context
-from ...common.compat import on_win
+from ...common.compat import iteritems, on_win
 from ...common.path import win_path_ok
 from ...exceptions import ClobberError, CondaOSError
 from ...models.dist import Dist
@@ -88,16 +94,150 @@ def extract_tarball(tarball_full_path, destination_directory=None):
 
     assert not lexists(destination_directory), destination_directory
 
-    with tarfile.open(tarball_full_path) as t:
-        t.extractall(path=destination_directory)
-    if sys.platform.startswith('linux') and os.getuid() == 0:
-        # When extracting as root, tarfile will by restore ownership
-        # of extracted files.  However, we want root to be the owner
-        # (our implementation of --no-same-owner).
-        for root, dirs, files in os.walk(destination_directory):
-            for fn in files:
-                p = join(root, fn)
-                os.lchown(p, 0, 0)
+    with open(tarball_full_path, 'rb', buffering=EXTRACT_BUFFER_SIZE) as fh:
+        with tarfile.open(fileobj=fh, mode='r:bz2') as t:
+            _extract_members(t, destination_directory)
+
+
+def extract_tarball_stream(fileobj, destination_directory):
+    # extract a .tar.bz2 read strictly sequentially from fileobj, e.g. while it's downloading
+    log.debug("extracting stream\n  to %s", destination_directory)
+
+    assert not lexists(destination_directory), destination_directory
+
+    with tarfile.open(fileobj=fileobj, mode='r|bz2') as t:
+        _extract_members(t, destination_directory)
+
+
+EXTRACT_BUFFER_SIZE = 2 ** 20
+_utime_supports_fd = os.utime in getattr(os, 'supports_fd', ())
+
+
+def _extract_members(t, destination_directory):
+    # Members are extracted in a single sequential pass, with each file's permissions and mtime
+    #   set as it's written.  Ownership is left to whoever runs conda; in particular, root
+    #   doesn't restore the owners recorded in the tarball (our implementation of
+    #   --no-same-owner), so there's no second walk over the tree to lchown everything.
+    start_time = time()
+    file_count = byte_count = 0
+    made_dirs = set()
+    dir_attrs = []
+    destination_directory = os.path.abspath(destination_directory)
+    chown_to_root = sys.platform.startswith('linux') and os.getuid() == 0
+
+    def make_dirs(path):
+        if path not in made_dirs:
+            mkdir_p(path)
+            made_dirs.add(path)
+
+    real_destination = os.path.realpath(destination_directory)
+    real_dirs = {}
+
+    def is_inside(path, directory):
+        return path == directory or path.startswith(directory + os.sep)
+
+    def check_inside(member, path):
+        # Lexically first, then with symlinks resolved, so a file can't be written through a
+        #   symlink that an earlier member made, e.g. lib -> /etc followed by lib/passwd.
+        #   Resolved directories are remembered until the next link member is extracted.
+        parent = os.path.dirname(path)
+        if parent not in real_dirs:
+            real_dirs[parent] = os.path.realpath(parent)
+        if not (is_inside(path, destination_directory)
+                and is_inside(real_dirs[parent], real_destination)):
+            raise CondaError("Refusing to extract %(name)s outside of %(path)s",
+                             name=member.name, path=destination_directory)
+
+    make_dirs(destination_directory)
+    for member in t:
+        target_path = os.path.normpath(join(destination_directory, member.name))
+        check_inside(member, target_path)
+        make_dirs(os.path.dirname(target_path))
+
+        if member.isdir():
+            make_dirs(target_path)
+            dir_attrs.append((target_path, member))
+        elif member.isreg():
+            if islink(target_path) or (lexists(target_path) and not isdir(target_path)):
+                # never write through an existing link, symbolic or hard
+                os.unlink(target_path)
+            with open(target_path, 'wb') as out:
+                shutil.copyfileobj(t.extractfile(member), out, EXTRACT_BUFFER_SIZE)
+                out.flush()
+                if not on_win:
+                    os.fchmod(out.fileno(), member.mode)
+                if _utime_supports_fd:
+                    os.utime(out.fileno(), (member.mtime, member.mtime))
+            if on_win:
+                os.chmod(target_path, member.mode)
+            if not _utime_supports_fd:
+                os.utime(target_path, (member.mtime, member.mtime))
+            file_count += 1
+            byte_count += member.size
+        else:
+            # links and special files are rare; let tarfile handle their quirks
+            if member.islnk():
+                check_inside(member, os.path.normpath(join(destination_directory,
+                                                           member.linkname)))
+            t.extract(member, destination_directory)
+            real_dirs.clear()
+            if chown_to_root:
+                os.lchown(target_path, 0, 0)
+            file_count += 1
+
+    # like tarfile does, directories get their attributes last, deepest first, so that
+    #   permissions don't stop the extraction and file creation doesn't bump their mtimes
+    for target_path, member in sorted(dir_attrs, key=lambda x: x[0], reverse=True):
+        if not on_win:
+            os.chmod(target_path, member.mode)
+        os.utime(target_path, (member.mtime, member.mtime))
+
+    elapsed = max(time() - start_time, 1e-6)
+    log.debug("extracted %d files (%d bytes) to %s in %.3fs: %.0f files/s, %.1f MB/s",
+              file_count, byte_count, destination_directory, elapsed,
+              file_count / elapsed, byte_count / elapsed / 2 ** 20)
+
+
+def write_package_manifest(extracted_package_directory):
+    """
+    Record what read_package_info() needs from an extracted package's info directory, already
+    parsed, as info/package_manifest.json, so linking the package doesn't have to parse it all
+    again.  read_package_manifest() ignores the manifest if any of those files change.
+    """
+    # the sources are taken first, so the manifest is out of date if they change while it's made
+    sources = package_manifest_sources(extracted_package_directory)
+    with open(join(extracted_package_directory, 'info', 'index.json')) as fh:
+        index = json.load(fh)
+    package_metadata = read_package_metadata(extracted_package_directory)
+    paths_data = read_paths_json(extracted_package_directory)
+    manifest = {
+        'manifest_version': 1,
+        'sources': sources,
+        'index': index,
+        'package_metadata': package_metadata and package_metadata.dump(),
+        'paths_version': paths_data.paths_version,
+        'paths': [dict((key, value) for key, value in iteritems(path_info.dump())
+                       if value is not None)
+                  for path_info in paths_data.paths],
+    }
+
+    manifest_path = join(extracted_package_directory, 'info', PACKAGE_MANIFEST_FILENAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as fo:
+        json_str = json.dumps(manifest, separators=(',', ':'))
+        if hasattr(json_str, 'decode'):
+            json_str = json_str.decode('utf-8')
+        fo.write(json_str)
+    rm_rf(manifest_path)
+    os.rename(temp_path, manifest_path)
+
+
+def try_write_package_manifest(extracted_package_directory):
+    # without a manifest, the package's info files are parsed when it's linked
+    try:
+        write_package_manifest(extracted_package_directory)
+    except Exception as e:
+        log.debug("cannot write a package manifest for %s\n  %r", extracted_package_directory, e)
 
 
 def write_linked_package_record(prefix, record):
@@ -202,7 +342,119 @@ def create_hard_link_or_copy(src, dst):
             os.link(src, dst)
     except (IOError, OSError):
         log.info('hard link failed, so copying %s => %s', src, dst)
+        copy_file(src, dst)
+
+
+# How file content is copied, cheapest first.  A reflink shares the source's blocks
+#   copy-on-write (btrfs, XFS); a kernel copy moves the bytes without passing them through
+#   userspace; a userspace copy works everywhere.
+COPY_BACKENDS = ('reflink', 'kernel', 'userspace')
+COPY_BUFFER_SIZE = 2 ** 20
+
+# the FICLONE ioctl, from linux/fs.h
+_FICLONE = 0x40049409
+
+# errors meaning a backend can't copy between two filesystems, rather than that the copy failed
+_UNSUPPORTED_COPY_ERRNOS = frozenset(getattr(errno, name) for name in (
+    'EXDEV', 'EOPNOTSUPP', 'ENOTSUP', 'EINVAL', 'ENOSYS', 'ENOTTY', 'EBADF',
+) if hasattr(errno, name))
+
+# (source st_dev, destination st_dev) => index in COPY_BACKENDS of the first backend to try
+_copy_backends = {}
+
+
+class _CopyUnsupported(Exception):
+    pass
+
+
+def _copy_reflink(src_fd, dst_fd, size):
+    if not sys.platform.startswith('linux'):
+        raise _CopyUnsupported()
+    import fcntl
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except (IOError, OSError) as e:
+        if e.errno in _UNSUPPORTED_COPY_ERRNOS:
+            raise _CopyUnsupported()
+        raise
+
+
+def _copy_kernel(src_fd, dst_fd, size):
+    if hasattr(os, 'copy_file_range'):
+        def copy_chunk(offset, count):
+            return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+    elif hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        def copy_chunk(offset, count):
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            return os.sendfile(dst_fd, src_fd, offset, count)
+    else:
+        raise _CopyUnsupported()
+
+    offset = 0
+    while offset < size:
+        try:
+            copied = copy_chunk(offset, min(size - offset, 2 ** 30))
+        except (IOError, OSError) as e:
+            if offset == 0 and e.errno in _UNSUPPORTED_COPY_ERRNOS:
+                raise _CopyUnsupported()
+            raise
+        if not copied:
+            if offset == 0:
+                # some filesystems, e.g. procfs, report nothing to copy
+                raise _CopyUnsupported()
+            break
+        offset += copied
+
+
+def _copy_userspace(src_fd, dst_fd, size):
+    while True:
+        data = os.read(src_fd, COPY_BUFFER_SIZE)
+        if not data:
+            break
+        while data:
+            data = data[os.write(dst_fd, data):]
+
+
+_COPY_FUNCTIONS = {
+    'reflink': _copy_reflink,
+    'kernel': _copy_kernel,
+    'userspace': _copy_userspace,
+}
+
+
+def copy_file(src, dst):
+    """
+    Copy the file src to dst, with its permissions and times, like shutil.copy2().
+
+    The content is copied with the cheapest of COPY_BACKENDS that works between the two
+    filesystems.  Which one that is gets worked out on the first copy between them, and is
+    remembered for the rest.
+    """
+    if on_win:
         shutil.copy2(src, dst)
+        return
+
+    with open(src, 'rb') as fsrc:
+        src_st = os.fstat(fsrc.fileno())
+        with open(dst, 'wb') as fdst:
+            dst_dev = os.fstat(fdst.fileno()).st_dev
+            key = src_st.st_dev, dst_dev
+            backend_idx = _copy_backends.get(key, 0)
+            while True:
+                backend = COPY_BACKENDS[backend_idx]
+                try:
+                    _COPY_FUNCTIONS[backend](fsrc.fileno(), fdst.fileno(), src_st.st_size)
+                    break
+                except _CopyUnsupported:
+                    backend_idx += 1
+                    os.lseek(fsrc.fileno(), 0, os.SEEK_SET)
+                    os.lseek(fdst.fileno(), 0, os.SEEK_SET)
+                    os.ftruncate(fdst.fileno(), 0)
+            if key not in _copy_backends:
+                log.debug("copying files from device %s to %s with %s", key[0], key[1],
+                          backend)
+                _copy_backends[key] = backend_idx
+    shutil.copystat(src, dst)
 
 
 def create_link(src, dst, link_type=LinkType.hardlink, force=False):
@@ -239,7 +491,7 @@ def create_link(src, dst, link_type=LinkType.hardlink, force=False):
         if not on_win and islink(src) and not os.readlink(src).startswith('/'):
             os.symlink(os.readlink(src), dst)
         else:
-            shutil.copy2(src, dst)
+            copy_file(src, dst)
     else:
         raise CondaError("Did not expect linktype=%r" % link_type)
 
@@ -279,6 +531,82 @@ def compile_pyc(python_exe_full_path, py_full_path, pyc_full_path):
     return pyc_full_path
 
 
+# how many pyc files compile_multiple_pyc() gives each interpreter process
+PYC_FILES_PER_PROCESS = 500
+
+# run by the target environment's python, which may be python 2
+compile_multiple_pyc_script = dals("""
+import py_compile
+import sys
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+with open(sys.argv[1], 'rb') as fh:
+    paths = fh.read().decode('utf-8').split('\\0')
+for py_path, pyc_path in zip(paths[::2], paths[1::2]):
+    try:
+        py_compile.compile(py_path, cfile=pyc_path, doraise=True)
+    except Exception as e:
+        try:
+            message = '%s\\0%s\\0' % (pyc_path, getattr(e, 'msg', None) or repr(e))
+        except UnicodeError:
+            message = '%s\\0%r\\0' % (pyc_path, e)
+        out.write(message.encode('utf-8'))
+""")
+
+
+def compile_multiple_pyc(python_exe_full_path, py_full_paths, pyc_full_paths):
+    """Compile each of py_full_paths to the pyc file at the same index of pyc_full_paths.
+
+    Rather than an interpreter per file, batches of PYC_FILES_PER_PROCESS files are compiled
+    in a single interpreter each, with up to one interpreter per CPU running at once.
+
+    Returns a dict of pyc_full_path to error message for every file that failed to compile.
+    Every other pyc file was written.
+    """
+    pairs = tuple(zip(py_full_paths, pyc_full_paths))
+    if not context.force:
+        for py_full_path, pyc_full_path in pairs:
+            if lexists(pyc_full_path):
+                raise ClobberError(pyc_full_path, py_full_path, PathType.pyc_file)
+    if not pairs:
+        return {}
+
+    batch_count = min(cpu_count(), -(-len(pairs) // PYC_FILES_PER_PROCESS))
+    batches = tuple(pairs[q::batch_count] for q in range(batch_count))
+    list_paths, processes = [], []
+    failures = {}
+    try:
+        for batch in batches:
+            fd, list_path = mkstemp(suffix='.txt')
+            list_paths.append(list_path)
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write('\0'.join(path for pair in batch for path in pair).encode('utf-8'))
+            command = [python_exe_full_path, '-Wi', '-c', compile_multiple_pyc_script,
+                       list_path]
+            log.trace("compiling %d pyc files with %s", len(batch), python_exe_full_path)
+            processes.append((Popen(command, stdout=PIPE, stderr=PIPE), batch))
+
+        for process, batch in processes:
+            stdout, stderr = process.communicate()
+            if process.returncode != 0:
+                log.error("$ %s -Wi -c <compile_multiple_pyc_script>\n"
+                          "  stdout: %s\n"
+                          "  stderr: %s\n"
+                          "  rc: %d", python_exe_full_path, stdout, stderr, process.returncode)
+            results = stdout.decode('utf-8').split('\0')
+            failures.update(zip(results[0:-1:2], results[1::2]))
+            for _, pyc_full_path in batch:
+                if pyc_full_path not in failures and not isfile(pyc_full_path):
+                    failures[pyc_full_path] = "pyc file was not written"
+    finally:
+        for process, _ in processes:
+            if process.returncode is None:
+                process.kill()
+                process.wait()
+        for list_path in list_paths:
+            rm_rf(list_path)
+    return failures
+
+
 def get_json_content(path_to_json):
     if isfile(path_to_json):
         try:
@@ -10,7 +10,7 @@ from errno import ENOENT
 from functools import partial
 from itertools import chain
 from logging import getLogger
-from os import X_OK, access, listdir
+from os import X_OK, access, listdir, stat
 from os.path import lexists, isdir, isfile, islink, join
 
 from conda.common.compat import on_win
@@ -25,6 +25,10 @@ from ...models.package_info import PackageInfo, PackageMetadata, PathData, PathD
 
 log = getLogger(__name__)
 
+PACKAGE_MANIFEST_FILENAME = 'package_manifest.json'
+PACKAGE_MANIFEST_SOURCES = ('index.json', 'package_metadata.json', 'paths.json', 'files',
+                            'has_prefix', 'no_link', 'no_softlink')
+
 listdir = listdir
 lexists, isdir, isfile, islink = lexists, isdir, isfile, islink
 
@@ -69,24 +73,70 @@ def is_exe(path):
 
 
 def read_package_info(record, extracted_package_directory):
-    index_json_record = read_index_json(extracted_package_directory)
-    icondata = read_icondata(extracted_package_directory)
-    package_metadata = read_package_metadata(extracted_package_directory)
-    paths_data = read_paths_json(extracted_package_directory)
+    # info/icon.png isn't read here; see PackageInfo.load_icondata()
+    manifest = read_package_manifest(extracted_package_directory)
+    if manifest is None:
+        index_json_record = read_index_json(extracted_package_directory)
+        package_metadata = read_package_metadata(extracted_package_directory)
+        paths_data = read_paths_json(extracted_package_directory)
+    else:
+        index_json_record, package_metadata, paths_data = manifest
 
     return PackageInfo(
+        trusted=True,
         extracted_package_dir=extracted_package_directory,
         channel=Channel(record.schannel or record.channel),
         repodata_record=record,
         url=record.url,
 
         index_json_record=index_json_record,
-        icondata=icondata,
         package_metadata=package_metadata,
         paths_data=paths_data,
     )
 
 
+def read_package_manifest(extracted_package_directory):
+    """
+    Return (index_json_record, package_metadata, paths_data) from an extracted package's
+    info/package_manifest.json, or None if there isn't one, or it's out of date with the
+    files it was made from.  The manifest is written by write_package_manifest().
+    """
+    manifest_path = join(extracted_package_directory, 'info', PACKAGE_MANIFEST_FILENAME)
+    try:
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return None
+    if (manifest.get('manifest_version') != 1
+            or manifest.get('sources') != package_manifest_sources(extracted_package_directory)):
+        return None
+
+    path_data_class = PathDataV1 if manifest['paths_version'] == 1 else PathData
+    package_metadata = manifest['package_metadata']
+    return (
+        IndexRecord(**manifest['index']),
+        package_metadata and PackageMetadata(**package_metadata),
+        PathsData(
+            trusted=True,
+            paths_version=manifest['paths_version'],
+            paths=tuple(path_data_class(trusted=True, **path_info)
+                        for path_info in manifest['paths']),
+        ),
+    )
+
+
+def package_manifest_sources(extracted_package_directory):
+    # the size and modification time of each info file a package manifest is made from
+    sources = {}
+    for fn in PACKAGE_MANIFEST_SOURCES:
+        try:
+            st = stat(join(extracted_package_directory, 'info', fn))
+        except (IOError, OSError):
+            continue
+        sources[fn] = [st.st_size, st.st_mtime]
+    return sources
+
+
 # ####################################################
 # functions supporting read_package_info()
 # ####################################################
@@ -154,8 +204,9 @@ def read_paths_json(extracted_package_directory):
                     path_info["path_type"] = PathType.softlink
                 else:
                     path_info["path_type"] = PathType.hardlink
-                yield PathData(**path_info)
+                yield PathData(trusted=True, **path_info)
         paths_data = PathsData(
+            trusted=True,
             paths_version=0,
             paths=read_files_file(),
         )
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from bisect import insort
 import hashlib
+from itertools import count
+import json
 from logging import getLogger
-from os.path import exists, basename
-from threading import Lock
+from os.path import basename, exists, getsize, lexists
+import re
+from threading import Condition, Lock, Thread, local
+from time import sleep, time
 import warnings
 
 from requests.exceptions import ConnectionError, HTTPError, SSLError
@@ -12,31 +17,28 @@ from requests.exceptions import ConnectionError, HTTPError, SSLError
 from .. import CondaError
 from .._vendor.auxlib.ish import dals
 from ..base.context import context
+from ..common.compat import iteritems, itervalues
+from ..common.url import urlparse
 from ..connection import CondaSession
-from ..exceptions import ClobberError, CondaHTTPError, MD5MismatchError
+from ..exceptions import ClobberError, CondaHTTPError, CondaValueError, MD5MismatchError
+from ..utils import human_bytes, parse_human_bytes
+from .disk.create import extract_tarball_stream
+from .disk.delete import rm_rf
+from .disk.update import backoff_rename
 
 log = getLogger(__name__)
 
 
-class SingleThreadCondaSession(CondaSession):
-    # according to http://stackoverflow.com/questions/18188044/is-the-session-object-from-pythons-requests-library-thread-safe  # NOQA
-    # request's Session isn't thread-safe for us
-
-    _session = None
-    _mutex = Lock()
+_session_local = local()
 
-    def __init__(self):
-        super(SingleThreadCondaSession, self).__init__()
 
-    def __enter__(self):
-        session = SingleThreadCondaSession._session
-        if session is None:
-            session = SingleThreadCondaSession._session = self
-        SingleThreadCondaSession._mutex.acquire()
-        return session
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        SingleThreadCondaSession._mutex.release()
+def get_session():
+    # according to http://stackoverflow.com/questions/18188044/is-the-session-object-from-pythons-requests-library-thread-safe  # NOQA
+    # request's Session isn't thread-safe for us, so each thread gets its own
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        session = _session_local.session = CondaSession()
+    return session
 
 
 def disable_ssl_verify_warning():
@@ -48,8 +50,137 @@ def disable_ssl_verify_warning():
         warnings.simplefilter('ignore', InsecureRequestWarning)
 
 
-def download(url, target_full_path, md5sum):
+def download(url, target_full_path, md5sum, progress_update_callback=None):
+    """Stream url to target_full_path, verifying md5sum if given, and return the md5 hexdigest.
+
+    Progress is logged to the fetch.start/update/stop loggers, unless progress_update_callback
+    is given; it's then called as progress_update_callback(streamed_bytes, content_length)
+    instead, so that a caller running several downloads at once can aggregate their progress.
+    """
+    return _download(url, target_full_path, md5sum, progress_update_callback)
+
+
+def download_and_extract(url, target_full_path, md5sum, destination_directory,
+                         progress_update_callback=None):
+    """Like download(), but also extract the tarball to destination_directory as it streams in.
+
+    The package is extracted next to destination_directory, and only renamed into place once
+    the whole tarball has been written and its md5sum verified.
+    """
+    return _download(url, target_full_path, md5sum, progress_update_callback,
+                     destination_directory)
+
+
+class _DownloadStream(object):
+    # A file-like view of a streamed response body.  Everything read is also written to fh
+    #   and added to digest_builder, and progress is reported per chunk.  When resuming, the
+    #   first resumed_length bytes already in the partial file are read back from resumed_fh
+    #   first, so the digest (and any tar stream reading from here) covers the whole file.
+
+    def __init__(self, resp, fh, digest_builder, report_progress, resumed_fh=None,
+                 resumed_length=0):
+        self._chunks = resp.iter_content(2 ** 14)
+        self._fh = fh
+        self._digest_builder = digest_builder
+        self._report_progress = report_progress
+        self._resumed_fh = resumed_fh
+        self._resumed_length = resumed_length
+        self._pending = b''
+        self.streamed_bytes = 0
+
+    def _next_chunk(self):
+        if self.streamed_bytes < self._resumed_length:
+            chunk = self._resumed_fh.read(min(2 ** 16, self._resumed_length - self.streamed_bytes))
+            if not chunk:
+                raise CondaError("Partial download %(path)s is truncated", path=self._fh.name)
+            self.streamed_bytes += len(chunk)
+            self._digest_builder.update(chunk)
+            return chunk
+        for chunk in self._chunks:
+            if chunk:
+                break
+        else:
+            return b''
+        self.streamed_bytes += len(chunk)
+        try:
+            self._fh.write(chunk)
+        except IOError as e:
+            message = "Failed to write to %(target_path)s\n  errno: %(errno)d"
+            # TODO: make this CondaIOError
+            raise CondaError(message, target_path=self._fh.name, errno=e.errno)
+        self._digest_builder.update(chunk)
+        self._report_progress(self.streamed_bytes)
+        return chunk
+
+    def read(self, size=-1):
+        if not self._pending:
+            self._pending = self._next_chunk()
+        if size is None or size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def drain(self):
+        self._pending = b''
+        while self._next_chunk():
+            pass
+
+
+class _PartialDownload(object):
+    """The partial file of an interrupted download, and its sidecar.
+
+    The sidecar records the url, the validators (ETag and Last-Modified) the server sent for
+    it, and how many bytes made it into the partial file, so a later attempt can ask for just
+    the rest of the file with a Range request.
+    """
+
+    def __init__(self, target_full_path):
+        self.path = target_full_path + '.partial'
+        self.sidecar_path = self.path + '.json'
+
+    def read(self, url):
+        # returns the validators and length to resume from, or None if there's nothing to resume
+        try:
+            with open(self.sidecar_path) as fh:
+                sidecar = json.load(fh)
+            size = getsize(self.path)
+        except (IOError, OSError, ValueError):
+            return None
+        length = sidecar.get('length') or 0
+        if sidecar.get('url') != url or not 0 < length <= size:
+            return None
+        validator = sidecar.get('etag') or sidecar.get('last_modified')
+        if not validator:
+            return None
+        return validator, length
+
+    def write(self, url, headers, length):
+        sidecar = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'length': length,
+        }
+        with open(self.sidecar_path, 'w') as fh:
+            json.dump(sidecar, fh)
+
+    def remove(self):
+        rm_rf(self.sidecar_path)
+        rm_rf(self.path)
+
+
+def _resumed_range(resp):
+    # the start of the range the server actually sent, or 0 if it sent the whole file
+    if resp.status_code != 206:
+        return 0
+    match = re.match(r'bytes (\d+)-', resp.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else 0
+
+
+def _download(url, target_full_path, md5sum, progress_update_callback=None,
+              destination_directory=None):
     content_length = None
+    log_progress = progress_update_callback is None
 
     if exists(target_full_path):
         raise ClobberError(target_full_path, url, None)
@@ -57,59 +188,118 @@ def download(url, target_full_path, md5sum):
     if not context.ssl_verify:
         disable_ssl_verify_warning()
 
+    partial = _PartialDownload(target_full_path)
+    resume = partial.read(url)
+
     try:
         timeout = context.remote_connect_timeout_secs, context.remote_read_timeout_secs
-        with SingleThreadCondaSession() as session:
+        session = get_session()
+        headers = {}
+        if resume:
+            validator, offset = resume
+            headers['Range'] = 'bytes=%d-' % offset
+            headers['If-Range'] = validator
+        resp = session.get(url, stream=True, proxies=session.proxies, timeout=timeout,
+                           headers=headers)
+        if resp.status_code == 416 and resume:
+            # our partial file doesn't fit what's on the server anymore; start over
+            log.debug("range not satisfiable for %s, restarting download", url)
+            resume = None
             resp = session.get(url, stream=True, proxies=session.proxies, timeout=timeout)
-            resp.raise_for_status()
+        resp.raise_for_status()
 
-            content_length = int(resp.headers.get('Content-Length'))
+        offset = 0
+        if resume:
+            offset = _resumed_range(resp)
+            if offset and offset != resume[1]:
+                # only ever append right where the partial file ends
+                log.debug("unexpected Content-Range from %s, restarting download", url)
+                resp.close()
+                resume, offset = None, 0
+                resp = session.get(url, stream=True, proxies=session.proxies, timeout=timeout)
+                resp.raise_for_status()
+            elif offset:
+                log.debug("resuming download of %s at byte %d", url, offset)
 
+        content_length = int(resp.headers.get('Content-Length')) + offset
+
+        if log_progress:
             getLogger('fetch.start').info((basename(target_full_path[:14]), content_length))
 
-            digest_builder = hashlib.new('md5')
-            try:
-                with open(target_full_path, 'wb') as fh:
-                    streamed_bytes = 0
-                    for chunk in resp.iter_content(2 ** 14):
-                        streamed_bytes += len(chunk)
-                        try:
-                            fh.write(chunk)
-                        except IOError as e:
-                            message = "Failed to write to %(target_path)s\n  errno: %(errno)d"
-                            # TODO: make this CondaIOError
-                            raise CondaError(message, target_path=target_full_path, errno=e.errno)
-
-                        digest_builder.update(chunk)
-
-                        if content_length and 0 <= streamed_bytes <= content_length:
-                            getLogger('fetch.update').info(streamed_bytes)
-
-                if content_length and streamed_bytes != content_length:
-                    # TODO: needs to be a more-specific error type
-                    message = dals("""
-                    Downloaded bytes did not match Content-Length
-                      url: %(url)s
-                      target_path: %(target_path)s
-                      Content-Length: %(content_length)d
-                      downloaded bytes: %(downloaded_bytes)d
-                    """)
-                    raise CondaError(message, url=url, target_path=target_full_path,
-                                     content_length=content_length,
-                                     downloaded_bytes=streamed_bytes)
-
-            except (IOError, OSError) as e:
-                if e.errno == 104:
-                    # Connection reset by peer
-                    log.debug("%s, trying again" % e)
-                raise
-
-        if md5sum and digest_builder.hexdigest() != md5sum:
-            log.debug("MD5 sums mismatch for download: %s (%s != %s), "
-                      "trying again" % (url, digest_builder.hexdigest(), md5sum))
-            # TODO: refactor this exception
-            raise MD5MismatchError("MD5 sums mismatch for download: %s (%s != %s)"
-                                   % (url, digest_builder.hexdigest(), md5sum))
+        def report_progress(streamed_bytes):
+            if not log_progress:
+                progress_update_callback(streamed_bytes, content_length)
+            elif content_length and 0 <= streamed_bytes <= content_length:
+                getLogger('fetch.update').info(streamed_bytes)
+
+        if offset:
+            # drop anything past what the sidecar vouches for
+            with open(partial.path, 'r+b') as fh:
+                fh.truncate(offset)
+        partial.write(url, resp.headers, offset)
+
+        digest_builder = hashlib.new('md5')
+        extract_directory = destination_directory and destination_directory + '.x~'
+        streamed_bytes = offset
+        try:
+            with open(partial.path, 'ab' if offset else 'wb') as fh:
+                resumed_fh = open(partial.path, 'rb') if offset else None
+                stream = _DownloadStream(resp, fh, digest_builder, report_progress,
+                                         resumed_fh, offset)
+                try:
+                    if extract_directory:
+                        rm_rf(extract_directory)
+                        extract_tarball_stream(stream, extract_directory)
+                    stream.drain()
+                finally:
+                    streamed_bytes = stream.streamed_bytes
+                    if resumed_fh is not None:
+                        resumed_fh.close()
+
+            if content_length and streamed_bytes != content_length:
+                # TODO: needs to be a more-specific error type
+                message = dals("""
+                Downloaded bytes did not match Content-Length
+                  url: %(url)s
+                  target_path: %(target_path)s
+                  Content-Length: %(content_length)d
+                  downloaded bytes: %(downloaded_bytes)d
+                """)
+                raise CondaError(message, url=url, target_path=target_full_path,
+                                 content_length=content_length,
+                                 downloaded_bytes=streamed_bytes)
+
+            if md5sum and digest_builder.hexdigest() != md5sum:
+                log.debug("MD5 sums mismatch for download: %s (%s != %s), "
+                          "trying again" % (url, digest_builder.hexdigest(), md5sum))
+                # the partial file is no good to resume from either
+                partial.remove()
+                # TODO: refactor this exception
+                raise MD5MismatchError("MD5 sums mismatch for download: %s (%s != %s)"
+                                       % (url, digest_builder.hexdigest(), md5sum))
+
+            backoff_rename(partial.path, target_full_path)
+            rm_rf(partial.sidecar_path)
+
+            if extract_directory:
+                # the tarball checks out; commit the extracted package
+                backoff_rename(extract_directory, destination_directory)
+
+        except (IOError, OSError) as e:
+            if e.errno == 104:
+                # Connection reset by peer
+                log.debug("%s, trying again" % e)
+            raise
+
+        finally:
+            if lexists(partial.path):
+                # keep what we have, so the next attempt can pick up where this one left off
+                partial.write(url, resp.headers, getsize(partial.path))
+            if extract_directory:
+                rm_rf(extract_directory)
+
+        # the md5 of the downloaded file, so callers never have to hash it again
+        return digest_builder.hexdigest()
 
     except (ConnectionError, HTTPError, SSLError) as e:
         # status_code might not exist on SSLError
@@ -121,5 +311,228 @@ def download(url, target_full_path, md5sum):
                              getattr(e.response, 'elapsed', None))
 
     finally:
-        if content_length:
+        if content_length and log_progress:
             getLogger('fetch.stop').info(None)
+
+
+class DownloadScheduler(object):
+    """Run downloads on a shared set of connections, with a queue per host.
+
+    Queued downloads start largest first, so the biggest packages aren't the ones still running
+    once everything else is done.  At most max_connections downloads run at once, and a host
+    gets at most its entry in host_connections, or default_host_connections if it has none, so
+    one slow mirror can't tie up every connection while another host sits idle.  Downloads from
+    a host with an entry in host_bandwidth share that many bytes per second between them.
+
+    Host keys are either a host name, or a host name and port, as in 'repo.example.com:8080'.
+    """
+
+    def __init__(self, max_connections, host_connections=None, host_bandwidth=None,
+                 default_host_connections=0):
+        self.max_connections = max(max_connections, 1)
+        self.host_connections = dict(host_connections or {})
+        self.default_host_connections = default_host_connections
+        self._throttles = dict((host, _Throttle(rate))
+                               for host, rate in iteritems(host_bandwidth or {}) if rate)
+        self._condition = Condition()
+        self._queue = []  # sorted (-size, sequence number, host, job)
+        self._sequence = count()
+        self._hosts = {}
+        self._threads = []
+        self._shutdown = False
+
+    @classmethod
+    def from_context(cls):
+        host_bandwidth = {}
+        for host, rate in iteritems(context.fetch_host_bandwidth):
+            try:
+                host_bandwidth[host] = parse_human_bytes(rate)
+            except ValueError:
+                raise CondaValueError("Invalid fetch_host_bandwidth for %s: %r" % (host, rate))
+        return cls(context.fetch_threads, context.fetch_host_threads, host_bandwidth,
+                   context.fetch_threads_per_host)
+
+    def submit(self, url, size, fn, progress_update_callback=None):
+        """Queue fn(progress_update_callback) as the download of url, and return its Future.
+
+        fn gets a callback wrapping progress_update_callback, and has to report the download's
+        progress through it; that's where throughput is measured and bandwidth caps applied.
+        """
+        from concurrent.futures import Future
+        future = Future()
+        host = _url_host(url)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule downloads after shutdown")
+            self._host_stats(host).queued += 1
+            insort(self._queue, (-(size or 0), next(self._sequence), host,
+                                 (future, fn, progress_update_callback)))
+            if len(self._threads) < self.max_connections:
+                thread = Thread(target=self._work, name='download-%d' % len(self._threads))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._condition.notify_all()
+        return future
+
+    def run(self, url, fn, progress_update_callback=None):
+        """Run fn(progress_update_callback) as the download of url, in this thread.
+
+        It's measured and throttled like a submitted download, but doesn't wait for a
+        connection, so it's for running downloads one at a time without any threads.
+        """
+        host = _url_host(url)
+        with self._condition:
+            host_stats = self._host_stats(host)
+            host_stats.active += 1
+            host_stats.started = host_stats.started or time()
+        try:
+            return fn(self._make_update_callback(host, progress_update_callback))
+        finally:
+            with self._condition:
+                host_stats.active -= 1
+                host_stats.finished = time()
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            for host, host_stats in sorted(iteritems(self.stats()['hosts'])):
+                log.debug("downloaded %s from %s at %s/s", human_bytes(host_stats['bytes']),
+                          host or 'local files', human_bytes(host_stats['bytes_per_second']))
+
+    def stats(self):
+        """The queue depth and throughput of the scheduler, in total and for each host.
+
+        Returns a dict of queued and active downloads, bytes downloaded so far, and
+        bytes_per_second, with the same for each host under 'hosts'.
+        """
+        now = time()
+        with self._condition:
+            hosts = dict((host, host_stats.as_dict(now))
+                         for host, host_stats in iteritems(self._hosts))
+            started = min([host_stats.started for host_stats in itervalues(self._hosts)
+                           if host_stats.started] or [now])
+        downloaded_bytes = sum(host_stats['bytes'] for host_stats in itervalues(hosts))
+        elapsed = now - started
+        return {
+            'queued': sum(host_stats['queued'] for host_stats in itervalues(hosts)),
+            'active': sum(host_stats['active'] for host_stats in itervalues(hosts)),
+            'bytes': downloaded_bytes,
+            'bytes_per_second': int(downloaded_bytes / elapsed) if elapsed > 0 else 0,
+            'hosts': hosts,
+        }
+
+    def _host_stats(self, host):
+        host_stats = self._hosts.get(host)
+        if host_stats is None:
+            host_stats = self._hosts[host] = _HostStats()
+        return host_stats
+
+    def _host_setting(self, settings, host):
+        if host in settings:
+            return settings[host]
+        return settings.get(host.rsplit(':', 1)[0])
+
+    def _host_limit(self, host):
+        return (self._host_setting(self.host_connections, host)
+                or self.default_host_connections or self.max_connections)
+
+    def _pop_job(self):
+        # the largest queued download from a host that has a connection to spare
+        for index, (_, _, host, job) in enumerate(self._queue):
+            if self._hosts[host].active < self._host_limit(host):
+                del self._queue[index]
+                return host, job
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                next_job = self._pop_job()
+                while next_job is None:
+                    if self._shutdown and not self._queue:
+                        return
+                    self._condition.wait()
+                    next_job = self._pop_job()
+                host, (future, fn, progress_update_callback) = next_job
+                host_stats = self._hosts[host]
+                host_stats.queued -= 1
+                host_stats.active += 1
+                host_stats.started = host_stats.started or time()
+            try:
+                if future.set_running_or_notify_cancel():
+                    callback = self._make_update_callback(host, progress_update_callback)
+                    try:
+                        result = fn(callback)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._condition:
+                    host_stats.active -= 1
+                    host_stats.finished = time()
+                    self._condition.notify_all()
+
+    def _make_update_callback(self, host, progress_update_callback):
+        host_stats = self._hosts[host]
+        throttle = self._host_setting(self._throttles, host)
+        last_streamed = [0]
+
+        def update_callback(streamed_bytes, content_length):
+            # a retried download reports from zero again
+            new_bytes = streamed_bytes - last_streamed[0]
+            if new_bytes < 0:
+                new_bytes = streamed_bytes
+            last_streamed[0] = streamed_bytes
+            with self._condition:
+                host_stats.bytes += new_bytes
+            if progress_update_callback is not None:
+                progress_update_callback(streamed_bytes, content_length)
+            if throttle is not None:
+                throttle.consume(new_bytes)
+        return update_callback
+
+
+class _HostStats(object):
+
+    def __init__(self):
+        self.queued = self.active = self.bytes = 0
+        self.started = self.finished = None
+
+    def as_dict(self, now):
+        elapsed = ((now if self.active else self.finished) - self.started) if self.started else 0
+        return {
+            'queued': self.queued,
+            'active': self.active,
+            'bytes': self.bytes,
+            'bytes_per_second': int(self.bytes / elapsed) if elapsed > 0 else 0,
+        }
+
+
+class _Throttle(object):
+    # Spaces out the reads of the downloads sharing it, so together they average no more than
+    #   rate bytes per second.
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._lock = Lock()
+        self._available_at = 0.
+
+    def consume(self, nbytes):
+        with self._lock:
+            now = time()
+            self._available_at = max(self._available_at, now) + nbytes / self.rate
+            delay = self._available_at - now
+        if delay > 0:
+            sleep(delay)
+
+
+def _url_host(url):
+    parsed = urlparse(url)
+    host = (parsed.host or '').lower()
+    return '%s:%d' % (host, parsed.port) if parsed.port else host
@@ -109,6 +109,7 @@ def SYMLINK_CONDA_CMD(state, arg):
 def PROGRESSIVEFETCHEXTRACT_CMD(state, progressive_fetch_extract):
     assert isinstance(progressive_fetch_extract, ProgressiveFetchExtract)
     progressive_fetch_extract.execute()
+    _record_performance(state, progressive_fetch_extract)
 
 
 def UNLINKLINKTRANSACTION_CMD(state, arg):
@@ -117,6 +118,17 @@ def UNLINKLINKTRANSACTION_CMD(state, arg):
     prefix = state['prefix']
     txn = UnlinkLinkTransaction.create_from_dists(index, prefix, unlink_dists, link_dists)
     txn.execute()
+    _record_performance(state, txn)
+
+
+def _record_performance(state, executed):
+    # what a ProgressiveFetchExtract or UnlinkLinkTransaction estimated it would do, next to
+    #   what it measured doing, for execute_instructions() to return
+    performance = state.setdefault('performance', {'estimate': {}, 'measured': {}})
+    performance['estimate'].update(executed.estimate or {})
+    performance['measured'].update(executed.measured or {})
+    log.info("%s estimated %r, measured %r", type(executed).__name__, executed.estimate,
+             executed.measured)
 
 
 def check_files_in_package(source_dir, files):
@@ -232,6 +244,8 @@ def execute_instructions(plan, index=None, verbose=False, _commands=None):
     :param verbose: verbose output
     :param _commands: (For testing only) dict mapping an instruction to executable if None
     then the default commands will be used
+    :return: the estimated and measured costs of fetching, extracting and linking packages,
+    as {'estimate': {...}, 'measured': {...}}, or None if the plan didn't do any of that
     """
     if _commands is None:
         _commands = commands
@@ -262,3 +276,5 @@ def execute_instructions(plan, index=None, verbose=False, _commands=None):
 
             state['i'] = None
             getLogger('progress.stop').info(None)
+
+    return state.get('performance')
@@ -17,8 +17,9 @@ from .common.compat import iteritems, iterkeys, itervalues, odict, on_win
 from .common.path import url_to_path
 from .common.url import is_url, join_url, path_to_url
 from .core.index import get_index
-from .core.linked_data import is_linked, linked as install_linked, linked_data
+from .core.linked_data import linked as install_linked, linked_data, path_owners
 from .exceptions import (CondaRuntimeError, ParseError)
+from .gateways.disk.create import copy_file
 from .gateways.disk.delete import rm_rf
 from .gateways.disk.read import compute_md5sum
 from .instructions import EXTRACT, FETCH, LINK, RM_EXTRACTED, RM_FETCHED, SYMLINK_CONDA, UNLINK
@@ -33,13 +34,12 @@ def conda_installed_files(prefix, exclude_self_build=False):
     Return the set of files which have been installed (using conda) into
     a given prefix.
     """
-    res = set()
-    for dist in install_linked(prefix):
-        meta = is_linked(prefix, dist)
-        if exclude_self_build and 'file_hash' in meta:
-            continue
-        res.update(set(meta.get('files', ())))
-    return res
+    owners = path_owners(prefix)
+    if not exclude_self_build:
+        return set(owners)
+    recs = linked_data(prefix)
+    return set(path for path, dists in iteritems(owners)
+               if any('file_hash' not in recs[dist] for dist in dists))
 
 
 url_pat = re.compile(r'(?:(?P<url_p>.+)(?:[/\\]))?'
@@ -325,13 +325,15 @@ def clone_env(prefix1, prefix2, verbose=True, quiet=False, index_args=None):
 
         try:
             s = data.decode('utf-8')
-            s = s.replace(prefix1, prefix2)
-            data = s.encode('utf-8')
         except UnicodeDecodeError:  # data is binary
-            pass
+            s = None
+        if s is None or prefix1 not in s:
+            # nothing to rewrite, so let the filesystem copy it
+            copy_file(src, dst)
+            continue
 
         with open(dst, 'wb') as fo:
-            fo.write(data)
+            fo.write(s.replace(prefix1, prefix2).encode('utf-8'))
         shutil.copystat(src, dst)
 
     actions = explicit(urls, prefix2, verbose=not quiet, index=index,
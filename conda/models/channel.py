@@ -56,16 +56,122 @@ def _get_channel_for_name(channel_name):
 
     if channel is not None:
         # stripping off path threw information away from channel_name (i.e. any potential subname)
-        # channel.name *should still be* channel_name
-        channel.name = channel_name
-        return channel
+        # channel.name *should still be* channel_name; copy rather than rename the configured
+        # channel, which is shared through context.custom_channels
+        return Channel(scheme=channel.scheme, auth=channel.auth, location=channel.location,
+                       token=channel.token, name=channel_name)
     else:
         ca = context.channel_alias
         return Channel(scheme=ca.scheme, auth=ca.auth, location=ca.location, token=ca.token,
                        name=channel_name)
 
 
+class _LocationTrie(object):
+    """Prefix index over url-like strings, walked one '/'-separated segment at a time.
+
+    Keys are inserted in priority order.  Each node holds the entries whose key ends within
+    the next segment, so a string match costs one dict lookup per segment of the tested url
+    plus a startswith against the (few) entries stored at each node.  With tokenized=True,
+    the last segment of a key must equal a whole segment of the url, and keys that extend
+    past the end of the url also match, mirroring tokenized_startswith.
+    """
+
+    def __init__(self, tokenized=False):
+        self.tokenized = tokenized
+        self._order = 0
+        self._root = self._node()
+
+    @staticmethod
+    def _node():
+        # entries ending in this node, best entry in this node's subtree, children
+        return [[], None, {}]
+
+    def add(self, segments, payload):
+        entry = (self._order, segments[-1], payload)
+        self._order += 1
+        node = self._root
+        for segment in segments[:-1]:
+            if node[1] is None:
+                node[1] = entry
+            node = node[2].setdefault(segment, self._node())
+        if node[1] is None:
+            node[1] = entry
+        node[0].append(entry)
+        if self.tokenized:
+            leaf = node[2].setdefault(segments[-1], self._node())
+            if leaf[1] is None:
+                leaf[1] = entry
+
+    def find(self, segments):
+        best = None
+        node = self._root
+        for segment in segments:
+            for entry in node[0]:
+                if (segment == entry[1] if self.tokenized else segment.startswith(entry[1])):
+                    if best is None or entry[0] < best[0]:
+                        best = entry
+                    break
+            node = node[2].get(segment)
+            if node is None:
+                break
+        else:
+            if self.tokenized and node[1] is not None and (best is None or node[1][0] < best[0]):
+                # the url ran out of segments; every key continuing past it matches
+                best = node[1]
+        return best and best[2]
+
+
+def _tokenize_conda_url(url):
+    url = urlparse(url)
+    return ((url.host, url.port),) + tuple((url.path.strip('/') or '/').split('/'))
+
+
+class _ChannelLocationIndex(object):
+    """The channel configuration in context, precompiled for _read_channel_configuration."""
+
+    def __init__(self):
+        # Step 2; tokenized prefix match, longest channel name first
+        self.migrated_custom_channels = _LocationTrie(tokenized=True)
+        for name, location in sorted(context.migrated_custom_channels.items(), reverse=True,
+                                     key=lambda x: len(x[0])):
+            location, _scheme, _auth, _token = split_scheme_auth_token(location)
+            self.migrated_custom_channels.add(_tokenize_conda_url(join_url(location, name)),
+                                              (name, location))
+
+        # Steps 3, 4 and 5; plain string prefix match, in order of precedence
+        self.locations = _LocationTrie()
+        for migrated_alias in context.migrated_channel_aliases:
+            self.locations.add(migrated_alias.location.split('/'), (3, migrated_alias))
+        for name, channel in sorted(context.custom_channels.items(), reverse=True,
+                                    key=lambda x: len(x[0])):
+            self.locations.add(join_url(channel.location, channel.name).split('/'),
+                               (4, channel))
+        ca = context.channel_alias
+        if ca.location:
+            self.locations.add(ca.location.split('/'), (5, ca))
+
+
+# Results of _read_channel_configuration, keyed on everything in a url except the platform,
+#   package filename and credentials; so all packages in a channel share one entry.
+_channel_configuration_cache_ = odict()
+_CHANNEL_CONFIGURATION_CACHE_SIZE = 1024
+_CHANNEL_CACHE_SIZE = 8192
+_channel_location_index_ = []
+
+
 def _read_channel_configuration(scheme, host, port, path):
+    key = scheme, host, port, path
+    try:
+        return _channel_configuration_cache_[key]
+    except KeyError:
+        if len(_channel_configuration_cache_) >= _CHANNEL_CONFIGURATION_CACHE_SIZE:
+            _channel_configuration_cache_.popitem(last=False)
+        result = _channel_configuration_cache_[key] = _read_channel_configuration_uncached(
+            scheme, host, port, path)
+        return result
+
+
+def _read_channel_configuration_uncached(scheme, host, port, path):
     # return location, name, scheme, auth, token
 
     path = path and path.rstrip('/')
@@ -75,38 +181,41 @@ def _read_channel_configuration(scheme, host, port, path):
     if not path:
         return Url(host=host, port=port).url.rstrip('/'), None, scheme or None, None, None
 
+    if not _channel_location_index_:
+        _channel_location_index_.append(_ChannelLocationIndex())
+    index = _channel_location_index_[0]
+
     # Step 2. migrated_custom_channels matches
-    for name, location in sorted(context.migrated_custom_channels.items(), reverse=True,
-                                 key=lambda x: len(x[0])):
-        location, _scheme, _auth, _token = split_scheme_auth_token(location)
-        if tokenized_conda_url_startswith(test_url, join_url(location, name)):
-            # translate location to new location, with new credentials
-            subname = test_url.replace(join_url(location, name), '', 1).strip('/')
-            channel_name = join_url(name, subname)
-            channel = _get_channel_for_name(channel_name)
-            return channel.location, channel_name, channel.scheme, channel.auth, channel.token
-
-    # Step 3. migrated_channel_aliases matches
-    for migrated_alias in context.migrated_channel_aliases:
-        if test_url.startswith(migrated_alias.location):
-            name = test_url.replace(migrated_alias.location, '', 1).strip('/')
+    match = index.migrated_custom_channels.find(_tokenize_conda_url(test_url))
+    if match:
+        name, location = match
+        # translate location to new location, with new credentials
+        subname = test_url.replace(join_url(location, name), '', 1).strip('/')
+        channel_name = join_url(name, subname)
+        channel = _get_channel_for_name(channel_name)
+        return channel.location, channel_name, channel.scheme, channel.auth, channel.token
+
+    match = index.locations.find(test_url.split('/'))
+    if match:
+        step, channel = match
+
+        # Step 3. migrated_channel_aliases matches
+        if step == 3:
+            name = test_url.replace(channel.location, '', 1).strip('/')
             ca = context.channel_alias
             return ca.location, name, ca.scheme, ca.auth, ca.token
 
-    # Step 4. custom_channels matches
-    for name, channel in sorted(context.custom_channels.items(), reverse=True,
-                                key=lambda x: len(x[0])):
-        that_test_url = join_url(channel.location, channel.name)
-        if test_url.startswith(that_test_url):
+        # Step 4. custom_channels matches
+        elif step == 4:
+            that_test_url = join_url(channel.location, channel.name)
             subname = test_url.replace(that_test_url, '', 1).strip('/')
             return (channel.location, join_url(channel.name, subname), scheme,
                     channel.auth, channel.token)
 
-    # Step 5. channel_alias match
-    ca = context.channel_alias
-    if ca.location and test_url.startswith(ca.location):
-        name = test_url.replace(ca.location, '', 1).strip('/') or None
-        return ca.location, name, scheme, ca.auth, ca.token
+        # Step 5. channel_alias match
+        else:
+            name = test_url.replace(channel.location, '', 1).strip('/') or None
+            return channel.location, name, scheme, channel.auth, channel.token
 
     # Step 6. not-otherwise-specified file://-type urls
     if host is None:
@@ -158,6 +267,8 @@ class ChannelType(type):
             elif value in Channel._cache_:
                 return Channel._cache_[value]
             else:
+                if len(Channel._cache_) >= _CHANNEL_CACHE_SIZE:
+                    Channel._cache_.popitem(last=False)
                 c = Channel._cache_[value] = Channel.from_value(value)
                 return c
         else:
@@ -174,11 +285,13 @@ class Channel(object):
     channel <> subchannel <> namespace <> package_name
 
     """
-    _cache_ = dict()
+    _cache_ = odict()
 
     @staticmethod
     def _reset_state():
-        Channel._cache_ = dict()
+        Channel._cache_ = odict()
+        _channel_configuration_cache_.clear()
+        del _channel_location_index_[:]
 
     def __init__(self, scheme=None, auth=None, location=None, token=None, name=None,
                  platform=None, package_filename=None):
@@ -9,19 +9,19 @@ from .channel import Channel
 from .package_info import PackageInfo
 from .index_record import IndexRecord
 from .. import CondaError
-from .._vendor.auxlib.entity import Entity, EntityType, StringField, IntegerField
 from ..base.constants import CONDA_TARBALL_EXTENSION, DEFAULTS, UNKNOWN_CHANNEL
 from ..base.context import context
-from ..common.compat import ensure_text_type, text_type, with_metaclass
+from ..common.compat import ensure_text_type, odict, text_type, with_metaclass
 from ..common.constants import NULL
 from ..common.url import has_platform, is_url, join_url
 
 log = getLogger(__name__)
 DistDetails = namedtuple('DistDetails', ('name', 'version', 'build_string', 'build_number',
                                          'dist_name'))
+_nullable_fields = frozenset(('channel', 'with_features_depends', 'base_url', 'platform'))
 
 
-class DistType(EntityType):
+class DistType(type):
 
     def __call__(cls, *args, **kwargs):
         if len(args) == 1 and not kwargs:
@@ -38,39 +38,79 @@ class DistType(EntityType):
             elif isinstance(value, Channel):
                 return Dist.from_url(value.url())
             else:
-                return Dist.from_string(value)
+                # strings are the common case; parse each distinct one only once
+                try:
+                    return Dist._cache_[value]
+                except (KeyError, TypeError):
+                    dist = Dist.from_string(value)
+                    if dist.base_url is None:
+                        Dist._cache_[value] = dist
+                    return dist
         else:
-            return super(DistType, cls).__call__(*args, **kwargs)
+            dist = super(DistType, cls).__call__(*args, **kwargs)
+            if dist.base_url is None:
+                # intern by canonical string, so equal dists share one object
+                return Dist._interned_.setdefault(dist._str, dist)
+            return dist
 
 
 @with_metaclass(DistType)
-class Dist(Entity):
+class Dist(object):
+    """An immutable reference to a conda package: channel, dist name and feature variant.
 
-    channel = StringField(required=False, nullable=True, immutable=True)
+    Dists are created very often during a solve, so they are slotted, hash once at
+    construction and are interned by their canonical string. Dists carrying a url
+    (base_url and platform) depend on channel configuration and are not interned.
+    """
 
-    dist_name = StringField(immutable=True)
-    name = StringField(immutable=True)
-    version = StringField(immutable=True)
-    build_string = StringField(immutable=True)
-    build_number = IntegerField(immutable=True)
+    __slots__ = ('channel', 'dist_name', 'name', 'version', 'build_string', 'build_number',
+                 'with_features_depends', 'base_url', 'platform', '_str', '_key', '_hash',
+                 '_quad')
 
-    with_features_depends = StringField(required=False, nullable=True, immutable=True)
-    base_url = StringField(required=False, nullable=True, immutable=True)
-    platform = StringField(required=False, nullable=True, immutable=True)
+    _fields = ('channel', 'dist_name', 'name', 'version', 'build_string', 'build_number',
+               'with_features_depends', 'base_url', 'platform')
+    _cache_ = dict()  # Dict[str, Dist]; strings already parsed by from_string
+    _interned_ = dict()  # Dict[str, Dist]; keyed by canonical string
 
     def __init__(self, channel, dist_name=None, name=None, version=None, build_string=None,
                  build_number=None, with_features_depends=None, base_url=None, platform=None):
-        # if name is None:
-        #     import pdb; pdb.set_trace()
-        super(Dist, self).__init__(channel=channel,
-                                   dist_name=dist_name,
-                                   name=name,
-                                   version=version,
-                                   build_string=build_string,
-                                   build_number=build_number,
-                                   with_features_depends=with_features_depends,
-                                   base_url=base_url,
-                                   platform=platform)
+        if dist_name is None or name is None:
+            raise CondaError("Dist requires a dist_name and a name")
+        _set = object.__setattr__
+        _set(self, 'channel', channel)
+        _set(self, 'dist_name', dist_name)
+        _set(self, 'name', name)
+        _set(self, 'version', version)
+        _set(self, 'build_string', build_string)
+        _set(self, 'build_number', build_number)
+        _set(self, 'with_features_depends', with_features_depends)
+        _set(self, 'base_url', base_url)
+        _set(self, 'platform', platform)
+
+        base = "%s::%s" % (channel, dist_name) if channel else dist_name
+        _set(self, '_str', "%s[%s]" % (base, with_features_depends)
+             if with_features_depends else base)
+        _set(self, '_key', (channel, dist_name, with_features_depends))
+        _set(self, '_hash', hash(self._key))
+        _set(self, '_quad', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Assignment not allowed. Dist is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Deletion not allowed. Dist is immutable.")
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, field) for field in self._fields)
+
+    def dump(self):
+        return odict((field, getattr(self, field)) for field in self._fields
+                     if getattr(self, field) is not None or field in _nullable_fields)
+
+    def __repr__(self):
+        return "Dist(%s)" % ", ".join("%s=%r" % (field, getattr(self, field))
+                                      for field in self._fields
+                                      if getattr(self, field) is not None)
 
     @property
     def full_name(self):
@@ -87,15 +127,15 @@ class Dist(Entity):
     @property
     def quad(self):
         # returns: name, version, build_string, channel
-        parts = self.dist_name.rsplit('-', 2) + ['', '']
-        return parts[0], parts[1], parts[2], self.channel or DEFAULTS
+        quad = self._quad
+        if quad is None:
+            parts = self.dist_name.rsplit('-', 2) + ['', '']
+            quad = parts[0], parts[1], parts[2], self.channel or DEFAULTS
+            object.__setattr__(self, '_quad', quad)
+        return quad
 
     def __str__(self):
-        base = "%s::%s" % (self.channel, self.dist_name) if self.channel else self.dist_name
-        if self.with_features_depends:
-            return "%s[%s]" % (base, self.with_features_depends)
-        else:
-            return base
+        return self._str
 
     @property
     def is_feature_package(self):
@@ -221,29 +261,30 @@ class Dist(Entity):
                 else join_url(self.base_url, filename))
 
     def __key__(self):
-        return self.channel, self.dist_name, self.with_features_depends
+        return self._key
 
     def __lt__(self, other):
         assert isinstance(other, self.__class__)
-        return self.__key__() < other.__key__()
+        return self._key < other._key
 
     def __gt__(self, other):
         assert isinstance(other, self.__class__)
-        return self.__key__() > other.__key__()
+        return self._key > other._key
 
     def __le__(self, other):
         assert isinstance(other, self.__class__)
-        return self.__key__() <= other.__key__()
+        return self._key <= other._key
 
     def __ge__(self, other):
         assert isinstance(other, self.__class__)
-        return self.__key__() >= other.__key__()
+        return self._key >= other._key
 
     def __hash__(self):
-        return hash(self.__key__())
+        return self._hash
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and self.__key__() == other.__key__()
+        return self is other or (isinstance(other, self.__class__) and
+                                 self._hash == other._hash and self._key == other._key)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from enum import Enum
+from json import dumps as json_dumps, loads as json_loads
+
 from .enums import Arch, LinkType, Platform
+from .._vendor.auxlib.collection import AttrDict
 from .._vendor.auxlib.entity import (BooleanField, ComposableField, DictSafeMixin, Entity,
-                                     EnumField, ImmutableEntity, IntegerField, ListField,
-                                     MapField, StringField)
-from ..common.compat import string_types
+                                     EnumField, IntegerField, ListField, MapField, StringField)
+from .._vendor.auxlib.exceptions import ValidationError
+from .._vendor.auxlib.ish import find_or_none
+from .._vendor.auxlib.logz import DumpEncoder
+from .._vendor.auxlib.type_coercion import maybecall
+from ..common.compat import iteritems, odict, string_types
 
 
 class LinkTypeField(EnumField):
@@ -16,6 +23,7 @@ class LinkTypeField(EnumField):
 
 
 class Link(DictSafeMixin, Entity):
+    __fast_init__ = True
     source = StringField()
     type = LinkTypeField(LinkType, required=False)
 
@@ -43,35 +51,337 @@ EMPTY_LINK = Link(source='')
 #     version = StringField()
 
 
-class IndexRecord(DictSafeMixin, ImmutableEntity):  # rename to IndexRecord
-    arch = EnumField(Arch, required=False, nullable=True)
-    build = StringField()
-    build_number = IntegerField()
-    date = StringField(required=False)
-    depends = ListField(string_types, required=False)
-    features = StringField(required=False)
-    has_prefix = BooleanField(required=False)
-    license = StringField(required=False)
-    license_family = StringField(required=False)
-    md5 = StringField(required=False, nullable=True)
-    name = StringField()
+INDEX_RECORD_FIELDS = odict((name, field.set_name(name)) for name, field in (
+    ('arch', EnumField(Arch, required=False, nullable=True)),
+    ('build', StringField()),
+    ('build_number', IntegerField()),
+    ('date', StringField(required=False)),
+    ('depends', ListField(string_types, required=False)),
+    ('features', StringField(required=False)),
+    ('has_prefix', BooleanField(required=False)),
+    ('license', StringField(required=False)),
+    ('license_family', StringField(required=False)),
+    ('md5', StringField(required=False, nullable=True)),
+    ('name', StringField()),
     # TODO: noarch should support being a string or bool
-    platform = EnumField(Platform, required=False, nullable=True)
-    requires = ListField(string_types, required=False)
-    size = IntegerField(required=False)
-    subdir = StringField(required=False)
-    track_features = StringField(required=False)
-    version = StringField()
-
-    fn = StringField(required=False, nullable=True)
-    schannel = StringField(required=False, nullable=True)
-    channel = StringField(required=False, nullable=True)
-    priority = IntegerField(required=False)
-    url = StringField(required=False, nullable=True)
-    auth = StringField(required=False, nullable=True)
-
-    files = ListField(string_types, default=(), required=False)
-    link = ComposableField(Link, required=False)
-
-    with_features_depends = MapField(required=False)
-    preferred_env = StringField(default=None, required=False, nullable=True)
+    ('platform', EnumField(Platform, required=False, nullable=True)),
+    ('requires', ListField(string_types, required=False)),
+    ('size', IntegerField(required=False)),
+    ('subdir', StringField(required=False)),
+    ('track_features', StringField(required=False)),
+    ('version', StringField()),
+
+    ('fn', StringField(required=False, nullable=True)),
+    ('schannel', StringField(required=False, nullable=True)),
+    ('channel', StringField(required=False, nullable=True)),
+    ('priority', IntegerField(required=False)),
+    ('url', StringField(required=False, nullable=True)),
+    ('auth', StringField(required=False, nullable=True)),
+
+    ('files', ListField(string_types, default=(), required=False)),
+    ('link', ComposableField(Link, required=False)),
+
+    ('with_features_depends', MapField(required=False)),
+    ('preferred_env', StringField(default=None, required=False, nullable=True)),
+))
+_REQUIRED_FIELDS = tuple(name for name, field in iteritems(INDEX_RECORD_FIELDS)
+                         if field.required)
+
+
+def _check_value(name, value):
+    field = INDEX_RECORD_FIELDS[name]
+    return field.validate(None, field.box(None, value))
+
+
+class _RecordSchema(object):
+    """The memory layout shared by every record holding the same set of fields.
+
+    A record stores its own values in a list ordered by ``names``. Values common to a
+    whole group of records (e.g. everything fetched from one channel) live once on the
+    schema in ``shared``.
+    """
+    __slots__ = ('names', 'index', 'shared', '_derived')
+
+    def __init__(self, names, shared):
+        self.names = names
+        self.index = dict((name, i) for i, name in enumerate(names))
+        self.shared = shared
+        self._derived = {}
+
+    def with_fields(self, added):
+        # type: (frozenset) -> Tuple[_RecordSchema, Tuple[Option[int]]]
+        # The schema for records that also store (or override) the fields in added, and
+        # for each of its slots the slot in this schema that can be shared, if any.
+        try:
+            return self._derived[added]
+        except KeyError:
+            shared = dict((k, v) for k, v in iteritems(self.shared) if k not in added)
+            names = tuple(name for name in INDEX_RECORD_FIELDS
+                          if name in self.index or name in added)
+            schema = SharedFields._from_checked(shared).schema_for(names)
+            sources = tuple(None if name in added else self.index[name] for name in names)
+            result = self._derived[added] = schema, sources
+            return result
+
+
+class SharedFields(object):
+    """Validated IndexRecord field values common to many records.
+
+    Build one per channel and pass it to IndexRecord.from_shared; every record created
+    that way references the values here instead of storing its own copy.
+    """
+    __slots__ = ('values', '_schemas', '_layouts')
+
+    def __init__(self, **values):
+        checked = {}
+        for name, value in iteritems(values):
+            if name not in INDEX_RECORD_FIELDS:
+                continue
+            if value is None and not INDEX_RECORD_FIELDS[name].nullable:
+                continue
+            checked[name] = _check_value(name, value)
+        self.values = checked
+        self._schemas = {}
+        self._layouts = {}
+
+    @classmethod
+    def _from_checked(cls, values):
+        self = cls()
+        self.values = values
+        return self
+
+    def schema_for(self, names):
+        try:
+            return self._schemas[names]
+        except KeyError:
+            missing = [name for name in _REQUIRED_FIELDS
+                       if name not in names and name not in self.values]
+            if missing:
+                raise ValidationError(missing[0], msg="IndexRecord requires a {0} field."
+                                                      "".format(missing[0]))
+            schema = self._schemas[names] = _RecordSchema(names, self.values)
+            return schema
+
+    def layout_for(self, keys):
+        # type: (Tuple[str]) -> Tuple[_RecordSchema, Tuple[str]]
+        # Records parsed from one repodata.json almost always have identical keys in
+        # identical order, so the layout is looked up once per distinct key tuple.
+        try:
+            return self._layouts[keys]
+        except KeyError:
+            keyset = set(keys)
+            names = tuple(name for name in INDEX_RECORD_FIELDS
+                          if name in keyset and name not in self.values)
+            layout = self._layouts[keys] = self.schema_for(names), names
+            return layout
+
+
+_NO_SHARED_FIELDS = SharedFields()
+
+
+def _load_index_record(data):
+    return IndexRecord(**data)
+
+
+class IndexRecord(object):
+    """The metadata record of one package, as found in repodata.json or conda-meta.
+
+    Records are immutable and support both attribute and dict-style access. Indexes
+    hold hundreds of thousands of them, so values are stored compactly in a list laid
+    out by a shared schema, and each field is boxed and validated the first time it is
+    read rather than at construction. Only the presence of required fields is checked
+    up front.
+    """
+    __slots__ = ('_schema', '_values', '_checked')
+    __fields__ = INDEX_RECORD_FIELDS
+
+    def __init__(self, **kwargs):
+        self._init(_NO_SHARED_FIELDS, kwargs)
+
+    def _init(self, shared, info):
+        schema, names = shared.layout_for(tuple(info))
+        values = [info[name] for name in names]
+        if None in values:
+            # a None value means "not set" unless the field is nullable
+            info = dict((name, info[name]) for name in names
+                        if info[name] is not None or INDEX_RECORD_FIELDS[name].nullable)
+            schema, names = shared.layout_for(tuple(info))
+            values = [info[name] for name in names]
+        _set = object.__setattr__
+        _set(self, '_schema', schema)
+        _set(self, '_values', values)
+        _set(self, '_checked', 0)
+
+    @classmethod
+    def from_shared(cls, shared, info):
+        """Create a record from info, referencing the values in shared (a SharedFields)
+        instead of storing them. Keys of info that are also in shared are ignored.
+        """
+        self = object.__new__(cls)
+        self._init(shared, info)
+        return self
+
+    @classmethod
+    def from_objects(cls, *objects, **override_fields):
+        override_fields = dict((key, value) for key, value in iteritems(override_fields)
+                               if key in INDEX_RECORD_FIELDS and value is not None)
+        if len(objects) == 1 and isinstance(objects[0], IndexRecord):
+            # the common case of copying a record with a few fields replaced; unchanged
+            # values (validated or not) are shared with the original record
+            base = objects[0]
+            if not override_fields:
+                return base
+            schema, sources = base._schema.with_fields(frozenset(override_fields))
+            base_values, base_checked = base._values, base._checked
+            values, checked = [], 0
+            for i, (name, source) in enumerate(zip(schema.names, sources)):
+                if source is None:
+                    values.append(override_fields[name])
+                else:
+                    values.append(base_values[source])
+                    if base_checked & (1 << source):
+                        checked |= 1 << i
+            self = object.__new__(cls)
+            _set = object.__setattr__
+            _set(self, '_schema', schema)
+            _set(self, '_values', values)
+            _set(self, '_checked', checked)
+            return self
+
+        search_maps = tuple(AttrDict(o) if isinstance(o, dict) else o
+                            for o in ((override_fields,) + objects))
+        return cls(**dict((key, find_or_none(key, search_maps))
+                          for key in INDEX_RECORD_FIELDS))
+
+    @classmethod
+    def from_json(cls, json_str):
+        return cls(**json_loads(json_str))
+
+    @classmethod
+    def load(cls, data_dict):
+        return cls(**data_dict)
+
+    def __getattr__(self, name):
+        # only reached for field names; everything else is a slot or a class attribute
+        if name.startswith('_'):
+            raise AttributeError(name)
+        schema = self._schema
+        try:
+            i = schema.index[name]
+        except KeyError:
+            try:
+                return schema.shared[name]
+            except KeyError:
+                field = INDEX_RECORD_FIELDS.get(name)
+                if field is None:
+                    raise AttributeError("'IndexRecord' object has no attribute '%s'" % name)
+                if field.default is not None:
+                    return maybecall(field.default)
+                elif field.nullable:
+                    return None
+                raise AttributeError("A value for {0} has not been set".format(name))
+        bit = 1 << i
+        if self._checked & bit:
+            return self._values[i]
+        value = self._values[i] = _check_value(name, self._values[i])
+        object.__setattr__(self, '_checked', self._checked | bit)
+        return value
+
+    def __setattr__(self, attribute, value):
+        raise AttributeError("Assignment not allowed. IndexRecord is immutable.")
+
+    def __delattr__(self, item):
+        raise AttributeError("Deletion not allowed. IndexRecord is immutable.")
+
+    def validate(self):
+        for name in self._schema.names:
+            getattr(self, name)
+
+    def _set_names(self):
+        schema = self._schema
+        return (name for name in INDEX_RECORD_FIELDS
+                if name in schema.index or name in schema.shared)
+
+    # dict-style access, as DictSafeMixin provides for entities
+
+    def __getitem__(self, item):
+        return self.__getattr__(item)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        delattr(self, key)
+
+    def get(self, item, default=None):
+        try:
+            return self.__getattr__(item)
+        except AttributeError:
+            return default
+
+    def __contains__(self, item):
+        value = getattr(self, item, None)
+        if value is None:
+            return False
+        if isinstance(INDEX_RECORD_FIELDS[item], (MapField, ListField)):
+            return len(value) > 0
+        return True
+
+    def __iter__(self):
+        for key in INDEX_RECORD_FIELDS:
+            if key in self:
+                yield key
+
+    def iteritems(self):
+        for key in INDEX_RECORD_FIELDS:
+            if key in self:
+                yield key, getattr(self, key)
+
+    def items(self):
+        return self.iteritems()
+
+    def copy(self):
+        return self.__class__(**self.dump())
+
+    def setdefault(self, key, default_value):
+        if key not in self:
+            setattr(self, key, default_value)
+
+    def update(self, E=None, **F):
+        raise AttributeError("Assignment not allowed. IndexRecord is immutable.")
+
+    def dump(self):
+        return odict((name, field.dump(value))
+                     for name, field, value in ((name, field, getattr(self, name, None))
+                                                for name, field in iteritems(INDEX_RECORD_FIELDS)
+                                                if field.in_dump)
+                     if value is not None or field.nullable)
+
+    def json(self, indent=None, separators=None, **kwargs):
+        return json_dumps(self, indent=indent, separators=separators, cls=DumpEncoder, **kwargs)
+
+    def pretty_json(self, indent=2, separators=(',', ': '), **kwargs):
+        return self.json(indent=indent, separators=separators, **kwargs)
+
+    def __reduce__(self):
+        return _load_index_record, (self.dump(),)
+
+    def __eq__(self, other):
+        if self.__class__ != other.__class__:
+            return False
+        rando_default = 19274656290  # need an arbitrary but definite value if field does not exist
+        return all(getattr(self, field, rando_default) == getattr(other, field, rando_default)
+                   for field in INDEX_RECORD_FIELDS)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return sum(hash(getattr(self, field, None)) for field in INDEX_RECORD_FIELDS)
+
+    def __repr__(self):
+        def _val(key):
+            val = getattr(self, key)
+            return repr(val.value) if isinstance(val, Enum) else repr(val)
+        return "IndexRecord(%s)" % ", ".join("%s=%s" % (key, _val(key))
+                                             for key in self._set_names())
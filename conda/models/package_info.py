@@ -14,16 +14,19 @@ log = getLogger(__name__)
 
 
 class Noarch(Entity):
+    __fast_init__ = True
     type = StringField()
     entry_points = ListField(string_types, required=False)
 
 
 class PreferredEnv(Entity):
+    __fast_init__ = True
     name = StringField()
     executable_paths = ListField(string_types, required=False)
 
 
 class PackageMetadata(Entity):
+    __fast_init__ = True
     # from info/package_metadata.json
     package_metadata_version = IntegerField()
     noarch = ComposableField(Noarch, required=False)
@@ -31,6 +34,7 @@ class PackageMetadata(Entity):
 
 
 class PathData(Entity):
+    __fast_init__ = True
     _path = StringField()
     prefix_placeholder = StringField(required=False, nullable=True)
     file_mode = EnumField(FileMode, required=False, nullable=True)
@@ -50,12 +54,14 @@ class PathDataV1(PathData):
 
 
 class PathsData(Entity):
+    __fast_init__ = True
     # from info/paths.json
     paths_version = IntegerField()
     paths = ListField(PathData)
 
 
 class PackageInfo(ImmutableEntity):
+    __fast_init__ = True
 
     # attributes external to the package tarball
     extracted_package_dir = StringField()
@@ -68,3 +74,11 @@ class PackageInfo(ImmutableEntity):
     icondata = StringField(required=False, nullable=True)
     package_metadata = ComposableField(PackageMetadata, required=False, nullable=True)
     paths_data = ComposableField(PathsData)
+
+    def load_icondata(self):
+        # info/icon.png, base64 encoded; it's only read when it's asked for, as linking the
+        #   package doesn't need it
+        if self.icondata is not None:
+            return self.icondata
+        from ..gateways.disk.read import read_icondata
+        return read_icondata(self.extracted_package_dir)
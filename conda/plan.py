@@ -20,15 +20,17 @@ from .base.constants import DEFAULTS, UNKNOWN_CHANNEL
 from .base.context import context
 from .cli import common
 from .cli.common import pkg_if_in_private_env, prefix_if_in_private_env
-from .common.compat import itervalues, odict, on_win
+from .common.compat import itervalues, odict, on_win, text_type
 from .common.path import (is_private_env, preferred_env_matches_prefix,
                           preferred_env_to_prefix, prefix_to_env_name)
 from .core.index import supplement_index_with_prefix
 from .core.linked_data import is_linked, linked_data
-from .core.package_cache import ProgressiveFetchExtract
+from .core.link import UnlinkLinkTransaction
+from .core.package_cache import PackageCache, ProgressiveFetchExtract
 from .exceptions import (ArgumentError, CondaIndexError, CondaRuntimeError, InstallError,
                          PackageNotFoundError, RemoveError)
 from .gateways.disk.create import mkdir_p
+from .gateways.disk.read import read_package_info
 from .history import History
 from .instructions import (ACTION_CODES, CHECK_EXTRACT, CHECK_FETCH, EXTRACT, FETCH, LINK, PREFIX,
                            PRINT, PROGRESS, PROGRESSIVEFETCHEXTRACT, PROGRESS_COMMANDS,
@@ -61,6 +63,58 @@ def print_dists(dists_extras):
         print(line)
 
 
+def estimate_actions(actions, index):
+    """
+    Estimate the work executing actions will do, without fetching or extracting anything.
+    What packages link into the prefix can only be counted once they're extracted, so the
+    link estimates leave out the packages listed as unestimated_packages.
+    """
+    prefix = actions[PREFIX]
+    link_dists = tuple(Dist(d) for d in actions.get(LINK, ()))
+    unlink_dists = tuple(Dist(d) for d in actions.get(UNLINK, ()))
+
+    pfe = ProgressiveFetchExtract(index, link_dists)
+    pfe.prepare()
+    estimate = dict(pfe.estimate)
+
+    packages_info_to_link, unestimated = [], []
+    for dist in link_dists:
+        pc_entry = next((pce for pce in PackageCache.get_matching_entries(dist)
+                         if pce.is_extracted), None)
+        if pc_entry:
+            packages_info_to_link.append(read_package_info(index[dist],
+                                                           pc_entry.extracted_package_dir))
+        else:
+            unestimated.append(text_type(dist))
+    linked_packages_data_to_unlink = tuple(rec for rec in (is_linked(prefix, dist)
+                                                           for dist in unlink_dists) if rec)
+    txn = UnlinkLinkTransaction(prefix, linked_packages_data_to_unlink, packages_info_to_link)
+    txn.prepare()
+    estimate.update(txn.estimate)
+    estimate['unestimated_packages'] = unestimated
+    return estimate
+
+
+def display_estimate(estimate):
+    print("\nEstimated work:\n")
+    print("    download:            %d packages, %s" % (estimate['download_packages'],
+                                                        human_bytes(estimate['download_bytes'])))
+    print("    extract:             %d packages, %s" % (estimate['extract_packages'],
+                                                        human_bytes(estimate['extract_bytes'])))
+    link_files = ', '.join('%d %s' % (count, link_type)
+                           for link_type, count in sorted(estimate['link_files'].items())
+                           if count)
+    print("    link:                %s" % (link_files or 'no files'))
+    print("    unlink:              %d files" % estimate['unlink_files'])
+    print("    prefix replacement:  %d files, %s"
+          % (estimate['prefix_replace_files'], human_bytes(estimate['prefix_replace_bytes'])))
+    print("    compile:             %d pyc files" % estimate['pyc_files'])
+    print("    run:                 %d scripts" % estimate['scripts'])
+    if estimate['unestimated_packages']:
+        print("\n    (link estimates leave out %d packages that aren't extracted yet)"
+              % len(estimate['unestimated_packages']))
+
+
 def display_actions(actions, index, show_channel_urls=None):
     if show_channel_urls is None:
         show_channel_urls = context.show_channel_urls
@@ -900,9 +954,10 @@ def revert_actions(prefix, revision=-1, index=None):
 # ---------------------------- EXECUTION --------------------------
 
 def execute_actions(actions, index, verbose=False):
+    # returns the estimated and measured costs from execute_instructions()
     plan = plan_from_actions(actions, index)
     with History(actions[PREFIX]):
-        execute_instructions(plan, index, verbose)
+        return execute_instructions(plan, index, verbose)
 
 
 def update_old_plan(old_plan):
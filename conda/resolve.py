@@ -1,6 +1,6 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from itertools import chain
+from itertools import chain, combinations
 import logging
 import re
 
@@ -333,7 +333,19 @@ class Resolve(object):
             The purpose of this code, then, is to identify packages (like numpy
             above) that all of the specs depend on *but in different ways*. We
             then identify the dependency chains that lead to those packages.
+
+            The first case is checked up front by intersecting the version
+            intervals of specs that name the same package, which needs no
+            walk over the index at all.
         """
+        bad_pairs = []
+        for ms1, ms2 in combinations(specs, 2):
+            if (ms1.name == ms2.name and ms1.strictness > 1 and ms2.strictness > 1 and
+                    not VersionSpec(ms1.version).intersects(ms2.version)):
+                bad_pairs.append((ms1, ms2))
+        if bad_pairs:
+            raise UnsatisfiableError(bad_pairs, chains=False)
+
         sdeps = {}
         # For each spec, assemble a dictionary of dependencies, with package
         # name as key, and all of the matching packages as values.
@@ -178,6 +178,18 @@ def human_bytes(n):
     return '%.2f GB' % g
 
 
+def parse_human_bytes(s):
+    """
+    Return the number of bytes in s, either a number of bytes or a size with a unit, like
+    human_bytes returns (e.g. '512', '100 MB', '1.5G').
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d*)?)\s*([KMGT]?)(?:i?B)?\s*$', '%s' % s, re.IGNORECASE)
+    if not match:
+        raise ValueError("invalid size: %r" % s)
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** ' KMGT'.index(unit.upper() or ' '))
+
+
 # TODO: this should be done in a more extensible way
 #     (like files for each shell, with some registration mechanism.)
 #
@@ -1,9 +1,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from functools import cmp_to_key, reduce
 import operator as op
 import re
 
-from .common.compat import string_types, zip, zip_longest
+from .common.compat import string_types, text_type, zip, zip_longest
 from .exceptions import CondaRuntimeError, CondaValueError
 
 
@@ -283,6 +284,229 @@ class VersionOrder(object):
         return not (self < other)
 
 
+class _StringBound(text_type):
+    '''
+    A version subcomponent that sorts immediately below (or above) every
+    string starting with its text. Used to bracket wildcard specs such
+    as '1.7a*' without enumerating the strings in between.
+    '''
+
+    def __new__(cls, prefix, above):
+        self = text_type.__new__(cls, prefix)
+        self.above = above
+        return self
+
+    def _cmp(self, other):
+        prefix = text_type(self)
+        if isinstance(other, _StringBound):
+            oprefix = text_type(other)
+            if oprefix == prefix:
+                return self.above - other.above
+            if oprefix.startswith(prefix):
+                return 1 if self.above else -1
+            if prefix.startswith(oprefix):
+                return -1 if other.above else 1
+        elif other.startswith(prefix):
+            return 1 if self.above else -1
+        return -1 if prefix < other else 1
+
+    def __eq__(self, other):
+        return isinstance(other, string_types) and self._cmp(other) == 0
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return self._cmp(other) < 0
+
+    def __gt__(self, other):
+        return self._cmp(other) > 0
+
+    def __le__(self, other):
+        return self._cmp(other) <= 0
+
+    def __ge__(self, other):
+        return self._cmp(other) >= 0
+
+    def __hash__(self):
+        return hash((text_type(self), self.above))
+
+
+class _MaxNumber(object):
+    '''A version subcomponent greater than every number, 'post' included.'''
+
+    def __eq__(self, other):
+        return isinstance(other, _MaxNumber)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return not isinstance(other, _MaxNumber)
+
+    def __le__(self, other):
+        return isinstance(other, _MaxNumber)
+
+    def __ge__(self, other):
+        return True
+
+    def __hash__(self):
+        return hash(_MaxNumber)
+
+
+def _bound_order(version, local, text):
+    # Build a VersionOrder directly from parsed components; the components
+    # may contain bound sentinels, so this must bypass parsing and the cache.
+    self = object.__new__(VersionOrder)
+    self.fillvalue = 0
+    self.norm_version = text
+    self.version = version
+    self.local = local
+    return self
+
+
+def _prefix_bounds(prefix):
+    '''
+    Return the half-open range [lower, upper) of VersionOrder values that
+    satisfy ``v.startswith(prefix)``, i.e. the versions matched by the
+    wildcard spec '<prefix>*'.
+    '''
+    parts = prefix.local if prefix.local else prefix.version
+    last = parts[-1]
+    if isinstance(last[-1], string_types):
+        lower = last[:-1] + [_StringBound(last[-1], False)]
+        upper = last[:-1] + [_StringBound(last[-1], True)]
+    else:
+        lower = last + [_StringBound('', False)]
+        upper = last + [_MaxNumber()]
+    text = '%s*' % prefix
+    if prefix.local:
+        return (_bound_order(prefix.version, parts[:-1] + [lower], text),
+                _bound_order(prefix.version, parts[:-1] + [upper], text))
+    return (_bound_order(parts[:-1] + [lower], [], text),
+            _bound_order(parts[:-1] + [upper], [], text))
+
+
+def _cmp_order(a, b):
+    return -1 if a < b else (1 if b < a else 0)
+
+
+def _cmp_lower(a, b):
+    # lower bounds are (VersionOrder or None, closed); None is -infinity
+    if a[0] is None or b[0] is None:
+        return (b[0] is None) - (a[0] is None)
+    return _cmp_order(a[0], b[0]) or (b[1] - a[1])
+
+
+def _cmp_upper(a, b):
+    # upper bounds are (VersionOrder or None, closed); None is +infinity
+    if a[0] is None or b[0] is None:
+        return (a[0] is None) - (b[0] is None)
+    return _cmp_order(a[0], b[0]) or (a[1] - b[1])
+
+
+def _interval_is_empty(interval):
+    lower, lower_closed, upper, upper_closed = interval
+    if lower is None or upper is None:
+        return False
+    c = _cmp_order(lower, upper)
+    return c > 0 or (c == 0 and not (lower_closed and upper_closed))
+
+
+def _normalize_intervals(intervals):
+    intervals = [iv for iv in intervals if not _interval_is_empty(iv)]
+    intervals.sort(key=cmp_to_key(lambda x, y: _cmp_lower(x[:2], y[:2])))
+    result = []
+    for iv in intervals:
+        if result:
+            lower, lower_closed, upper, upper_closed = result[-1]
+            c = 1 if upper is None or iv[0] is None else _cmp_order(upper, iv[0])
+            if c > 0 or (c == 0 and (upper_closed or iv[1])):
+                # overlapping or adjacent; extend the previous interval
+                if _cmp_upper(iv[2:], (upper, upper_closed)) > 0:
+                    result[-1] = (lower, lower_closed) + iv[2:]
+                continue
+        result.append(tuple(iv))
+    return tuple(result)
+
+
+class VersionIntervals(object):
+    '''
+    A normalized union of disjoint intervals over VersionOrder.
+
+    Each interval is a tuple (lower, lower_closed, upper, upper_closed),
+    where an unbounded end is None. Intervals are kept sorted, so testing
+    membership is a bisection over the lower bounds, and two unions can be
+    intersected or tested for emptiness without enumerating any versions.
+    '''
+
+    def __init__(self, intervals=()):
+        self.intervals = _normalize_intervals(intervals)
+
+    @classmethod
+    def everything(cls):
+        return cls(((None, False, None, False),))
+
+    @classmethod
+    def nothing(cls):
+        return cls()
+
+    def is_empty(self):
+        return not self.intervals
+
+    def contains(self, version):
+        version = VersionOrder(version)
+        intervals = self.intervals
+        lo, hi = 0, len(intervals)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            lower, lower_closed = intervals[mid][:2]
+            if lower is None or lower < version or (lower_closed and lower == version):
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return False
+        upper, upper_closed = intervals[lo - 1][2:]
+        return upper is None or version < upper or (upper_closed and version == upper)
+
+    def union(self, other):
+        return VersionIntervals(self.intervals + other.intervals)
+
+    def intersection(self, other):
+        result = []
+        for a in self.intervals:
+            for b in other.intervals:
+                lower = a[:2] if _cmp_lower(a[:2], b[:2]) >= 0 else b[:2]
+                upper = a[2:] if _cmp_upper(a[2:], b[2:]) <= 0 else b[2:]
+                result.append(lower + upper)
+        return VersionIntervals(result)
+
+    __and__ = intersection
+    __or__ = union
+
+    def __eq__(self, other):
+        return (isinstance(other, VersionIntervals) and
+                len(self.intervals) == len(other.intervals) and
+                all(_cmp_lower(a[:2], b[:2]) == 0 and _cmp_upper(a[2:], b[2:]) == 0
+                    for a, b in zip(self.intervals, other.intervals)))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        def fmt(interval):
+            lower, lower_closed, upper, upper_closed = interval
+            return '%s%s, %s%s' % ('[' if lower_closed else '(',
+                                   '-inf' if lower is None else lower,
+                                   'inf' if upper is None else upper,
+                                   ']' if upper_closed else ')')
+        return 'VersionIntervals(%s)' % ' | '.join(fmt(iv) for iv in self.intervals)
+
+
 # This RE matches the operators '==', '!=', '<=', '>=', '<', '>'
 # followed by a version string. It rejects expressions like
 # '<= 1.2' (space after operator), '<>1.2' (unknown operator),
@@ -295,6 +519,14 @@ regex_split_converter = {
 }
 opdict = {'==': op.__eq__, '!=': op.__ne__, '<=': op.__le__,
           '>=': op.__ge__, '<': op.__lt__, '>': op.__gt__}
+relation_intervals = {
+    '==': lambda v: ((v, True, v, True),),
+    '!=': lambda v: ((None, False, v, False), (v, False, None, False)),
+    '<=': lambda v: ((None, False, v, True),),
+    '>=': lambda v: ((v, True, None, False),),
+    '<': lambda v: ((None, False, v, False),),
+    '>': lambda v: ((v, False, None, False),),
+}
 
 
 class VersionSpec(object):
@@ -316,13 +548,33 @@ class VersionSpec(object):
     def triv_match_(self, vspec):
         return True
 
+    def interval_match_(self, vspec):
+        return self._intervals.contains(VersionOrder(vspec))
+
+    def compile_match_(self, vspec):
+        # compile composite specs on first use, so that specs which are only
+        # parsed and printed never pay for it
+        intervals = self.intervals
+        if intervals is not None and self._intervals_exact:
+            self.match = self.interval_match_
+        else:
+            self.match = self.all_match_ if self.spec[0] == 'all' else self.any_match_
+        return self.match(vspec)
+
     def __new__(cls, spec):
         if isinstance(spec, cls):
             return spec
         self = object.__new__(cls)
         self.spec = spec
+        # intervals: the spec compiled to a VersionIntervals, or None if it
+        # cannot be represented that way (regular expressions)
+        # intervals_exact: False if the intervals are only an approximation;
+        # exact matches compare strings, which VersionOrder considers equal
+        # more often ('1.7' == '1.7.0')
+        self._intervals = None
+        self._intervals_exact = True
         if isinstance(spec, tuple):
-            self.match = self.all_match_ if spec[0] == 'all' else self.any_match_
+            self.match = self.compile_match_
         elif regex_split_re.match(spec):
             m = regex_split_re.match(spec)
             first = m.group()
@@ -346,8 +598,10 @@ class VersionSpec(object):
             self.op = opdict[op]
             self.cmp = VersionOrder(b)
             self.match = self.veval_match_
+            self._intervals = VersionIntervals(relation_intervals[op](self.cmp))
         elif spec == '*':
             self.match = self.triv_match_
+            self._intervals = VersionIntervals.everything()
         elif '*' in spec.rstrip('*'):
             self.spec = spec
             rx = spec.replace('.', r'\.')
@@ -359,16 +613,52 @@ class VersionSpec(object):
         elif spec.endswith('*'):
             self.op = VersionOrder.startswith
             self.cmp = VersionOrder(spec.rstrip('*').rstrip('.'))
-            self.match = self.veval_match_
+            lower, upper = _prefix_bounds(self.cmp)
+            self._intervals = VersionIntervals(((lower, True, upper, False),))
+            self.match = self.interval_match_
         else:
             self.match = self.exact_match_
+            self._intervals_exact = False
         return self
 
+    @property
+    def intervals(self):
+        """The versions matched by this spec as a VersionIntervals, or None if the spec
+        contains a regular expression. For exact version strings the intervals are an
+        approximation; they may contain versions the spec does not match, never fewer.
+        """
+        if self._intervals is not None:
+            return self._intervals
+        if isinstance(self.spec, tuple):
+            parts = [s.intervals for s in self.spec[1]]
+            if all(p is not None for p in parts):
+                combine = (VersionIntervals.intersection if self.spec[0] == 'all'
+                           else VersionIntervals.union)
+                self._intervals = reduce(combine, parts)
+                self._intervals_exact = all(s._intervals_exact for s in self.spec[1])
+        elif self.match == self.exact_match_:
+            try:
+                version = VersionOrder(self.spec)
+            except CondaValueError:
+                pass
+            else:
+                self._intervals = VersionIntervals(relation_intervals['=='](version))
+        return self._intervals
+
+    def intersects(self, other):
+        """Return False only if no version can satisfy both this spec and other."""
+        if not isinstance(other, VersionSpec):
+            other = VersionSpec(other)
+        mine, theirs = self.intervals, other.intervals
+        if mine is None or theirs is None:
+            return True
+        return not (mine & theirs).is_empty()
+
     def str(self, inand=False):
         s = self.spec
         if isinstance(s, tuple):
-            newand = not inand and s[0] == all
-            inand = inand and s[0] == any
+            newand = not inand and s[0] == 'all'
+            inand = inand and s[0] == 'any'
             s = (',' if s[0] == 'all' else '|').join(x.str(newand) for x in s[1])
             if inand:
                 s = '(%s)' % s
@@ -386,9 +676,9 @@ class VersionSpec(object):
     def __and__(self, other):
         if not isinstance(other, VersionSpec):
             other = VersionSpec(other)
-        return VersionSpec((all, (self, other)))
+        return VersionSpec(('all', (self, other)))
 
     def __or__(self, other):
         if not isinstance(other, VersionSpec):
             other = VersionSpec(other)
-        return VersionSpec((any, (self, other)))
+        return VersionSpec(('any', (self, other)))
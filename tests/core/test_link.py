@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+from os.path import isdir, isfile, join, lexists
+from shutil import rmtree
+import sys
+from subprocess import Popen
+from tempfile import mkdtemp
+from unittest import TestCase
+
+import pytest
+
+from conda import CondaMultiError
+from conda.base.context import reset_context
+from conda.common.compat import itervalues, on_win, text_type
+from conda.common.io import env_var
+from conda.core.journal import TransactionJournal, recover_transaction
+from conda.core.link import UnlinkLinkTransaction, determine_link_type
+from conda.core.linked_data import linked_data, linked_data_
+from conda.gateways.disk.read import read_package_info
+from conda.models.enums import LinkType
+from conda.models.index_record import IndexRecord
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+def make_package(pkgs_dir, name, files, has_prefix=(), version='1.0', noarch=False):
+    dist_name = '%s-%s-0' % (name, version)
+    extracted_dir = join(pkgs_dir, dist_name)
+    os.makedirs(join(extracted_dir, 'info'))
+    index = {'name': name, 'version': version, 'build': '0', 'build_number': 0}
+    with open(join(extracted_dir, 'info', 'index.json'), 'w') as fh:
+        json.dump(index, fh)
+    if noarch:
+        with open(join(extracted_dir, 'info', 'package_metadata.json'), 'w') as fh:
+            json.dump({'package_metadata_version': 1,
+                       'noarch': {'type': 'python', 'entry_points': []}}, fh)
+    with open(join(extracted_dir, 'info', 'files'), 'w') as fh:
+        fh.write('\n'.join(sorted(files)))
+    with open(join(extracted_dir, 'info', 'has_prefix'), 'w') as fh:
+        fh.write('\n'.join('/opt/placeholder text %s' % path for path in has_prefix))
+    for fn in ('no_link', 'no_softlink'):
+        with open(join(extracted_dir, 'info', fn), 'w'):
+            pass
+    for path, content in files.items():
+        full_path = join(extracted_dir, path)
+        if not isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'w') as fh:
+            fh.write(content)
+    record = IndexRecord(fn=dist_name + '.tar.bz2', schannel='defaults',
+                         url='https://repo.example.com/%s.tar.bz2' % dist_name, **index)
+    return read_package_info(record, extracted_dir)
+
+
+class ParallelLinkTests(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.pkgs_dir = join(self.tmpdir, 'pkgs')
+        self.prefix = join(self.tmpdir, 'env')
+        os.makedirs(self.prefix)
+        self.packages = (
+            make_package(self.pkgs_dir, 'one', dict(('lib/one/%d.txt' % q, 'one')
+                                                    for q in range(200))),
+            make_package(self.pkgs_dir, 'two', {
+                'lib/two.txt': 'two',
+                'bin/.two-1.0-0-post-link.sh': 'true\n',
+            }),
+            make_package(self.pkgs_dir, 'three', {
+                'share/three.txt': 'prefix is /opt/placeholder\n',
+                'share/three/data.txt': 'three',
+            }, has_prefix=('share/three.txt',)),
+        )
+        self.scripts = []
+        run_script_patch = patch('conda.core.link.run_script', self.run_script)
+        run_script_patch.start()
+        self.addCleanup(run_script_patch.stop)
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def run_script(self, prefix, dist, action='post-link', env_prefix=None):
+        # what each script would see in the prefix
+        self.scripts.append((dist.name, action,
+                             isfile(join(prefix, 'lib', 'one', '199.txt')),
+                             lexists(join(prefix, 'share', 'three.txt'))))
+        return True
+
+    def test_parallel_link(self):
+        with env_var('CONDA_LINK_THREADS', '4', reset_context):
+            txn = UnlinkLinkTransaction(self.prefix, (), self.packages)
+            txn.prepare()
+            groups = tuple(txn._execution_groups(self.prefix, txn.all_actions, 0, True))
+            # two's post-link script ends the first group
+            assert groups == ((0, 2), (2, 1))
+            txn.execute()
+
+        assert all(isfile(join(self.prefix, 'lib', 'one', '%d.txt' % q)) for q in range(200))
+        assert self.scripts == [
+            ('one', 'pre-link', False, False),
+            ('two', 'pre-link', False, False),
+            ('one', 'post-link', True, False),
+            ('two', 'post-link', True, False),
+            ('three', 'pre-link', True, False),
+            ('three', 'post-link', True, True),
+        ]
+        with open(join(self.prefix, 'share', 'three.txt')) as fh:
+            assert fh.read() == 'prefix is %s\n' % self.prefix
+        for name in ('one', 'two', 'three'):
+            assert isfile(join(self.prefix, 'conda-meta', '%s-1.0-0.json' % name))
+
+    def test_estimate(self):
+        txn = UnlinkLinkTransaction(self.prefix, (), self.packages)
+        txn.prepare()
+        assert sum(itervalues(txn.estimate['link_files'])) == 204
+        assert txn.estimate['prefix_replace_files'] == 1
+        assert txn.estimate['prefix_replace_bytes'] == len('prefix is /opt/placeholder\n')
+        assert txn.estimate['scripts'] == 1
+        assert txn.estimate['unlink_files'] == txn.estimate['pyc_files'] == 0
+        assert txn.measured is None
+
+        txn.execute()
+        assert txn.measured['link_files'] == txn.estimate['link_files']
+        assert txn.measured['prefix_replace_bytes'] == len('prefix is %s\n' % self.prefix)
+        assert txn.measured['link_seconds'] >= 0
+
+    def test_link_type_probed_once(self):
+        with patch('conda.core.link.hardlink_supported', return_value=True) as probe:
+            UnlinkLinkTransaction(self.prefix, (), self.packages).prepare()
+            UnlinkLinkTransaction(self.prefix, (), self.packages).prepare()
+        assert probe.call_count == 1
+        assert not lexists(join(self.prefix, 'conda-meta', 'link_support.json'))
+
+    def test_link_type_persisted(self):
+        os.makedirs(join(self.prefix, 'conda-meta'))
+        with env_var('CONDA_PERSIST_LINK_TYPE', 'true', reset_context):
+            with patch('conda.core.link.hardlink_supported', return_value=False):
+                with patch('conda.core.link.softlink_supported', return_value=True) as probe:
+                    txn = UnlinkLinkTransaction(self.prefix, (), self.packages)
+                    txn.prepare()
+            assert probe.call_count == 1
+            assert txn.estimate['link_files']['softlink'] == 203  # three.txt is copied
+
+            # another process reads it from conda-meta
+            with patch.dict('conda.core.link._link_support', clear=True):
+                with patch('conda.core.link.hardlink_supported') as probe:
+                    link_type = determine_link_type(self.packages[0].extracted_package_dir,
+                                                    self.prefix)
+            assert probe.call_count == 0
+            assert link_type == LinkType.softlink
+
+    def test_make_directories(self):
+        os.makedirs(join(self.prefix, 'lib'))
+        txn = UnlinkLinkTransaction(self.prefix, (), self.packages)
+        begin = TransactionJournal.begin
+        journaled = []
+
+        def journal_begin(prefix, packages):
+            journaled.extend(packages)
+            return begin(prefix, packages)
+
+        with patch('conda.gateways.disk.create.mkdir_p') as mkdir_p:
+            with patch.object(TransactionJournal, 'begin', side_effect=journal_begin):
+                txn.execute()
+        # the transaction makes the directories; the packages' directory actions don't
+        assert not mkdir_p.called
+        directories = ['bin', 'lib', 'lib/one', 'share', 'share/three']
+        assert txn.transaction_context['made_directories'] == set(directories)
+        assert isfile(join(self.prefix, 'share', 'three', 'data.txt'))
+        # and they're all journaled, ahead of the first package's own entries
+        assert journaled[0]['entries'][:5] == [['mkdir', d] for d in directories]
+
+    def test_make_directories_rollback(self):
+        # directories made for packages that were never reached are removed too
+        from conda.core.path_actions import LinkPathAction
+        execute = LinkPathAction.execute
+
+        def failing_execute(action):
+            if action.target_short_path == 'lib/one/150.txt':
+                raise OSError("can't link %s" % action.target_short_path)
+            return execute(action)
+
+        os.makedirs(join(self.prefix, 'share'))
+        txn = UnlinkLinkTransaction(self.prefix, (), self.packages)
+        with patch.object(LinkPathAction, 'execute', failing_execute):
+            self.assertRaises(CondaMultiError, txn.execute)
+        assert sorted(os.listdir(self.prefix)) == ['conda-meta', 'share']
+        assert not os.listdir(join(self.prefix, 'share'))
+
+    def test_make_directories_failure(self):
+        # directories made before one couldn't be are removed
+        with open(join(self.prefix, 'share'), 'w') as fh:
+            fh.write('in the way')
+        txn = UnlinkLinkTransaction(self.prefix, (), self.packages)
+        self.assertRaises(CondaMultiError, txn.execute)
+        assert sorted(os.listdir(self.prefix)) == ['conda-meta', 'share']
+        assert isfile(join(self.prefix, 'share'))
+
+    def test_parallel_link_rollback(self):
+        # a failure partway through a group reverses the whole group, and what came before it
+        from conda.core.path_actions import LinkPathAction
+        execute = LinkPathAction.execute
+
+        def failing_execute(action):
+            if action.target_short_path == 'lib/one/150.txt':
+                raise OSError("can't link %s" % action.target_short_path)
+            return execute(action)
+
+        with env_var('CONDA_LINK_THREADS', '4', reset_context):
+            txn = UnlinkLinkTransaction(self.prefix, (), self.packages[1:] + self.packages[:1])
+            with patch.object(LinkPathAction, 'execute', failing_execute):
+                try:
+                    txn.execute()
+                except CondaMultiError as e:
+                    assert "can't link lib/one/150.txt" in repr(e.errors[0])
+                else:
+                    assert False, "CondaMultiError not raised"
+
+        for path in ('lib', 'share', 'bin'):
+            assert not lexists(join(self.prefix, path))
+        assert not os.listdir(join(self.prefix, 'conda-meta'))
+
+
+class CompilePycTests(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.pkgs_dir = join(self.tmpdir, 'pkgs')
+        self.prefix = join(self.tmpdir, 'env')
+        os.makedirs(self.prefix)
+        python_version = '%d.%d' % sys.version_info[:2]
+        python_short_path = 'bin/python' + python_version
+        self.python = make_package(self.pkgs_dir, 'python', {
+            python_short_path: '#!/bin/sh\nexec "%s" "$@"\n' % sys.executable,
+        }, version=python_version + '.0')
+        os.chmod(join(self.python.extracted_package_dir, python_short_path), 0o755)
+        self.site_packages = join(self.prefix, 'lib', 'python' + python_version, 'site-packages')
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def make_noarch_package(self, modules):
+        return make_package(self.pkgs_dir, 'mods', dict(
+            ('site-packages/mods/%s.py' % name, source) for name, source in modules.items()
+        ), noarch=True)
+
+    def pyc_files(self):
+        return sorted(fn for _, _, files in os.walk(self.prefix) for fn in files
+                      if fn.endswith('.pyc'))
+
+    @pytest.mark.skipif(on_win, reason="the python package is a shell script")
+    def test_compile_pyc(self):
+        package = self.make_noarch_package(dict(('mod%d' % q, 'x = %d\n' % q)
+                                                for q in range(20)))
+        txn = UnlinkLinkTransaction(self.prefix, (), (self.python, package))
+        with patch('conda.gateways.disk.create.Popen', wraps=Popen) as popen:
+            txn.execute()
+        # one interpreter for the whole package
+        assert popen.call_count == 1
+        assert len(self.pyc_files()) == 20
+        assert isfile(join(self.site_packages, 'mods', '__pycache__',
+                           'mod3.cpython-%d%d.pyc' % sys.version_info[:2]))
+
+    @pytest.mark.skipif(on_win, reason="the python package is a shell script")
+    def test_compile_pyc_failure(self):
+        # the pyc files that did compile are rolled back with the rest of the package
+        package = self.make_noarch_package({'good': 'x = 1\n', 'bad': 'x = (\n'})
+        txn = UnlinkLinkTransaction(self.prefix, (), (self.python, package))
+        try:
+            txn.execute()
+        except CondaMultiError as e:
+            assert "1 pyc files failed to compile" in text_type(e.errors[0])
+            assert join(self.site_packages, 'mods', 'bad.py') in text_type(e.errors[0])
+        else:
+            assert False, "CondaMultiError not raised"
+        assert self.pyc_files() == []
+        assert not lexists(join(self.site_packages, 'mods'))
+
+
+class JournalTests(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.pkgs_dir = join(self.tmpdir, 'pkgs')
+        self.prefix = join(self.tmpdir, 'env')
+        os.makedirs(self.prefix)
+        run_script_patch = patch('conda.core.link.run_script', return_value=True)
+        run_script_patch.start()
+        self.addCleanup(run_script_patch.stop)
+        self.addCleanup(linked_data_.pop, self.prefix, None)
+
+        old = make_package(self.pkgs_dir, 'one', {'lib/a.txt': 'old a', 'lib/b.txt': 'b'})
+        self.new = make_package(self.pkgs_dir, 'one', {'lib/a.txt': 'new a', 'lib/c.txt': 'c'},
+                                version='2.0')
+        UnlinkLinkTransaction(self.prefix, (), (old,)).execute()
+        self.journal_path = join(self.prefix, 'conda-meta', 'transaction.journal')
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def upgrade(self):
+        old_record = next(itervalues(linked_data(self.prefix)))
+        return UnlinkLinkTransaction(self.prefix, (old_record,), (self.new,))
+
+    def crash(self, txn, method, fail_on):
+        # run txn until LinkPathAction.<method> is called for fail_on, leaving the journal
+        #   behind as if the process had died there
+        from conda.core.path_actions import LinkPathAction
+        original = getattr(LinkPathAction, method)
+
+        def crashing(action):
+            if action.target_short_path == fail_on:
+                raise KeyboardInterrupt()
+            return original(action)
+
+        def close_without_removing(journal):
+            journal._fh.close()
+
+        with patch.object(TransactionJournal, 'close', close_without_removing):
+            with patch.object(LinkPathAction, method, crashing):
+                try:
+                    txn.execute()
+                except KeyboardInterrupt:
+                    pass
+                else:
+                    assert False, "the transaction wasn't interrupted"
+        assert isfile(self.journal_path)
+        linked_data_.pop(self.prefix, None)
+
+    def read(self, short_path):
+        with open(join(self.prefix, short_path)) as fh:
+            return fh.read()
+
+    def test_journal_removed(self):
+        self.upgrade().execute()
+        assert not lexists(self.journal_path)
+        assert self.read('lib/a.txt') == 'new a'
+        assert not lexists(join(self.prefix, 'lib', 'a.txt.c~'))
+
+    def test_recover_roll_back(self):
+        self.crash(self.upgrade(), 'execute', 'lib/c.txt')
+        assert self.read('lib/a.txt') == 'new a'
+
+        assert recover_transaction(self.prefix) == 'back'
+        assert not lexists(self.journal_path)
+        assert self.read('lib/a.txt') == 'old a'
+        assert self.read('lib/b.txt') == 'b'
+        assert not lexists(join(self.prefix, 'lib', 'c.txt'))
+        assert sorted(os.listdir(join(self.prefix, 'lib'))) == ['a.txt', 'b.txt']
+        assert os.listdir(join(self.prefix, 'conda-meta')) == ['one-1.0-0.json']
+
+    def test_recover_roll_forward(self):
+        self.crash(self.upgrade(), 'cleanup', 'lib/c.txt')
+
+        # reading the prefix recovers it
+        assert [dist.version for dist in linked_data(self.prefix)] == ['2.0']
+        assert not lexists(self.journal_path)
+        assert self.read('lib/a.txt') == 'new a'
+        assert sorted(os.listdir(join(self.prefix, 'lib'))) == ['a.txt', 'c.txt']
+        assert os.listdir(join(self.prefix, 'conda-meta')) == ['one-2.0-0.json']
+
+    def test_second_begin_leaves_journal(self):
+        packages = [{'dist': 'one-2.0-0', 'entries': [['link', 'lib/b.txt']]}]
+        journal = TransactionJournal.begin(self.prefix, packages)
+        try:
+            with open(self.journal_path, 'rb') as fh:
+                before = fh.read()
+            self.assertRaises(IOError, TransactionJournal.begin, self.prefix, packages)
+            with open(self.journal_path, 'rb') as fh:
+                assert fh.read() == before
+            journal.commit()
+            with open(self.journal_path, 'rb') as fh:
+                records = [json.loads(line.decode('utf-8')) for line in fh]
+            assert [record['op'] for record in records] == ['begin', 'commit']
+        finally:
+            journal.close()
+
+    def test_running_transaction_not_recovered(self):
+        journal = TransactionJournal.begin(self.prefix, [
+            {'dist': 'one-2.0-0', 'entries': [['link', 'lib/b.txt']]},
+        ])
+        try:
+            assert recover_transaction(self.prefix) is None
+            assert isfile(join(self.prefix, 'lib', 'b.txt'))
+        finally:
+            journal.close()
+        assert not lexists(self.journal_path)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from conda.cli.main_package import which_package
+from conda.core.linked_data import (delete_linked_data, linked_data, linked_data_,
+                                    load_linked_data, path_owners)
+from conda.misc import conda_installed_files, untracked
+
+
+def write_record(prefix, name, files):
+    record = dict(name=name, version='1.0', build='0', build_number=0, files=files,
+                  channel='https://repo.example.com/pkgs/free/linux-64')
+    with open(join(prefix, 'conda-meta', '%s-1.0-0.json' % name), 'w') as fh:
+        json.dump(record, fh)
+    return record
+
+
+class PathOwnersTests(TestCase):
+
+    def setUp(self):
+        self.prefix = mkdtemp()
+        os.makedirs(join(self.prefix, 'conda-meta'))
+        write_record(self.prefix, 'one', ['bin/one', 'share/common.txt'])
+        write_record(self.prefix, 'two', ['bin/two', 'share/common.txt'])
+        write_record(self.prefix, 'built', ['bin/built'])
+
+    def tearDown(self):
+        linked_data_.pop(self.prefix, None)
+        rmtree(self.prefix)
+
+    def dist(self, name):
+        return next(dist for dist in linked_data(self.prefix) if dist.name == name)
+
+    def test_path_owners(self):
+        owners = path_owners(self.prefix)
+        assert sorted(owners) == ['bin/built', 'bin/one', 'bin/two', 'share/common.txt']
+        assert owners['bin/one'] == [self.dist('one')]
+        assert sorted(dist.name for dist in owners['share/common.txt']) == ['one', 'two']
+
+        # the owners are kept in step with the linked data
+        record = write_record(self.prefix, 'three', ['bin/three', 'bin/one'])
+        load_linked_data(self.prefix, 'three-1.0-0', record)
+        delete_linked_data(self.prefix, self.dist('one'), delete=False)
+        assert path_owners(self.prefix) is owners
+        assert sorted(owners) == ['bin/built', 'bin/one', 'bin/three', 'bin/two',
+                                  'share/common.txt']
+        assert owners['bin/one'] == [self.dist('three')]
+        assert owners['share/common.txt'] == [self.dist('two')]
+
+        # and rebuilt if the linked data is
+        linked_data_.pop(self.prefix)
+        assert path_owners(self.prefix) is not owners
+        assert sorted(dist.name for dist in path_owners(self.prefix)['bin/one']) == \
+            ['one', 'three']
+
+    def test_conda_installed_files(self):
+        os.makedirs(join(self.prefix, 'bin'))
+        for path in ('bin/one', 'bin/built', 'bin/other', 'bin/other~'):
+            with open(join(self.prefix, path), 'w'):
+                pass
+        assert conda_installed_files(self.prefix) == {
+            'bin/built', 'bin/one', 'bin/two', 'share/common.txt',
+        }
+        assert untracked(self.prefix) == {'bin/other'}
+
+    def test_which_package(self):
+        assert list(which_package(join(self.prefix, 'bin', 'two'))) == [self.dist('two')]
+        assert sorted(dist.name for dist in
+                      which_package(join(self.prefix, 'share', 'common.txt'))) == ['one', 'two']
+        assert list(which_package(join(self.prefix, 'bin', 'other'))) == []
@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import hashlib
+from io import BytesIO
+import json
+from logging import getLogger
+import os
+from os.path import isdir, isfile, join
+from shutil import rmtree
+import tarfile
+from tempfile import mkdtemp
+from threading import Thread, current_thread
+from time import sleep, time
+from unittest import TestCase
+
+from conda.base.constants import UNKNOWN_CHANNEL
+from conda.base.context import reset_context
+from conda.common.compat import text_type
+from conda import CondaMultiError
+from conda.common.io import env_var
+from conda.exceptions import MD5MismatchError
+from conda.gateways.download import DownloadScheduler
+from conda.core.package_cache import (PACKAGE_CACHE_INDEX_FILENAME, DigestsData, FetchProgress,
+                                      LastUsedData, PackageCache, ProgressiveFetchExtract,
+                                      UrlsData)
+from conda.core.path_actions import (CacheUrlAction, CacheUrlAndExtractAction,
+                                     ExtractPackageAction)
+from conda.models.dist import Dist
+from conda.utils import md5_file
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+log = getLogger(__name__)
+
+
+def touch(path):
+    with open(path, 'a'):
+        pass
+
+
+def make_extracted_package(pkgs_dir, dist_name):
+    os.makedirs(join(pkgs_dir, dist_name, 'info'))
+    touch(join(pkgs_dir, dist_name, 'info', 'index.json'))
+
+
+def backdate(path, seconds=60):
+    then = time() - seconds
+    os.utime(path, (then, then))
+
+
+class PackageCacheTests(TestCase):
+
+    def setUp(self):
+        PackageCache.clear()
+        self.pkgs_dir = mkdtemp()
+        make_extracted_package(self.pkgs_dir, 'one-1.0-0')
+        touch(join(self.pkgs_dir, 'one-1.0-0.tar.bz2'))
+        touch(join(self.pkgs_dir, 'two-2.0-0.tar.bz2'))
+        os.makedirs(join(self.pkgs_dir, 'three-3.0-0'))  # no info/index.json
+        with open(join(self.pkgs_dir, 'urls.txt'), 'w') as fh:
+            fh.write("https://repo.continuum.io/pkgs/free/linux-64/one-1.0-0.tar.bz2\n"
+                     "https://repo.continuum.io/pkgs/free/linux-64/xtwo-2.0-0.tar.bz2\n"
+                     "https://conda.anaconda.org/conda-forge/linux-64/one-1.0-0.tar.bz2\n")
+
+    def tearDown(self):
+        PackageCache.clear()
+        rmtree(self.pkgs_dir)
+
+    def test_init_dir(self):
+        package_cache = PackageCache(self.pkgs_dir)
+        dists = sorted(package_cache, key=lambda d: d.dist_name)
+        assert [d.dist_name for d in dists] == ['one-1.0-0', 'two-2.0-0']
+        assert dists[0].channel == 'conda-forge'
+        assert dists[1].channel == UNKNOWN_CHANNEL
+
+    def test_urls_data(self):
+        urls_data = UrlsData(self.pkgs_dir)
+        assert urls_data.get_url('one-1.0-0') == \
+            "https://conda.anaconda.org/conda-forge/linux-64/one-1.0-0.tar.bz2"
+        assert urls_data.get_url(join(self.pkgs_dir, 'two-2.0-0.tar.bz2')) is None
+        urls_data.add_url("https://repo.continuum.io/pkgs/free/linux-64/two-2.0-0.tar.bz2")
+        assert urls_data.get_url('two-2.0-0.tar.bz2') == \
+            "https://repo.continuum.io/pkgs/free/linux-64/two-2.0-0.tar.bz2"
+        assert UrlsData(self.pkgs_dir).get_url('two-2.0-0.tar.bz2') == \
+            "https://repo.continuum.io/pkgs/free/linux-64/two-2.0-0.tar.bz2"
+
+    def test_persisted_index(self):
+        index_path = join(self.pkgs_dir, PACKAGE_CACHE_INDEX_FILENAME)
+        backdate(self.pkgs_dir)
+        PackageCache(self.pkgs_dir)
+        PackageCache.clear()
+        assert os.path.isfile(index_path)
+
+        # creating the index file modified the directory, so it's rewritten in place
+        backdate(self.pkgs_dir)
+        PackageCache(self.pkgs_dir)
+        PackageCache.clear()
+        with open(index_path) as fh:
+            index = json.load(fh)
+        assert index['mtime'] == os.stat(self.pkgs_dir).st_mtime
+        assert sorted(index['packages']) == ['one-1.0-0.tar.bz2', 'two-2.0-0.tar.bz2']
+
+        # an unchanged directory isn't scanned again
+        index['packages'].append('four-4.0-0.tar.bz2')
+        with open(index_path, 'w') as fh:
+            json.dump(index, fh)
+        package_cache = PackageCache(self.pkgs_dir)
+        PackageCache.clear()
+        assert 'four-4.0-0' in (dist.dist_name for dist in package_cache)
+
+        # but a modified one is
+        touch(join(self.pkgs_dir, 'five-5.0-0.tar.bz2'))
+        package_cache = PackageCache(self.pkgs_dir)
+        dist_names = set(dist.dist_name for dist in package_cache)
+        assert 'five-5.0-0' in dist_names
+        assert 'four-4.0-0' not in dist_names
+
+    def test_digests_data(self):
+        tarball_path = join(self.pkgs_dir, 'two-2.0-0.tar.bz2')
+        with open(tarball_path, 'w') as fh:
+            fh.write('two')
+        md5sum = md5_file(tarball_path)
+
+        digests_data = DigestsData(self.pkgs_dir)
+        assert digests_data.get_digest(tarball_path) is None
+        assert digests_data.compute_digest(tarball_path) == md5sum
+
+        # recorded digests are reused across instances (and processes) without re-hashing
+        with patch('conda.core.package_cache.hashsum_file') as hashsum_file:
+            assert DigestsData(self.pkgs_dir).compute_digest(tarball_path) == md5sum
+            assert not hashsum_file.called
+            pc_entry = PackageCache(self.pkgs_dir).tarball_file_in_this_cache(tarball_path)
+            assert pc_entry.tarball_matches_md5(md5sum)
+            assert not hashsum_file.called
+
+        # but not once the file changes
+        with open(tarball_path, 'a') as fh:
+            fh.write('2')
+        backdate(tarball_path, 120)
+        assert DigestsData(self.pkgs_dir).get_digest(tarball_path) is None
+        assert DigestsData(self.pkgs_dir).compute_digest(tarball_path) == md5_file(tarball_path)
+
+
+class EvictionTests(TestCase):
+
+    def setUp(self):
+        PackageCache.clear()
+        self.pkgs_dir = mkdtemp()
+        self.prefix = mkdtemp()
+        for name, age in (('old', 300), ('mid', 200), ('new', 100)):
+            dist_name = name + '-1.0-0'
+            with open(join(self.pkgs_dir, dist_name + '.tar.bz2'), 'wb') as fh:
+                fh.write(b'x' * 100)
+            make_extracted_package(self.pkgs_dir, dist_name)
+            with open(join(self.pkgs_dir, dist_name, 'lib.so'), 'wb') as fh:
+                fh.write(b'x' * 1000)
+            for path in (join(self.pkgs_dir, dist_name + '.tar.bz2'),
+                         join(self.pkgs_dir, dist_name)):
+                backdate(path, age)
+
+    def tearDown(self):
+        PackageCache.clear()
+        rmtree(self.pkgs_dir)
+        rmtree(self.prefix)
+
+    def evicted_names(self, evicted):
+        return [os.path.basename(path) for path, _ in evicted]
+
+    def test_evict_lru(self):
+        package_cache = PackageCache(self.pkgs_dir)
+        assert package_cache.evict_lru(3300) == []
+        assert self.evicted_names(package_cache.evict_lru(3000, dry_run=True)) == \
+            ['old-1.0-0.tar.bz2', 'old-1.0-0']
+        assert os.path.isdir(join(self.pkgs_dir, 'old-1.0-0'))
+
+        # linking a package makes it the most recently used, whatever its age
+        with env_var('CONDA_PKGS_DIRS', self.pkgs_dir, reset_context):
+            PackageCache.get_entry_to_link(Dist('old-1.0-0'))
+        assert LastUsedData(self.pkgs_dir).get_last_used('old-1.0-0') > time() - 10
+
+        # and a package hardlinked into an environment is never evicted, though its tarball is
+        os.link(join(self.pkgs_dir, 'mid-1.0-0', 'lib.so'), join(self.prefix, 'lib.so'))
+        evicted = package_cache.evict_lru(0)
+        assert self.evicted_names(evicted) == [
+            'mid-1.0-0.tar.bz2', 'new-1.0-0.tar.bz2', 'new-1.0-0',
+            'old-1.0-0.tar.bz2', 'old-1.0-0',
+        ]
+        assert sum(size for _, size in evicted) == 3 * 100 + 2 * 1000
+        assert sorted(fn for fn in os.listdir(self.pkgs_dir) if not fn.startswith('.')) == \
+            ['last_used.txt', 'mid-1.0-0']
+        assert [pce.dist.dist_name for pce in package_cache.values()] == ['mid-1.0-0']
+
+    def test_last_used_data(self):
+        last_used_data = LastUsedData(self.pkgs_dir)
+        last_used_data.mark_used('one-1.0-0', 1000.)
+        last_used_data.mark_used('one-1.0-0', 1030.)  # too soon to record again
+        last_used_data.mark_used('two-2.0-0', 1100.)
+        assert LastUsedData(self.pkgs_dir).get_last_used('one-1.0-0') == 1000.
+        for q in range(200):
+            last_used_data.mark_used('one-1.0-0', 2000. + 100 * q)
+        with open(last_used_data.last_used_txt_path) as fh:
+            assert len(fh.readlines()) < 110
+        last_used_data = LastUsedData(self.pkgs_dir)
+        assert last_used_data.get_last_used('one-1.0-0') == 2000. + 100 * 199
+        assert last_used_data.get_last_used('two-2.0-0') == 1100.
+
+
+class FakeCacheUrlAction(object):
+
+    def __init__(self, name, delay=0, failures=0, events=None):
+        self.target_package_basename = name + '-1.0-0.tar.bz2'
+        self.url = 'https://repo.example.com/linux-64/' + self.target_package_basename
+        self.target_full_path = join('/nonexistent', self.target_package_basename)
+        self.delay = delay
+        self.failures = failures
+        self.events = events if events is not None else []
+        self.verified = True
+        self.threads = set()
+        self.reversed = self.cleaned_up = 0
+
+    def execute(self, progress_update_callback=None):
+        self.threads.add(current_thread().name)
+        sleep(self.delay)
+        progress_update_callback = progress_update_callback or (lambda *args: None)
+        progress_update_callback(5, 10)
+        if self.failures:
+            self.failures -= 1
+            raise ValueError(self.target_package_basename)
+        progress_update_callback(10, 10)
+        self.events.append(('fetched', self.target_package_basename))
+
+    def reverse(self):
+        self.reversed += 1
+
+    def cleanup(self):
+        self.cleaned_up += 1
+
+
+class FakeExtractAction(object):
+
+    def __init__(self, cache_action):
+        self.cache_action = cache_action
+        self.source_full_path = cache_action.target_full_path
+        self.verified = True
+
+    def execute(self, executor=None):
+        self.cache_action.events.append(('extracted', self.cache_action.target_package_basename))
+
+    def cleanup(self):
+        pass
+
+
+class FetchTests(TestCase):
+
+    def make_fetch_extract(self, actions, extract_actions=None):
+        dists = tuple(Dist(action.target_package_basename) for action in actions)
+        index = dict((dist, {'size': 10}) for dist in dists)
+        pfe = ProgressiveFetchExtract(index, dists)
+        pfe.cache_actions = tuple(actions)
+        pfe.extract_actions = tuple(extract_actions or ())
+        pfe.paired_actions = tuple(zip(actions, extract_actions or (None,) * len(actions)))
+        pfe._prepared = True
+        return pfe
+
+    def test_concurrent_fetch(self):
+        actions = [FakeCacheUrlAction('pkg%d' % q, delay=0.05, failures=q % 2) for q in range(6)]
+        pfe = self.make_fetch_extract(actions)
+        with env_var('CONDA_FETCH_THREADS', '3', reset_context):
+            pfe.execute()
+        assert len(set.union(*(action.threads for action in actions))) > 1
+        assert [action.reversed for action in actions] == [0, 1, 0, 1, 0, 1]
+        assert all(action.cleaned_up == 1 for action in actions)
+
+    def test_concurrent_fetch_errors(self):
+        # errors are collected in the order of the actions, not the order they finished in
+        actions = [FakeCacheUrlAction('pkg%d' % q, delay=0.05 * (3 - q), failures=q % 2 * 3)
+                   for q in range(4)]
+        pfe = self.make_fetch_extract(actions)
+        with env_var('CONDA_FETCH_THREADS', '4', reset_context):
+            try:
+                pfe.execute()
+            except CondaMultiError as e:
+                errors = e.errors
+            else:
+                assert False, "CondaMultiError not raised"
+        assert len(errors) == 6
+        assert all(repr(ValueError('pkg1-1.0-0.tar.bz2')) in text_type(e) for e in errors[:3])
+        assert all(repr(ValueError('pkg3-1.0-0.tar.bz2')) in text_type(e) for e in errors[3:])
+
+    def test_serial_fetch_throttled(self):
+        # a single download, run without any threads, is still held to its host's bandwidth
+        action = FakeCacheUrlAction('pkg0')
+        pfe = self.make_fetch_extract([action])
+        scheduler = DownloadScheduler(1, host_bandwidth={'repo.example.com': 1000})
+        with patch.object(DownloadScheduler, 'from_context', return_value=scheduler):
+            with patch('conda.gateways.download._Throttle.consume') as consume:
+                with env_var('CONDA_FETCH_THREADS', '1', reset_context):
+                    pfe.execute()
+        assert [c[0][0] for c in consume.call_args_list] == [5, 5]
+        assert scheduler.stats()['hosts']['repo.example.com']['bytes'] == 10
+        assert action.threads == {current_thread().name}
+
+    def test_fetch_progress(self):
+        progress = FetchProgress(2, 20)
+        updates = []
+        with patch('conda.core.package_cache.getLogger') as get_logger:
+            get_logger.return_value.info.side_effect = updates.append
+            callback1, callback2 = progress.make_update_callback(), progress.make_update_callback()
+            callback1(8, 10)
+            callback2(4, 10)
+            callback1(2, 10)  # a retry starts over
+            callback1(10, 10)
+            callback2(10, 10)
+            progress.stop()
+        assert updates == [('2 packages', 20), 8, 12, 6, 14, 20, None]
+
+    def test_fetch_progress_status(self):
+        # the scheduler's queue depth and throughput are logged along with the progress
+        class FakeScheduler(object):
+            def stats(self):
+                return {'queued': 3, 'active': 2, 'bytes_per_second': 1000, 'bytes': 10,
+                        'hosts': {}}
+        progress = FetchProgress(5, 50, FakeScheduler())
+        progress.status_interval = 60
+        updates = []
+        with patch('conda.core.package_cache.getLogger') as get_logger:
+            get_logger.return_value.info.side_effect = updates.append
+            callback = progress.make_update_callback()
+            callback(5, 10)
+            callback(10, 10)
+        status = {'queued': 3, 'active': 2, 'bytes_per_second': 1000}
+        assert updates == [('5 packages', 50), ('5 packages (3 queued, 2 active)', status), 5, 10]
+
+    def test_pipelined_extract(self):
+        # a package is extracted as soon as it's downloaded, while other downloads are running,
+        #   and a package that failed to download isn't extracted at all
+        events = []
+        actions = [FakeCacheUrlAction('slow', delay=0.3, events=events),
+                   FakeCacheUrlAction('fast', events=events),
+                   FakeCacheUrlAction('broken', failures=3, events=events)]
+        pfe = self.make_fetch_extract(actions, [FakeExtractAction(a) for a in actions])
+        with env_var('CONDA_FETCH_THREADS', '3', reset_context):
+            try:
+                pfe.execute()
+            except CondaMultiError as e:
+                assert len(e.errors) == 3
+            else:
+                assert False, "CondaMultiError not raised"
+        assert events.index(('extracted', 'fast-1.0-0.tar.bz2')) < \
+            events.index(('fetched', 'slow-1.0-0.tar.bz2'))
+        assert events.index(('fetched', 'slow-1.0-0.tar.bz2')) < \
+            events.index(('extracted', 'slow-1.0-0.tar.bz2'))
+        assert ('extracted', 'broken-1.0-0.tar.bz2') not in events
+
+        # a single fetch thread runs the packages one after another
+        del events[:]
+        pfe = self.make_fetch_extract(actions[:2], [FakeExtractAction(a) for a in actions[:2]])
+        with env_var('CONDA_FETCH_THREADS', '1', reset_context):
+            pfe.execute()
+        assert [event[0] for event in events] == ['fetched', 'extracted'] * 2
+
+
+def make_tarball(members):
+    buf = BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:bz2') as t:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, BytesIO(data))
+    return buf.getvalue()
+
+
+class ExtractTests(TestCase):
+
+    def setUp(self):
+        PackageCache.clear()
+        self.pkgs_dir = mkdtemp()
+
+    def tearDown(self):
+        PackageCache.clear()
+        rmtree(self.pkgs_dir)
+
+    def make_tarball(self, dist_name, data):
+        with open(join(self.pkgs_dir, dist_name + '.tar.bz2'), 'wb') as fh:
+            fh.write(make_tarball([('info/index.json', b'{}'), ('lib/data', data)]))
+        return ExtractPackageAction(join(self.pkgs_dir, dist_name + '.tar.bz2'), self.pkgs_dir,
+                                    dist_name)
+
+    def test_process_pool_extract(self):
+        actions = [self.make_tarball('pkg%d-1.0-0' % q, b'%d' % q) for q in range(4)]
+        pfe = ProgressiveFetchExtract({}, ())
+        pfe.paired_actions = tuple((None, action) for action in actions)
+        pfe._prepared = True
+        with env_var('CONDA_FETCH_THREADS', '1', reset_context):
+            with env_var('CONDA_EXTRACT_PROCESSES', '2', reset_context):
+                pfe.execute()
+        for q in range(4):
+            with open(join(self.pkgs_dir, 'pkg%d-1.0-0' % q, 'lib', 'data'), 'rb') as fh:
+                assert fh.read() == b'%d' % q
+            assert not os.path.lexists(join(self.pkgs_dir, 'pkg%d-1.0-0.x~' % q))
+        pc_entries = PackageCache(self.pkgs_dir).values()
+        assert sorted(pce.dist.dist_name for pce in pc_entries if pce.is_extracted) == \
+            ['pkg%d-1.0-0' % q for q in range(4)]
+
+    def test_extract_rollback(self):
+        # a failed extraction never leaves a partial package in place of the old one
+        make_extracted_package(self.pkgs_dir, 'one-1.0-0')
+        action = self.make_tarball('one-1.0-0', b'one')
+        with open(action.source_full_path, 'r+b') as fh:
+            fh.seek(100)
+            fh.write(b'garbage' * 10)
+        try:
+            action.execute()
+        except Exception:
+            pass
+        else:
+            assert False, "corrupt tarball extracted"
+        assert not os.path.lexists(join(self.pkgs_dir, 'one-1.0-0.x~'))
+        assert not os.path.lexists(join(self.pkgs_dir, 'one-1.0-0'))
+        action.reverse()
+        assert isfile(join(self.pkgs_dir, 'one-1.0-0', 'info', 'index.json'))
+
+
+class TarballRequestHandler(BaseHTTPRequestHandler):
+    tarball = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.tarball)))
+        self.end_headers()
+        self.wfile.write(self.tarball)
+
+    def log_message(self, *args):
+        pass
+
+
+class StreamExtractTests(TestCase):
+
+    def setUp(self):
+        PackageCache.clear()
+        self.pkgs_dir = mkdtemp()
+        # padding makes the tarball longer than the tar stream, so it has to be drained
+        TarballRequestHandler.tarball = make_tarball([
+            ('info/index.json', b'{"name": "one", "version": "1.0", "build": "0"}'),
+            ('lib/one.txt', b'one' * 10000),
+        ]) + b'\0' * 10240
+        self.server = HTTPServer(('127.0.0.1', 0), TarballRequestHandler)
+        self.server_thread = Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:%d/one-1.0-0.tar.bz2' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        PackageCache.clear()
+        rmtree(self.pkgs_dir)
+
+    def make_action(self, md5sum):
+        cache_action = CacheUrlAction(self.url, self.pkgs_dir, 'one-1.0-0.tar.bz2', md5sum)
+        extract_action = ExtractPackageAction(cache_action.target_full_path, self.pkgs_dir,
+                                              'one-1.0-0')
+        return CacheUrlAndExtractAction(cache_action, extract_action)
+
+    def test_stream_extract(self):
+        md5sum = hashlib.md5(TarballRequestHandler.tarball).hexdigest()
+        action = self.make_action(md5sum)
+        action.verify()
+        action.execute()
+        action.cleanup()
+
+        extracted_dir = join(self.pkgs_dir, 'one-1.0-0')
+        with open(join(extracted_dir, 'lib', 'one.txt'), 'rb') as fh:
+            assert fh.read() == b'one' * 10000
+        assert md5_file(join(self.pkgs_dir, 'one-1.0-0.tar.bz2')) == md5sum
+        assert DigestsData(self.pkgs_dir).get_digest(action.cache_action.target_full_path) == \
+            md5sum
+        assert UrlsData(self.pkgs_dir).get_url('one-1.0-0.tar.bz2') == self.url
+        pc_entry = PackageCache(self.pkgs_dir).get(Dist(self.url))
+        assert pc_entry.is_extracted and pc_entry.is_fetched
+
+    def test_stream_extract_md5_mismatch(self):
+        # the extracted package isn't committed, and a previous extraction is restored
+        make_extracted_package(self.pkgs_dir, 'one-1.0-0')
+        action = self.make_action('0' * 32)
+        action.verify()
+        try:
+            action.execute()
+        except MD5MismatchError:
+            pass
+        else:
+            assert False, "MD5MismatchError not raised"
+        assert not os.path.lexists(join(self.pkgs_dir, 'one-1.0-0.x~'))
+        assert not isfile(join(self.pkgs_dir, 'one-1.0-0', 'lib', 'one.txt'))
+        action.reverse()
+        assert isfile(join(self.pkgs_dir, 'one-1.0-0', 'info', 'index.json'))
+        assert isdir(join(self.pkgs_dir, 'one-1.0-0'))
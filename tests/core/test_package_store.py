@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from io import BytesIO
+import os
+from os.path import join
+from shutil import rmtree
+import tarfile
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from conda.base.context import reset_context
+from conda.common.io import env_var
+from conda.core.package_cache import PackageCache
+from conda.core.package_store import PackageStore
+from conda.core.path_actions import CacheUrlAction, ExtractPackageAction
+from conda.utils import md5_file
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+DIST_NAME = 'one-1.0-0'
+
+
+def write_package(pkgs_dir):
+    # a tarball, and the package extracted from it
+    tarball_path = join(pkgs_dir, DIST_NAME + '.tar.bz2')
+    with tarfile.open(tarball_path, mode='w:bz2') as t:
+        for name, data in (('info/index.json', b'{}'), ('lib/one.txt', b'one' * 1000)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, BytesIO(data))
+    with tarfile.open(tarball_path) as t:
+        t.extractall(join(pkgs_dir, DIST_NAME))
+    return tarball_path
+
+
+def inode(path):
+    st = os.lstat(path)
+    return st.st_dev, st.st_ino
+
+
+class PackageStoreTests(TestCase):
+
+    def setUp(self):
+        PackageCache.clear()
+        self.tmpdir = mkdtemp()
+        self.store_dir = join(self.tmpdir, 'store')
+        self.pkgs_dirs = [join(self.tmpdir, 'pkgs1'), join(self.tmpdir, 'pkgs2')]
+        for pkgs_dir in self.pkgs_dirs:
+            os.makedirs(pkgs_dir)
+        self.md5sum = md5_file(write_package(self.pkgs_dirs[0]))
+        write_package(self.pkgs_dirs[1])
+
+    def tearDown(self):
+        PackageCache.clear()
+        rmtree(self.tmpdir)
+
+    def test_scan(self):
+        store = PackageStore(self.store_dir)
+        tarball_size = os.path.getsize(join(self.pkgs_dirs[0], DIST_NAME + '.tar.bz2'))
+        assert store.stats(self.pkgs_dirs) == {
+            'packages': 0, 'stored_bytes': 0, 'deduplicated_bytes': 0,
+        }
+
+        assert store.scan(self.pkgs_dirs) == tarball_size + 3000 + 2
+        for relative_path in (DIST_NAME + '.tar.bz2', join(DIST_NAME, 'lib', 'one.txt')):
+            paths = [join(pkgs_dir, relative_path) for pkgs_dir in self.pkgs_dirs]
+            assert inode(paths[0]) == inode(paths[1])
+        assert inode(join(self.pkgs_dirs[0], DIST_NAME + '.tar.bz2')) == \
+            inode(store.tarball_path(DIST_NAME, self.md5sum))
+        assert store.stats(self.pkgs_dirs) == {
+            'packages': 1,
+            'stored_bytes': tarball_size + 3002,
+            'deduplicated_bytes': tarball_size + 3002,
+        }
+
+        # scanning again finds nothing new
+        assert store.scan(self.pkgs_dirs) == 0
+
+        # links from the store and other caches don't count as the package being installed
+        path = join(self.pkgs_dirs[1], DIST_NAME, 'lib', 'one.txt')
+        assert store.count_links(self.pkgs_dirs, self.pkgs_dirs[1], path) == 3
+        os.link(path, join(self.tmpdir, 'installed.txt'))
+        assert os.lstat(path).st_nlink == 4
+        assert store.count_links(self.pkgs_dirs, self.pkgs_dirs[1], path) == 3
+
+    def test_scan_different_content(self):
+        # a same-sized file that's been changed in place, or a file conda wrote into the
+        #   extracted package itself, isn't shared with the other caches
+        changed_path = join(self.pkgs_dirs[1], DIST_NAME, 'lib', 'one.txt')
+        with open(changed_path, 'wb') as fh:
+            fh.write(b'two' * 1000)
+        for pkgs_dir in self.pkgs_dirs:
+            with open(join(pkgs_dir, DIST_NAME, 'info', 'package_manifest.json'), 'w') as fh:
+                fh.write('{}')
+
+        store = PackageStore(self.store_dir)
+        store.scan(self.pkgs_dirs)
+        paths = [join(pkgs_dir, DIST_NAME, 'lib', 'one.txt') for pkgs_dir in self.pkgs_dirs]
+        assert inode(paths[0]) != inode(paths[1])
+        with open(changed_path, 'rb') as fh:
+            assert fh.read() == b'two' * 1000
+        paths = [join(pkgs_dir, DIST_NAME, 'info', 'package_manifest.json')
+                 for pkgs_dir in self.pkgs_dirs]
+        assert inode(paths[0]) != inode(paths[1])
+        assert all(os.lstat(path).st_nlink == 1 for path in paths)
+
+    def test_cache_and_extract_from_store(self):
+        PackageStore(self.store_dir).scan(self.pkgs_dirs[:1])
+        pkgs_dir = join(self.tmpdir, 'pkgs3')
+        os.makedirs(pkgs_dir)
+        url = 'https://conda.anaconda.org/other-channel/linux-64/%s.tar.bz2' % DIST_NAME
+        cache_action = CacheUrlAction(url, pkgs_dir, DIST_NAME + '.tar.bz2', self.md5sum)
+        extract_action = ExtractPackageAction(cache_action.target_full_path, pkgs_dir,
+                                              DIST_NAME)
+        with env_var('CONDA_PKGS_STORE_DIR', self.store_dir, reset_context):
+            with patch('conda.core.path_actions.download') as download:
+                with patch('conda.core.path_actions.extract_tarball') as extract_tarball:
+                    cache_action.execute()
+                    extract_action.execute()
+        assert not download.called
+        assert not extract_tarball.called
+
+        for relative_path in (DIST_NAME + '.tar.bz2', join(DIST_NAME, 'lib', 'one.txt')):
+            assert inode(join(pkgs_dir, relative_path)) == \
+                inode(join(self.pkgs_dirs[0], relative_path))
+        package_cache = PackageCache(pkgs_dir)
+        assert package_cache.urls_data.get_url(DIST_NAME) == url
+        assert package_cache.digests_data.get_digest(cache_action.target_full_path) == \
+            self.md5sum
+        assert [pce.is_extracted for pce in package_cache.values()] == [True]
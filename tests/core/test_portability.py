@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from conda.core.portability import SHEBANG_REGEX, replace_long_shebang
+from conda.common.compat import on_win
+from conda.core.portability import (SHEBANG_REGEX, _PaddingError, binary_replace,
+                                    find_binary_prefix_offsets, read_prefix_offsets,
+                                    recorded_prefix_offsets, replace_long_shebang,
+                                    update_prefix, write_prefix_offsets)
 from conda.models.enums import FileMode
 from logging import getLogger
+import os
+from os.path import join
 import re
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
 
+import pytest
+
 log = getLogger(__name__)
 
 
@@ -76,3 +86,78 @@ class ReplaceShebangTests(TestCase):
         new_shebang = b"#!/usr/bin/env escaped\\ space --and --flags -x"
         new_expected_data = b'\n'.join((new_shebang, content_line, content_line, content_line))
         assert new_expected_data == new_data
+
+
+PLACEHOLDER = '/opt/anaconda1anaconda2anaconda3'
+BINARY_DATA = (b'\x7fELF\0\0' + PLACEHOLDER.encode('utf-8') + b'/lib\0'
+               + b'x' * 5000 + b'\0rpath=' + PLACEHOLDER.encode('utf-8')
+               + b'/a:' + PLACEHOLDER.encode('utf-8') + b'/b\0tail\0')
+
+
+@pytest.mark.skipif(on_win, reason="binary prefixes are only replaced in place on unix")
+class UpdateBinaryPrefixTests(TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.path = join(self.tmpdir, 'libfoo.so')
+        with open(self.path, 'wb') as fh:
+            fh.write(BINARY_DATA)
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def read(self):
+        with open(self.path, 'rb') as fh:
+            return fh.read()
+
+    def test_find_binary_prefix_offsets(self):
+        offsets = find_binary_prefix_offsets(BINARY_DATA, PLACEHOLDER.encode('utf-8'))
+        assert [BINARY_DATA[start:end] for start, end in offsets] == [
+            PLACEHOLDER.encode('utf-8') + b'/lib',
+            PLACEHOLDER.encode('utf-8') + b'/a:' + PLACEHOLDER.encode('utf-8') + b'/b',
+        ]
+
+    def test_update_prefix(self):
+        update_prefix(self.path, '/usr/local', PLACEHOLDER, FileMode.binary)
+        assert self.read() == binary_replace(BINARY_DATA, PLACEHOLDER.encode('utf-8'),
+                                             b'/usr/local')
+
+    def test_update_prefix_offsets(self):
+        offsets = find_binary_prefix_offsets(BINARY_DATA, PLACEHOLDER.encode('utf-8'))
+        update_prefix(self.path, '/usr/local', PLACEHOLDER, FileMode.binary, offsets[:1])
+        # only the strings at the offsets given are replaced
+        data = self.read()
+        assert data.startswith(b'\x7fELF\0\0/usr/local/lib\0')
+        assert data.endswith(b'rpath=' + PLACEHOLDER.encode('utf-8') + b'/a:'
+                             + PLACEHOLDER.encode('utf-8') + b'/b\0tail\0')
+
+        # offsets that don't point at the placeholder anymore are ignored
+        with open(self.path, 'wb') as fh:
+            fh.write(BINARY_DATA)
+        update_prefix(self.path, '/usr/local', PLACEHOLDER, FileMode.binary, [(10, 20)])
+        assert self.read() == binary_replace(BINARY_DATA, PLACEHOLDER.encode('utf-8'),
+                                             b'/usr/local')
+
+    def test_update_prefix_padding_error(self):
+        with pytest.raises(_PaddingError):
+            update_prefix(self.path, '/a' * 30, PLACEHOLDER, FileMode.binary)
+        assert self.read() == BINARY_DATA
+
+    def test_write_prefix_offsets(self):
+        os.makedirs(join(self.tmpdir, 'info'))
+        with open(join(self.tmpdir, 'info', 'files'), 'w') as fh:
+            fh.write('libfoo.so\n')
+        with open(join(self.tmpdir, 'info', 'has_prefix'), 'w') as fh:
+            fh.write('%s binary libfoo.so\n' % PLACEHOLDER)
+        for fn in ('no_link', 'no_softlink'):
+            with open(join(self.tmpdir, 'info', fn), 'w'):
+                pass
+        write_prefix_offsets(self.tmpdir)
+
+        entry = read_prefix_offsets(self.tmpdir)['libfoo.so']
+        assert recorded_prefix_offsets(entry, self.path, PLACEHOLDER) == \
+            find_binary_prefix_offsets(BINARY_DATA, PLACEHOLDER.encode('utf-8'))
+        assert recorded_prefix_offsets(entry, self.path, '/other/placeholder') is None
+        with open(self.path, 'ab') as fh:
+            fh.write(b'more')
+        assert recorded_prefix_offsets(entry, self.path, PLACEHOLDER) is None
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from io import BytesIO
+import json
+import os
+from os.path import isdir, islink, join
+from shutil import rmtree
+import stat
+import sys
+import tarfile
+
+import pytest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from conda import CondaError
+from conda.common.compat import text_type
+from conda.exceptions import ClobberError
+from conda.gateways.disk import create
+from conda.gateways.disk.create import (compile_multiple_pyc, copy_file, extract_tarball,
+                                        extract_tarball_stream, write_package_manifest)
+from conda.gateways.disk.read import read_package_info, read_package_manifest
+from conda.models.enums import PathType
+from conda.models.index_record import IndexRecord
+from conda.utils import on_win
+
+
+def _make_tarball(path, extra_members=()):
+    with tarfile.open(path, mode='w:bz2') as t:
+        def add(name, type=tarfile.REGTYPE, data=b'', mode=0o644, mtime=1000000, **kwargs):
+            info = tarfile.TarInfo(name)
+            info.type, info.size, info.mode, info.mtime = type, len(data), mode, mtime
+            info.uid = info.gid = 4242
+            for key, value in kwargs.items():
+                setattr(info, key, value)
+            t.addfile(info, BytesIO(data))
+
+        add('info', tarfile.DIRTYPE, mode=0o755, mtime=2000000)
+        add('info/index.json', data=b'{}')
+        add('bin/tool', data=b'#!/bin/sh\n', mode=0o755)
+        add('lib/libfoo.so.1', data=b'x' * 100000)
+        add('lib/libfoo.so', tarfile.SYMTYPE, linkname='libfoo.so.1')
+        add('lib/libfoo-copy.so.1', tarfile.LNKTYPE, linkname='lib/libfoo.so.1')
+        for member in extra_members:
+            add(*member)
+
+
+def _check_extracted(destination):
+    with open(join(destination, 'lib', 'libfoo.so.1'), 'rb') as fh:
+        assert fh.read() == b'x' * 100000
+    assert os.stat(join(destination, 'info', 'index.json')).st_mtime == 1000000
+    assert os.stat(join(destination, 'info')).st_mtime == 2000000
+    if not on_win:
+        assert stat.S_IMODE(os.stat(join(destination, 'bin', 'tool')).st_mode) == 0o755
+        assert stat.S_IMODE(os.stat(join(destination, 'lib', 'libfoo.so.1')).st_mode) == 0o644
+        assert islink(join(destination, 'lib', 'libfoo.so'))
+        assert os.readlink(join(destination, 'lib', 'libfoo.so')) == 'libfoo.so.1'
+        assert os.stat(join(destination, 'lib', 'libfoo-copy.so.1')).st_nlink == 2
+        # files belong to whoever extracted them, not to the owner recorded in the tarball
+        assert os.lstat(join(destination, 'lib', 'libfoo.so')).st_uid == os.getuid()
+        assert os.stat(join(destination, 'bin', 'tool')).st_uid == os.getuid()
+
+
+def test_extract_tarball(tmpdir):
+    tarball = join(text_type(tmpdir), 'foo-1.0-0.tar.bz2')
+    _make_tarball(tarball)
+    extract_tarball(tarball)
+    _check_extracted(join(text_type(tmpdir), 'foo-1.0-0'))
+
+
+def test_extract_tarball_stream(tmpdir):
+    tarball = join(text_type(tmpdir), 'foo-1.0-0.tar.bz2')
+    _make_tarball(tarball)
+    destination = join(text_type(tmpdir), 'extracted')
+    with open(tarball, 'rb') as fh:
+        extract_tarball_stream(fh, destination)
+    _check_extracted(destination)
+
+
+def test_extract_tarball_outside_destination(tmpdir):
+    tarball = join(text_type(tmpdir), 'foo-1.0-0.tar.bz2')
+    _make_tarball(tarball, extra_members=[('../escaped', tarfile.REGTYPE, b'gotcha')])
+    with pytest.raises(CondaError):
+        extract_tarball(tarball)
+    assert not os.path.lexists(join(text_type(tmpdir), 'escaped'))
+    assert isdir(join(text_type(tmpdir), 'foo-1.0-0'))
+
+
+@pytest.mark.skipif(on_win, reason="symlinks need privileges on windows")
+def test_extract_tarball_through_symlink(tmpdir):
+    # members can't be written through links that earlier members made
+    outside = join(text_type(tmpdir), 'outside')
+    os.makedirs(outside)
+    with open(join(outside, 'victim'), 'wb') as fh:
+        fh.write(b'safe')
+    for name, link_type, linkname in (('lib/x', tarfile.SYMTYPE, outside),
+                                      ('lib/victim', tarfile.SYMTYPE, outside),
+                                      ('victim', tarfile.LNKTYPE, '../outside/victim')):
+        tarball = join(text_type(tmpdir), 'foo-1.0-0.tar.bz2')
+        with tarfile.open(tarball, mode='w:bz2') as t:
+            info = tarfile.TarInfo('lib' if name == 'lib/x' else name)
+            info.type, info.linkname = link_type, linkname
+            t.addfile(info)
+            info = tarfile.TarInfo(name)
+            info.size = 6
+            t.addfile(info, BytesIO(b'gotcha'))
+        destination = join(text_type(tmpdir), 'foo-1.0-0')
+        try:
+            extract_tarball(tarball, destination)
+        except CondaError:
+            pass
+        assert sorted(os.listdir(outside)) == ['victim']
+        with open(join(outside, 'victim'), 'rb') as fh:
+            assert fh.read() == b'safe'
+        rmtree(destination)
+
+
+def test_compile_multiple_pyc(tmpdir):
+    py_paths, pyc_paths = [], []
+    for q in range(5):
+        py_paths.append(join(text_type(tmpdir), 'mod%d.py' % q))
+        pyc_paths.append(join(text_type(tmpdir), '__pycache__', 'mod%d.pyc' % q))
+        with open(py_paths[-1], 'w') as fh:
+            fh.write('x = (\n' if q == 3 else 'x = %d\n' % q)
+
+    with patch('conda.gateways.disk.create.PYC_FILES_PER_PROCESS', 2):
+        failures = compile_multiple_pyc(sys.executable, py_paths, pyc_paths)
+    assert list(failures) == [pyc_paths[3]]
+    assert 'SyntaxError' in failures[pyc_paths[3]]
+    assert [os.path.isfile(path) for path in pyc_paths] == [True, True, True, False, True]
+
+    with pytest.raises(ClobberError):
+        compile_multiple_pyc(sys.executable, py_paths, pyc_paths)
+
+
+def _make_copy_source(tmpdir):
+    src = join(text_type(tmpdir), 'src.bin')
+    with open(src, 'wb') as fh:
+        fh.write(os.urandom(3 * 2 ** 20 + 17))
+    os.chmod(src, 0o751)
+    os.utime(src, (1000000, 2000000))
+    return src
+
+
+def _check_copied(src, dst):
+    with open(src, 'rb') as fh1, open(dst, 'rb') as fh2:
+        assert fh1.read() == fh2.read()
+    assert os.stat(dst).st_mtime == 2000000
+    if not on_win:
+        assert stat.S_IMODE(os.stat(dst).st_mode) == 0o751
+
+
+def test_copy_file(tmpdir):
+    src = _make_copy_source(tmpdir)
+    with patch.dict(create._copy_backends, clear=True):
+        copy_file(src, join(text_type(tmpdir), 'dst.bin'))
+        _check_copied(src, join(text_type(tmpdir), 'dst.bin'))
+        if not on_win:
+            assert list(create._copy_backends) == [(os.stat(src).st_dev,) * 2]
+
+
+@pytest.mark.skipif(on_win, reason="windows always uses shutil.copy2")
+def test_copy_file_fallback(tmpdir):
+    src = _make_copy_source(tmpdir)
+    calls = []
+
+    def unsupported(backend):
+        def copy(src_fd, dst_fd, size):
+            calls.append(backend)
+            os.write(dst_fd, b'partial')
+            raise create._CopyUnsupported()
+        return copy
+
+    with patch.dict(create._copy_backends, clear=True):
+        with patch.dict(create._COPY_FUNCTIONS, reflink=unsupported('reflink'),
+                        kernel=unsupported('kernel')):
+            copy_file(src, join(text_type(tmpdir), 'dst1.bin'))
+            copy_file(src, join(text_type(tmpdir), 'dst2.bin'))
+        assert list(create._copy_backends.values()) == [2]
+    # the backend is only worked out on the first copy between two filesystems
+    assert calls == ['reflink', 'kernel']
+    _check_copied(src, join(text_type(tmpdir), 'dst1.bin'))
+    _check_copied(src, join(text_type(tmpdir), 'dst2.bin'))
+
+
+def test_write_package_manifest(tmpdir):
+    extracted_dir = join(text_type(tmpdir), 'foo-1.0-0')
+    os.makedirs(join(extracted_dir, 'info'))
+    os.makedirs(join(extracted_dir, 'bin'))
+    info_files = {
+        'index.json': {'name': 'foo', 'version': '1.0', 'build': '0', 'build_number': 0},
+        'package_metadata.json': {'package_metadata_version': 1,
+                                  'noarch': {'type': 'python', 'entry_points': ['foo=foo:main']}},
+        'paths.json': {'paths_version': 1, 'paths': [
+            {'_path': 'bin/foo', 'path_type': 'hardlink', 'sha256': 'abc', 'size_in_bytes': 4,
+             'prefix_placeholder': '/opt/placeholder', 'file_mode': 'text'},
+            {'_path': 'bin/bar', 'path_type': 'softlink', 'sha256': 'def', 'size_in_bytes': 3,
+             'no_link': True},
+        ]},
+    }
+    for fn, data in info_files.items():
+        with open(join(extracted_dir, 'info', fn), 'w') as fh:
+            json.dump(data, fh)
+    with open(join(extracted_dir, 'info', 'icon.png'), 'wb') as fh:
+        fh.write(b'\x89PNG')
+    record = IndexRecord(fn='foo-1.0-0.tar.bz2', schannel='defaults',
+                         url='https://repo.example.com/foo-1.0-0.tar.bz2',
+                         **info_files['index.json'])
+    parsed = read_package_info(record, extracted_dir)
+
+    write_package_manifest(extracted_dir)
+    assert read_package_manifest(extracted_dir) is not None
+    with patch('conda.gateways.disk.read.read_paths_json') as read_paths:
+        from_manifest = read_package_info(record, extracted_dir)
+    assert not read_paths.called
+    assert from_manifest.index_json_record == parsed.index_json_record
+    assert from_manifest.package_metadata.dump() == parsed.package_metadata.dump()
+    assert from_manifest.paths_data.dump() == parsed.paths_data.dump()
+    assert from_manifest.paths_data.paths[1].path_type == PathType.softlink
+    assert from_manifest.load_icondata() == 'iVBORw=='
+
+    # a manifest that's out of date with the package is ignored
+    with open(join(extracted_dir, 'info', 'index.json'), 'w') as fh:
+        json.dump(dict(info_files['index.json'], build_number=1), fh)
+    assert read_package_manifest(extracted_dir) is None
+    assert read_package_info(record, extracted_dir).index_json_record.build_number == 1
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import hashlib
+from io import BytesIO
+import json
+import os
+from os.path import isfile, join
+import random
+import re
+from shutil import rmtree
+import tarfile
+from tempfile import mkdtemp
+from threading import Event, Lock, Thread
+from time import sleep, time
+from unittest import TestCase
+
+import pytest
+
+from conda.exceptions import MD5MismatchError
+from conda.gateways.download import DownloadScheduler, download, download_and_extract
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_tarball():
+    rand = random.Random(0)
+    data = bytes(bytearray(rand.randint(0, 255) for _ in range(200000)))
+    buf = BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:bz2') as t:
+        info = tarfile.TarInfo('lib/data')
+        info.size = len(data)
+        t.addfile(info, BytesIO(data))
+    return data, buf.getvalue()
+
+
+class FlakyRequestHandler(BaseHTTPRequestHandler):
+    # A stand-in for a package server, that can drop connections partway through a response.
+    protocol_version = 'HTTP/1.1'
+    body = b''
+    etag = '"v1"'
+    accept_ranges = True
+    drops = []  # for each of the next requests, the number of bytes to send before dropping
+    ranges = []  # the Range header of every request
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        self.ranges.append(range_header)
+        start = 0
+        match = re.match(r'bytes=(\d+)-$', range_header or '')
+        if (match and self.accept_ranges
+                and self.headers.get('If-Range') in (None, self.etag)):
+            start = int(match.group(1))
+            if start >= len(self.body):
+                self.send_response(416)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             'bytes %d-%d/%d' % (start, len(self.body) - 1, len(self.body)))
+        else:
+            self.send_response(200)
+        body = self.body[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if self.drops:
+            self.wfile.write(body[:self.drops.pop(0)])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ResumableDownloadTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data, cls.tarball = make_tarball()
+        cls.md5sum = hashlib.md5(cls.tarball).hexdigest()
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        FlakyRequestHandler.body = self.tarball
+        FlakyRequestHandler.accept_ranges = True
+        FlakyRequestHandler.drops = []
+        FlakyRequestHandler.ranges = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyRequestHandler)
+        self.server_thread = Thread(target=self.server.serve_forever, args=(0.05,))
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:%d/one-1.0-0.tar.bz2' % self.server.server_port
+        self.target = join(self.tmpdir, 'one-1.0-0.tar.bz2')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.tmpdir)
+
+    def download_dropped(self, dropped_at, **kwargs):
+        FlakyRequestHandler.drops = [dropped_at]
+        try:
+            download(self.url, self.target, self.md5sum, **kwargs)
+        except Exception:
+            pass
+        else:
+            assert False, "dropped download didn't fail"
+        assert not isfile(self.target)
+
+    def partial_length(self):
+        # how much of the download was kept to resume from; how much of what was sent before
+        #   the drop that is depends on the size of the reads
+        length = os.path.getsize(self.target + '.partial')
+        with open(self.target + '.partial.json') as fh:
+            assert json.load(fh)['length'] == length
+        return length
+
+    def test_resume(self):
+        self.download_dropped(50000)
+        with open(self.target + '.partial.json') as fh:
+            sidecar = json.load(fh)
+        assert sidecar['url'] == self.url
+        assert sidecar['etag'] == '"v1"'
+        length = self.partial_length()
+        assert 0 < length <= 50000
+
+        progress = []
+        assert download(self.url, self.target, self.md5sum,
+                        lambda streamed, total: progress.append((streamed, total))) == self.md5sum
+        assert FlakyRequestHandler.ranges == [None, 'bytes=%d-' % length]
+        assert progress[-1] == (len(FlakyRequestHandler.body),) * 2
+        with open(self.target, 'rb') as fh:
+            assert fh.read() == FlakyRequestHandler.body
+        assert not os.path.lexists(self.target + '.partial')
+        assert not os.path.lexists(self.target + '.partial.json')
+
+    def test_resume_twice_and_extract(self):
+        FlakyRequestHandler.drops = [20000, 30000]
+        extracted = join(self.tmpdir, 'one-1.0-0')
+        expected_ranges = [None]
+        for q in range(2):
+            try:
+                download_and_extract(self.url, self.target, self.md5sum, extracted)
+            except Exception:
+                assert not os.path.lexists(extracted)
+            else:
+                assert False, "dropped download didn't fail"
+            expected_ranges.append('bytes=%d-' % self.partial_length())
+        assert download_and_extract(self.url, self.target, self.md5sum, extracted) == self.md5sum
+        assert FlakyRequestHandler.ranges == expected_ranges
+        # the second attempt resumed from where the first one stopped
+        assert int(expected_ranges[2][6:-1]) >= int(expected_ranges[1][6:-1])
+        with open(join(extracted, 'lib', 'data'), 'rb') as fh:
+            assert fh.read() == self.data
+        assert not os.path.lexists(extracted + '.x~')
+
+    def test_no_range_support(self):
+        FlakyRequestHandler.accept_ranges = False
+        self.download_dropped(50000)
+        length = self.partial_length()
+        assert download(self.url, self.target, self.md5sum) == self.md5sum
+        assert FlakyRequestHandler.ranges == [None, 'bytes=%d-' % length]
+        with open(self.target, 'rb') as fh:
+            assert fh.read() == FlakyRequestHandler.body
+
+    def test_changed_file(self):
+        # a partial download of an older file isn't resumed
+        self.download_dropped(50000)
+        FlakyRequestHandler.etag = '"v2"'
+        try:
+            assert download(self.url, self.target, self.md5sum) == self.md5sum
+        finally:
+            FlakyRequestHandler.etag = '"v1"'
+        with open(self.target, 'rb') as fh:
+            assert fh.read() == FlakyRequestHandler.body
+
+    def test_md5_mismatch(self):
+        # a bad partial download isn't kept around to resume from
+        self.download_dropped(50000)
+        try:
+            download(self.url, self.target, '0' * 32)
+        except MD5MismatchError:
+            pass
+        else:
+            assert False, "MD5MismatchError not raised"
+        assert not os.path.lexists(self.target + '.partial')
+        assert not os.path.lexists(self.target + '.partial.json')
+        assert not os.path.lexists(self.target)
+
+
+class DownloadSchedulerTests(TestCase):
+
+    def setUp(self):
+        pytest.importorskip('concurrent.futures')
+        self.lock = Lock()
+        self.started = []
+        self.running = {}
+        self.max_running = {}
+
+    def make_job(self, name, host, duration=0.05, wait_for=None):
+        def job(progress_update_callback):
+            with self.lock:
+                self.started.append(name)
+                self.running[host] = self.running.get(host, 0) + 1
+                self.max_running[host] = max(self.max_running.get(host, 0), self.running[host])
+            if wait_for is not None:
+                wait_for.wait(5)
+            sleep(duration)
+            progress_update_callback(1000, 1000)
+            with self.lock:
+                self.running[host] -= 1
+            return name
+        return job
+
+    def test_largest_first(self):
+        scheduler = DownloadScheduler(1)
+        release = Event()
+        futures = [scheduler.submit('https://a.example.com/first', 0,
+                                    self.make_job('first', 'a', wait_for=release))]
+        sleep(0.05)
+        for name, size in (('small', 1), ('large', 3), ('medium', 2)):
+            futures.append(scheduler.submit('https://a.example.com/' + name, size,
+                                            self.make_job(name, 'a', duration=0)))
+        assert scheduler.stats()['queued'] == 3
+        release.set()
+        assert [future.result() for future in futures] == ['first', 'small', 'large', 'medium']
+        scheduler.shutdown()
+        assert self.started == ['first', 'large', 'medium', 'small']
+        stats = scheduler.stats()
+        assert (stats['queued'], stats['active'], stats['bytes']) == (0, 0, 4000)
+        assert stats['hosts']['a.example.com']['bytes'] == 4000
+
+    def test_host_connections(self):
+        scheduler = DownloadScheduler(4, host_connections={'slow.example.com': 1},
+                                      default_host_connections=2)
+        futures = [scheduler.submit('https://%s.example.com:8443/%d' % (host, q), 10 - q,
+                                    self.make_job((host, q), host))
+                   for q in range(3) for host in ('slow', 'fast')]
+        for future in futures:
+            future.result()
+        scheduler.shutdown()
+        assert self.max_running == {'slow': 1, 'fast': 2}
+        # the fast host isn't held up behind the slow one
+        assert self.started.index(('fast', 2)) < self.started.index(('slow', 2))
+
+    def test_host_bandwidth(self):
+        scheduler = DownloadScheduler(2, host_bandwidth={'capped.example.com': 1000000})
+
+        def job(progress_update_callback):
+            for streamed_bytes in range(50000, 200001, 50000):
+                progress_update_callback(streamed_bytes, 200000)
+
+        start = time()
+        futures = [scheduler.submit('https://capped.example.com/%d' % q, 0, job)
+                   for q in range(2)]
+        for future in futures:
+            future.result()
+        assert time() - start >= 0.35
+        start = time()
+        scheduler.submit('https://other.example.com/', 0, job).result()
+        assert time() - start < 0.2
+        scheduler.shutdown()
+        assert scheduler.stats()['hosts']['capped.example.com']['bytes'] == 400000
@@ -9,7 +9,7 @@ from conda.common.compat import odict
 from conda.common.configuration import YamlRawParameter
 from conda.common.url import join_url
 from conda.common.yaml import yaml_load
-from conda.models.channel import Channel
+from conda.models.channel import Channel, _LocationTrie, _channel_configuration_cache_
 from conda.utils import on_win
 from logging import getLogger
 from unittest import TestCase
@@ -716,3 +716,47 @@ class ChannelAuthTokenPriorityTests(TestCase):
         channel = Channel("ftp://new.url:8081/donald")
         assert channel.location == "new.url:8081"
         assert channel.canonical_name == "donald"
+
+
+class ChannelLocationIndexTests(TestCase):
+
+    def test_location_trie(self):
+        trie = _LocationTrie()
+        trie.add('some.host/a/b'.split('/'), 'ab')
+        trie.add('some.host/a'.split('/'), 'a')
+        trie.add('other.host'.split('/'), 'other')
+        assert trie.find('some.host/a/b/c'.split('/')) == 'ab'
+        assert trie.find('some.host/a/bc'.split('/')) == 'ab'
+        assert trie.find('some.host/a/c'.split('/')) == 'a'
+        assert trie.find('some.host/ab'.split('/')) == 'a'
+        assert trie.find('some.host'.split('/')) is None
+        assert trie.find('other.hostname/a'.split('/')) == 'other'
+
+        trie = _LocationTrie(tokenized=True)
+        trie.add(('host', 'a', 'b'), 'ab')
+        trie.add(('host', 'a'), 'a')
+        assert trie.find(('host', 'a', 'b', 'c')) == 'ab'
+        assert trie.find(('host', 'a', 'bc')) == 'a'
+        assert trie.find(('host', 'ab')) is None
+        assert trie.find(('host',)) == 'ab'
+
+    def test_cached_per_channel(self):
+        string = dals("""
+        custom_channels:
+          chuck: http://another.url:8080/with/path
+        """)
+        reset_context()
+        rd = odict(testdata=YamlRawParameter.make_raw_parameters('testdata', yaml_load(string)))
+        context._set_raw_data(rd)
+        Channel._reset_state()
+        try:
+            for fn in ('a-1-0.tar.bz2', 'b-1-0.tar.bz2'):
+                channel = Channel('http://another.url:8080/with/path/chuck/linux-64/%s' % fn)
+                assert channel.canonical_name == 'chuck'
+                assert channel.package_filename == fn
+            assert len(_channel_configuration_cache_) == 1
+        finally:
+            reset_context()
+        assert len(_channel_configuration_cache_) == 0
+        channel = Channel('http://another.url:8080/with/path/chuck/linux-64/a-1-0.tar.bz2')
+        assert channel.canonical_name == 'http://another.url:8080/with/path/chuck'
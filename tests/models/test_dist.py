@@ -5,8 +5,11 @@ from conda.base.context import context
 from conda.common.url import join_url, path_to_url
 from conda.models.dist import Dist
 from logging import getLogger
+import pickle
 from unittest import TestCase
 
+import pytest
+
 log = getLogger(__name__)
 
 
@@ -55,6 +58,31 @@ class DistTests(TestCase):
         assert d.to_url() == join_url("s3://some/bucket/name", context.subdir,
                                       "spyder-app-2.3.8-py27_0.tar.bz2")
 
+    def test_interned(self):
+        d = Dist.from_string("spyder-app-2.3.8-py27_0.tar.bz2", channel_override='conda-forge')
+        assert Dist.from_string("spyder-app-2.3.8-py27_0", channel_override='conda-forge') is d
+        assert Dist("spyder-app-2.3.8-py27_0") is Dist("spyder-app-2.3.8-py27_0.tar.bz2")
+        assert Dist(channel='conda-forge', dist_name='spyder-app-2.3.8-py27_0',
+                    name='spyder-app', version='2.3.8', build_string='py27_0',
+                    build_number=0) is d
+        assert hash(d) == hash(('conda-forge', 'spyder-app-2.3.8-py27_0', None))
+        assert d != Dist("spyder-app-2.3.8-py27_0")
+        assert sorted([d, Dist("spyder-app-2.3.8-py27_0")])[0] == d
+
+    def test_immutable(self):
+        d = Dist("spyder-app-2.3.8-py27_0")
+        with pytest.raises(AttributeError):
+            d.channel = 'conda-forge'
+        with pytest.raises(AttributeError):
+            del d.dist_name
+        with pytest.raises(AttributeError):
+            d.extra = 1
+        assert pickle.loads(pickle.dumps(d)) is d
+        assert d.dump() == {'channel': 'defaults', 'dist_name': 'spyder-app-2.3.8-py27_0',
+                            'name': 'spyder-app', 'version': '2.3.8', 'build_string': 'py27_0',
+                            'build_number': 0, 'with_features_depends': None,
+                            'base_url': None, 'platform': None}
+
 
 class UrlDistTests(TestCase):
 
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import pickle
+from unittest import TestCase
+
+import pytest
+
+from conda._vendor.auxlib.exceptions import ValidationError
+from conda.models.enums import Platform
+from conda.models.index_record import EMPTY_LINK, IndexRecord, Link, SharedFields
+
+
+def make_info(**kwargs):
+    info = {
+        'build': 'py27_0',
+        'build_number': 0,
+        'depends': ['python 2.7*'],
+        'name': 'foo',
+        'platform': 'linux',
+        'version': '1.0',
+        'sha256': 'not a field',
+    }
+    info.update(kwargs)
+    return info
+
+
+class IndexRecordTests(TestCase):
+
+    def test_dict_access(self):
+        rec = IndexRecord(**make_info())
+        assert rec['name'] == rec.name == 'foo'
+        assert rec.get('depends') == ('python 2.7*',)
+        assert rec.get('features', '') == ''
+        assert rec.platform == Platform.linux
+        assert rec.files == ()
+        assert rec.preferred_env is None
+        assert rec.md5 is None
+        assert 'depends' in rec
+        assert 'features' not in rec
+        assert 'sha256' not in rec
+        assert list(rec) == ['build', 'build_number', 'depends', 'name', 'platform', 'version']
+        with pytest.raises(AttributeError):
+            rec.features
+        with pytest.raises(AttributeError):
+            rec.sha256
+
+    def test_immutable(self):
+        rec = IndexRecord(**make_info())
+        with pytest.raises(AttributeError):
+            rec.name = 'bar'
+        with pytest.raises(AttributeError):
+            rec['name'] = 'bar'
+        with pytest.raises(AttributeError):
+            del rec['name']
+
+    def test_validation(self):
+        with pytest.raises(ValidationError):
+            IndexRecord(**make_info(name=None))
+        info = make_info()
+        del info['version']
+        with pytest.raises(ValidationError):
+            IndexRecord(**info)
+
+        # field values are validated lazily, on first access
+        rec = IndexRecord(**make_info(size='big'))
+        with pytest.raises(ValidationError):
+            rec.size
+        with pytest.raises(ValidationError):
+            rec.validate()
+
+        # None means "not set" for fields that are not nullable
+        rec = IndexRecord(**make_info(features=None, url=None))
+        assert 'features' not in rec
+        assert rec.dump()['url'] is None
+
+    def test_shared_fields(self):
+        shared = SharedFields(schannel='defaults', channel='https://repo/free/linux-64',
+                              priority=1, auth=None)
+        rec1 = IndexRecord.from_shared(shared, make_info(fn='foo-1.0-py27_0.tar.bz2'))
+        rec2 = IndexRecord.from_shared(shared, make_info(name='bar', channel='ignored'))
+        assert rec1._schema is not rec2._schema
+        assert rec1.priority == rec2.priority == 1
+        assert rec2.channel == 'https://repo/free/linux-64'
+        assert rec1 == IndexRecord(**rec1.dump())
+        assert hash(rec1) == hash(IndexRecord(**rec1.dump()))
+
+    def test_from_objects(self):
+        shared = SharedFields(schannel='defaults', priority=1)
+        rec = IndexRecord.from_shared(shared, make_info())
+        assert rec.depends == ('python 2.7*',)
+
+        rec2 = IndexRecord.from_objects(rec, depends=rec['depends'] + ('pip',), link=EMPTY_LINK)
+        assert rec2.depends == ('python 2.7*', 'pip')
+        assert rec2.link == Link(source='')
+        assert rec2.priority == 1
+        assert rec2._values[rec2._schema.index['name']] is rec._values[rec._schema.index['name']]
+        assert rec.depends == ('python 2.7*',)
+        assert 'link' not in rec
+
+        rec3 = IndexRecord.from_objects(rec, priority=5)
+        assert rec3.priority == 5
+        assert rec.priority == 1
+        assert IndexRecord.from_objects(rec) is rec
+        assert IndexRecord.from_objects(rec, priority=None) is rec
+
+        rec4 = IndexRecord.from_objects(make_info(), rec3, name='baz')
+        assert rec4.name == 'baz'
+        assert rec4.priority == 5
+        assert rec4.schannel == 'defaults'
+
+    def test_dump(self):
+        rec = IndexRecord(**make_info(link={'source': '/pkgs/foo', 'type': 'hard-link'}))
+        dumped = rec.dump()
+        assert dumped['platform'] == 'linux'
+        assert dumped['link'] == {'source': '/pkgs/foo', 'type': 1}
+        assert 'sha256' not in dumped
+        assert json.loads(rec.json())['depends'] == ['python 2.7*']
+        assert pickle.loads(pickle.dumps(rec)) == rec
+        assert rec.copy() == rec
@@ -1,3 +1,4 @@
+from conda._vendor.auxlib.exceptions import ValidationError
 from conda.models.channel import Channel
 from conda.models.package_info import PackageInfo, PathData, PathType, Noarch, PathsData, \
     PackageMetadata
@@ -38,3 +39,30 @@ class DefaultPackageInfo(TestCase):
         self.assertIsInstance(package_info.index_json_record, IndexRecord)
         self.assertIsInstance(package_info.package_metadata.noarch, Noarch)
         self.assertEquals(package_info.paths_data.paths[0].path, "test/path/1")
+
+    def test_compiled_init(self):
+        assert PathData.__compiled_init__ is not None
+        generic_path_data = type(PathData)(str('PathData'), (PathData,), {'__fast_init__': False})
+        assert generic_path_data.__compiled_init__ is None
+
+        for kwargs in (dict(_path="a", path_type="hardlink"),
+                       dict(_path="a", path_type=PathType.softlink, file_mode="text",
+                            prefix_placeholder=None, no_link=None),
+                       dict(_path="a", path_type="hardlink", file_mode=None, no_link=0)):
+            self.assertEqual(PathData(**kwargs).__dict__, generic_path_data(**kwargs).__dict__)
+            self.assertEqual(PathData(trusted=True, **kwargs).__dict__,
+                             generic_path_data(trusted=True, **kwargs).__dict__)
+
+        for kwargs in (dict(path_type="hardlink"),
+                       dict(_path=("a",), path_type="hardlink"),
+                       dict(_path="a", path_type=None),
+                       dict(_path="a", path_type="bogus")):
+            self.assertRaises(ValidationError, PathData, **kwargs)
+            self.assertRaises(ValidationError, generic_path_data, **kwargs)
+
+    def test_trusted_init(self):
+        path_data = PathData(trusted=True, _path=("a",), path_type="softlink", file_mode=None)
+        self.assertEqual(path_data.path, ("a",))
+        self.assertEqual(path_data.path_type, PathType.softlink)
+        self.assertIsNone(path_data.file_mode)
+        self.assertRaises(AttributeError, getattr, PathData(trusted=True), 'path_type')
@@ -195,3 +195,53 @@ class TestVersionSpec(unittest.TestCase):
             m = VersionSpec(version)
             self.assertTrue(m.match(version))
 
+
+    def test_intervals_match(self):
+        versions = ['1.5', '1.5.3', '1.6', '1.7dev', '1.7.dev1', '1.7a', '1.7a1', '1.7ab',
+                    '1.7', '1.7.0', '1.7.1', '1.7.1+g1', '1.7.post1', '1.70', '1.8', '1.11.2',
+                    '1.110', '2.0a', '2', '1!0.4']
+        for vspec in ['1.7*', '1.7.*', '1.7a*', '1.7.1*', '1.1*', '>=1.7,<2|1.5.*',
+                      '!=1.7', '>1.7.1,<1.8', '1.7*|1.8*', '<=1.7', '==1.7',
+                      '>=1.5,!=1.7.1,<2', '1.7*,>=1.7.1', '1.7.1+g*']:
+            m = VersionSpec(vspec)
+            for version in versions:
+                self.assertEqual(m.intervals.contains(version), m.match(version))
+
+        m = VersionSpec('1.7*')
+        for version, res in [('1.7', True), ('1.7.dev1', True), ('1.7a', True),
+                             ('1.7.post1', True), ('1.70', False), ('1.6.9', False),
+                             ('1.8a', False)]:
+            self.assertEqual(m.match(version), res)
+
+    def test_intervals(self):
+        self.assertEqual(VersionSpec('>=1.7,<2|1.5.*').intervals,
+                         VersionSpec('1.5*|>=1.7,<2').intervals)
+        self.assertEqual(VersionSpec('1.7*|1.7a*').intervals, VersionSpec('1.7*').intervals)
+        self.assertEqual(VersionSpec('>=1.7|<1.7').intervals, VersionSpec('*').intervals)
+        self.assertEqual(len(VersionSpec('!=1.7').intervals.intervals), 2)
+        self.assertEqual(len(VersionSpec('>=1.5,<=1.6|>=1.6,<1.8').intervals.intervals), 1)
+        self.assertTrue((VersionSpec('>1.7').intervals & VersionSpec('<1.7').intervals).is_empty())
+        self.assertTrue((VersionSpec('>1.7').intervals & VersionSpec('<=1.7').intervals).is_empty())
+        self.assertFalse((VersionSpec('>=1.7').intervals & VersionSpec('<=1.7').intervals).is_empty())
+        self.assertIsNone(VersionSpec('^1.7.*$').intervals)
+        self.assertIsNone(VersionSpec('1.*.1').intervals)
+
+    def test_intersects(self):
+        for spec1, spec2, res in [
+            ('1.5*', '>=1.6', False), ('1.5*', '>=1.5.3', True), ('1.5*', '1.6*', False),
+            ('1.7*', '1.7a*', True), ('1.7.1*', '1.7a*', False), ('!=1.7', '==1.7', False),
+            ('>=1.7,<2', '1.5*|2.1*', False), ('>=1.7,<2', '1.5*|1.9*', True),
+            ('1.7', '1.7*', True), ('1.7', '1.8*', False), ('^1.*$', '2', True),
+        ]:
+            self.assertEqual(VersionSpec(spec1).intersects(spec2), res)
+            self.assertEqual(VersionSpec(spec2).intersects(spec1), res)
+
+    def test_and_or(self):
+        m = VersionSpec('>=1.7') & '<1.8'
+        self.assertEqual(str(m), '>=1.7,<1.8')
+        self.assertTrue(m.match('1.7.1'))
+        self.assertFalse(m.match('1.8'))
+        m = VersionSpec('1.5*') | '1.7*'
+        self.assertEqual(str(m), '1.5*|1.7*')
+        self.assertTrue(m.match('1.7.1'))
+        self.assertFalse(m.match('1.6'))